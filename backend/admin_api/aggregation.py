@@ -0,0 +1,151 @@
+"""
+Cross-tenant aggregation.
+
+Instead of switching search_path tenant by tenant, these helpers build a
+single UNION ALL statement over the tenants' schema-qualified tables and
+run it from the public schema. Tenants are processed in chunks of
+UNION_CHUNK_SIZE schemas to keep statements a reasonable size.
+"""
+import heapq
+from decimal import Decimal
+
+from django.db import connection
+from django_tenants.utils import get_public_schema_name
+
+from customers.models import Client
+from store.models import Item
+from .hll import HyperLogLog
+
+UNION_CHUNK_SIZE = 200
+
+# Order statuses counted as revenue (as in the original per-tenant queries)
+REVENUE_STATUSES = ('completed', 'paid')
+
+
+def tenant_schemas(table='orders_order', tenants=None):
+    """
+    Map schema name -> Client for every non-public tenant whose schema has
+    `table` (tenants that were never migrated are skipped).
+    """
+    if tenants is None:
+        tenants = Client.objects.exclude(schema_name=get_public_schema_name())
+    tenants = {tenant.schema_name: tenant for tenant in tenants}
+    if not tenants:
+        return {}
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT table_schema FROM information_schema.tables "
+            "WHERE table_name = %s AND table_schema = ANY(%s)",
+            [table, list(tenants)]
+        )
+        present = {row[0] for row in cursor.fetchall()}
+    return {schema: tenant for schema, tenant in tenants.items() if schema in present}
+
+
+def _chunks(schemas):
+    schemas = list(schemas)
+    for i in range(0, len(schemas), UNION_CHUNK_SIZE):
+        yield schemas[i:i + UNION_CHUNK_SIZE]
+
+
+def union_all(schemas, select_sql, params=()):
+    """
+    Yield (sql, params) pairs, one per chunk of schemas: `select_sql` once
+    per schema, joined with UNION ALL, with `params` repeated to match.
+    In `select_sql`, {schema} is the quoted schema name (write
+    {schema}.orders_order) and {schema_literal} is safe inside a string
+    literal, for tagging rows with their schema.
+    """
+    for chunk in _chunks(schemas):
+        parts = []
+        chunk_params = []
+        for schema in chunk:
+            parts.append(select_sql.format(
+                schema=connection.ops.quote_name(schema),
+                schema_literal=schema.replace("'", "''"),
+            ))
+            chunk_params.extend(params)
+        yield '\nUNION ALL\n'.join(parts), chunk_params
+
+
+def order_totals(schemas, start, end):
+    """Orders created in [start, end) and their revenue, summed over all schemas"""
+    select_sql = (
+        'SELECT count(*) AS orders, '
+        'coalesce(sum(total_amount) FILTER (WHERE status = ANY(%s)), 0) AS revenue '
+        'FROM {schema}.orders_order WHERE created_at >= %s AND created_at < %s'
+    )
+    orders, revenue = 0, Decimal('0')
+    with connection.cursor() as cursor:
+        for sql, params in union_all(schemas, select_sql, [list(REVENUE_STATUSES), start, end]):
+            cursor.execute(f'SELECT coalesce(sum(orders), 0), coalesce(sum(revenue), 0) FROM ({sql}) t',
+                           params)
+            chunk_orders, chunk_revenue = cursor.fetchone()
+            orders += chunk_orders
+            revenue += chunk_revenue
+    return orders, revenue
+
+
+def distinct_customers(schemas, since, precision=10):
+    """
+    Approximate number of distinct customer phones with orders since
+    `since`, across all schemas.
+
+    The HyperLogLog registers are computed in the database (bucket from the
+    low bits of hashtext(), rank from the leading zeros of the rest), so at
+    most 2**precision rows come back no matter how many customers there are.
+    """
+    sketch = HyperLogLog(precision)
+    width = HyperLogLog.HASH_BITS - precision
+    select_sql = (
+        "SELECT hashtext(customer_phone)::bigint & 4294967295 AS h "
+        "FROM {schema}.orders_order WHERE created_at >= %s AND customer_phone <> ''"
+    )
+    with connection.cursor() as cursor:
+        for sql, params in union_all(schemas, select_sql, [since]):
+            cursor.execute(
+                f"SELECT h & {sketch.m - 1} AS bucket, "
+                f"max({width + 1} - length(ltrim(((h >> {precision})::int)::bit({width})::text, '0'))) "
+                f"FROM ({sql}) t GROUP BY 1",
+                params
+            )
+            for bucket, rank in cursor.fetchall():
+                sketch.update(bucket, rank)
+    return sketch
+
+
+def popular_items(schemas, since, limit=20, statuses=REVENUE_STATUSES):
+    """
+    The `limit` best-selling (tenant, item) pairs by quantity since `since`.
+
+    Each schema groups its own order items and returns only its top
+    `limit` rows (the overall top K is always a subset of the per-tenant
+    top Ks), and the per-tenant lists are merged with a bounded heap, so
+    at most limit * tenants rows ever leave the database.
+    """
+    select_sql = (
+        "(SELECT '{schema_literal}' AS schema_name, i.item_id, "
+        "sum(i.quantity) AS quantity, sum(i.quantity * i.unit_price) AS revenue "
+        "FROM {schema}.orders_orderitem i JOIN {schema}.orders_order o ON o.id = i.order_id "
+        "WHERE o.created_at >= %s AND o.status = ANY(%s) "
+        "GROUP BY i.item_id ORDER BY quantity DESC, i.item_id LIMIT %s)"
+    )
+    top = []
+    with connection.cursor() as cursor:
+        for sql, params in union_all(schemas, select_sql, [since, list(statuses), limit]):
+            cursor.execute(sql, params)
+            top = heapq.nlargest(limit, top + cursor.fetchall(), key=lambda row: row[2])
+
+    names = dict(Item.objects.filter(pk__in={row[1] for row in top}).values_list('id', 'name'))
+    return [
+        {
+            'item_id': item_id,
+            'name': names.get(item_id, ''),
+            'tenant_id': str(schemas[schema_name].id),
+            'tenant_name': schemas[schema_name].name,
+            'quantity': quantity,
+            'revenue': revenue,
+        }
+        for schema_name, item_id, quantity, revenue in top
+    ]
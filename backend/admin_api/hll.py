@@ -0,0 +1,57 @@
+import hashlib
+import math
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count sketch over 32-bit hashes.
+
+    With the default precision (2**10 registers) the standard error is about
+    3%, in 1 KB of state regardless of how many values were added. Registers
+    can also be filled directly from (bucket, rank) pairs computed in SQL,
+    see admin_api.aggregation.
+    """
+
+    HASH_BITS = 32
+
+    def __init__(self, precision=10):
+        if not 4 <= precision <= 16:
+            raise ValueError('precision must be between 4 and 16')
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    @property
+    def max_rank(self):
+        return self.HASH_BITS - self.precision + 1
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=4).digest()
+        hashed = int.from_bytes(digest, 'big')
+        bucket = hashed & (self.m - 1)
+        remaining = hashed >> self.precision
+        self.update(bucket, self.max_rank - remaining.bit_length())
+
+    def update(self, bucket, rank):
+        if rank > self.registers[bucket]:
+            self.registers[bucket] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches with different precision')
+        for bucket, rank in enumerate(other.registers):
+            self.update(bucket, rank)
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        elif estimate > (1 << self.HASH_BITS) / 30:
+            # Large-range correction for 32-bit hashes
+            estimate = -(1 << self.HASH_BITS) * math.log(1 - estimate / (1 << self.HASH_BITS))
+        return int(round(estimate))
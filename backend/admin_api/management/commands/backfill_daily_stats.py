@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from admin_api.aggregation import tenant_schemas
+from admin_api.rollups import rebuild_daily_stats, rebuild_item_stats
+from customers.models import Client
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-tenant daily rollups (TenantDailyStats, TenantItemDailyStats) from tenant order tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only rebuild the last N days (default: all history)')
+        parser.add_argument('--schema', action='append', dest='schemas',
+                            help='Tenant schema to rebuild (repeatable; default: all tenants)')
+
+    def handle(self, *args, **options):
+        if options['days']:
+            since = timezone.localtime() - timedelta(days=options['days'])
+            since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+        else:
+            since = timezone.make_aware(datetime(2000, 1, 1))
+
+        tenants = None
+        if options['schemas']:
+            tenants = Client.objects.filter(schema_name__in=options['schemas'])
+            if not tenants.exists():
+                raise CommandError('No tenants match the given --schema values')
+
+        schemas = tenant_schemas(tenants=tenants)
+        self.stdout.write(f"Rebuilding daily stats for {len(schemas)} tenant(s) since {since.date()}...")
+        rows = rebuild_daily_stats(schemas, since)
+        item_rows = rebuild_item_stats(schemas, since)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} daily stats rows and {item_rows} item stats rows'))
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_customer'),
+        ('customers', '0002_customer_membership_loyaltytransaction_and_more'),
+        ('admin_api', '0001_tenant_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantItemDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.item')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_daily_stats', to='customers.client')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date'], name='idx_item_daily_stats_date')],
+                'unique_together': {('tenant', 'date', 'item')},
+            },
+        ),
+    ]
@@ -1 +1,51 @@
-from django.db import models
\ No newline at end of file
+from django.db import models
+
+
+class TenantDailyStats(models.Model):
+    """
+    Per-tenant, per-day order rollup kept in the public schema.
+
+    Maintained incrementally as orders are created and completed (see
+    admin_api.rollups) and rebuilt with `manage.py backfill_daily_stats`.
+    Dates are order creation dates in settings.TIME_ZONE.
+    """
+    tenant = models.ForeignKey('customers.Client', on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    orders_count = models.IntegerField(default=0)
+    completed_orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    items_quantity = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['tenant', 'date']
+        indexes = [
+            models.Index(fields=['date'], name='idx_daily_stats_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.tenant_id} {self.date}: {self.revenue}"
+
+
+class TenantItemDailyStats(models.Model):
+    """
+    Per-tenant, per-day, per-item sales of completed orders, maintained
+    alongside TenantDailyStats. Ranking popular items is a GROUP BY over
+    this table instead of a scan of every tenant's order items.
+    """
+    tenant = models.ForeignKey('customers.Client', on_delete=models.CASCADE, related_name='item_daily_stats')
+    date = models.DateField()
+    item = models.ForeignKey('store.Item', on_delete=models.CASCADE, related_name='+')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['tenant', 'date', 'item']
+        indexes = [
+            models.Index(fields=['date'], name='idx_item_daily_stats_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.tenant_id} {self.date} item {self.item_id}: {self.quantity}"
@@ -0,0 +1,267 @@
+"""
+Incremental maintenance of the public-schema rollup tables.
+
+Order changes in a tenant schema are folded into TenantDailyStats and
+TenantItemDailyStats with INSERT ... ON CONFLICT DO UPDATE, so analytics
+never has to scan tenant order tables.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django_tenants.utils import get_public_schema_name
+
+from .models import TenantDailyStats, TenantItemDailyStats
+
+COMPLETED_STATUS = 'completed'
+
+
+def _public_table(model):
+    return '{}.{}'.format(
+        connection.ops.quote_name(get_public_schema_name()),
+        connection.ops.quote_name(model._meta.db_table),
+    )
+
+
+def add_daily_stats(tenant_id, date, orders=0, completed=0, revenue=Decimal('0'), quantity=0):
+    """Add deltas to the (tenant, date) rollup row, creating it if needed"""
+    add_daily_stats_rows(tenant_id, [(date, orders, completed, revenue, quantity)])
+
+
+def add_daily_stats_rows(tenant_id, rows):
+    """
+    Add (date, orders, completed, revenue, quantity) deltas to the tenant's
+    rollup rows in one statement; dates must be distinct
+    """
+    if not rows:
+        return
+    table = _public_table(TenantDailyStats)
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s, now())'] * len(rows))
+    params = []
+    for date, orders, completed, revenue, quantity in rows:
+        params.extend([tenant_id, date, orders, completed, revenue, quantity])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} AS s '
+            '(tenant_id, date, orders_count, completed_orders, revenue, items_quantity, updated_at) '
+            f'VALUES {values} '
+            'ON CONFLICT (tenant_id, date) DO UPDATE SET '
+            'orders_count = s.orders_count + EXCLUDED.orders_count, '
+            'completed_orders = s.completed_orders + EXCLUDED.completed_orders, '
+            'revenue = s.revenue + EXCLUDED.revenue, '
+            'items_quantity = s.items_quantity + EXCLUDED.items_quantity, '
+            'updated_at = now()',
+            params
+        )
+
+
+def add_item_stats(tenant_id, date, items):
+    """Add (item_id, quantity, revenue) deltas to the item rollup in one statement"""
+    add_item_stats_rows(tenant_id, [(date, *item) for item in items])
+
+
+def add_item_stats_rows(tenant_id, rows):
+    """Add (date, item_id, quantity, revenue) deltas in one statement; keys must be distinct"""
+    if not rows:
+        return
+    table = _public_table(TenantItemDailyStats)
+    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))
+    params = []
+    for date, item_id, quantity, revenue in rows:
+        params.extend([tenant_id, date, item_id, quantity, revenue])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} AS s (tenant_id, date, item_id, quantity, revenue) '
+            f'VALUES {values} '
+            'ON CONFLICT (tenant_id, date, item_id) DO UPDATE SET '
+            'quantity = s.quantity + EXCLUDED.quantity, '
+            'revenue = s.revenue + EXCLUDED.revenue',
+            params
+        )
+
+
+def record_order_change(tenant, order, old_status, new_status):
+    """
+    Fold one order change into the rollup. `old_status` is None for a new
+    order and `new_status` is None for a deleted one.
+    """
+    record_order_changes(tenant, [(order, old_status, new_status)])
+
+
+def record_order_changes(tenant, changes):
+    """
+    Fold (order, old_status, new_status) changes into the rollup with at
+    most three statements: one items aggregate over the orders entering or
+    leaving `completed`, and one upsert each for the daily and item rows.
+    """
+    from orders.models import OrderItem
+
+    daily = {}
+    signs = {}
+    for order, old_status, new_status in changes:
+        sign = 0
+        if new_status == COMPLETED_STATUS and old_status != COMPLETED_STATUS:
+            sign = 1
+        elif old_status == COMPLETED_STATUS and new_status != COMPLETED_STATUS:
+            sign = -1
+
+        orders = 1 if old_status is None else -1 if new_status is None else 0
+        if not orders and not sign:
+            continue
+
+        date = timezone.localtime(order.created_at).date()
+        row = daily.setdefault(date, [0, 0, Decimal('0'), 0])
+        row[0] += orders
+        row[1] += sign
+        row[2] += sign * Decimal(str(order.total_amount))
+        if sign:
+            signs[order.pk] = (sign, date)
+
+    items = {}
+    if signs:
+        lines = (
+            OrderItem.objects.filter(order_id__in=list(signs)).values_list('order_id', 'item_id')
+            .annotate(total_quantity=Sum('quantity'), total_revenue=Sum(F('quantity') * F('unit_price')))
+            .order_by()
+        )
+        for order_id, item_id, quantity, revenue in lines:
+            sign, date = signs[order_id]
+            row = items.setdefault((date, item_id), [0, Decimal('0')])
+            row[0] += sign * quantity
+            row[1] += sign * revenue
+            daily[date][3] += sign * quantity
+
+    add_daily_stats_rows(tenant.pk, [(date, *row) for date, row in sorted(daily.items())])
+    add_item_stats_rows(tenant.pk, [(date, item_id, *row) for (date, item_id), row in sorted(items.items())])
+
+
+def tenant_totals(tenant_ids):
+    """
+    {tenant_id: (orders, completed sales)} over each tenant's whole
+    history, summed from its daily rollup rows in one query.
+    """
+    rows = (
+        TenantDailyStats.objects.filter(tenant_id__in=tenant_ids)
+        .values_list('tenant_id')
+        .annotate(orders=Sum('orders_count'), sales=Sum('revenue'))
+        .order_by()
+    )
+    return {tenant_id: (orders, sales) for tenant_id, orders, sales in rows}
+
+
+def top_items(since_date, limit=20):
+    """
+    The `limit` best-selling (tenant, item) pairs since `since_date`, from
+    TenantItemDailyStats in one query. Same shape as
+    admin_api.aggregation.popular_items.
+    """
+    rows = (
+        TenantItemDailyStats.objects.filter(date__gte=since_date)
+        .values('tenant_id', 'tenant__name', 'item_id', 'item__name')
+        .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+        .filter(total_quantity__gt=0)
+        .order_by('-total_quantity', 'item_id')[:limit]
+    )
+    return [
+        {
+            'item_id': row['item_id'],
+            'name': row['item__name'],
+            'tenant_id': str(row['tenant_id']),
+            'tenant_name': row['tenant__name'],
+            'quantity': row['total_quantity'],
+            'revenue': row['total_revenue'],
+        }
+        for row in rows
+    ]
+
+
+def current_tenant():
+    """The tenant the connection is set to, or None for public/no tenant"""
+    tenant = getattr(connection, 'tenant', None)
+    if tenant is None or getattr(tenant, 'schema_name', None) == get_public_schema_name():
+        return None
+    return tenant
+
+
+ROLLUP_SELECT = (
+    "SELECT '{schema_literal}' AS schema_name, "
+    "(o.created_at AT TIME ZONE %s)::date AS day, "
+    "count(*) AS orders, "
+    "count(*) FILTER (WHERE o.status = 'completed') AS completed, "
+    "coalesce(sum(o.total_amount) FILTER (WHERE o.status = 'completed'), 0) AS revenue, "
+    "coalesce(sum(q.quantity) FILTER (WHERE o.status = 'completed'), 0) AS quantity "
+    "FROM {schema}.orders_order o "
+    "LEFT JOIN (SELECT order_id, sum(quantity) AS quantity FROM {schema}.orders_orderitem "
+    "GROUP BY order_id) q ON q.order_id = o.id "
+    "WHERE o.created_at >= %s "
+    "GROUP BY 2"
+)
+
+
+def rebuild_daily_stats(schemas, since):
+    """
+    Recompute TenantDailyStats rows from `since` for the given
+    {schema_name: tenant} mapping. Returns the number of rows written.
+    """
+    from .aggregation import union_all
+
+    tz_name = timezone.get_current_timezone_name()
+    rows = []
+    with connection.cursor() as cursor:
+        for sql, params in union_all(schemas, ROLLUP_SELECT, [tz_name, since]):
+            cursor.execute(sql, params)
+            rows.extend(cursor.fetchall())
+
+    since_date = timezone.localtime(since).date()
+    with transaction.atomic():
+        TenantDailyStats.objects.filter(
+            tenant__in=list(schemas.values()), date__gte=since_date
+        ).delete()
+        TenantDailyStats.objects.bulk_create([
+            TenantDailyStats(
+                tenant=schemas[schema_name], date=day, orders_count=orders,
+                completed_orders=completed, revenue=revenue, items_quantity=quantity,
+            )
+            for schema_name, day, orders, completed, revenue, quantity in rows
+        ])
+    return len(rows)
+
+
+ITEM_ROLLUP_SELECT = (
+    "SELECT '{schema_literal}' AS schema_name, "
+    "(o.created_at AT TIME ZONE %s)::date AS day, "
+    "i.item_id, sum(i.quantity) AS quantity, sum(i.quantity * i.unit_price) AS revenue "
+    "FROM {schema}.orders_orderitem i JOIN {schema}.orders_order o ON o.id = i.order_id "
+    "WHERE o.created_at >= %s AND o.status = 'completed' "
+    "GROUP BY 2, 3"
+)
+
+
+def rebuild_item_stats(schemas, since):
+    """
+    Recompute TenantItemDailyStats rows from `since` for the given
+    {schema_name: tenant} mapping. Returns the number of rows written.
+    """
+    from .aggregation import union_all
+
+    tz_name = timezone.get_current_timezone_name()
+    rows = []
+    with connection.cursor() as cursor:
+        for sql, params in union_all(schemas, ITEM_ROLLUP_SELECT, [tz_name, since]):
+            cursor.execute(sql, params)
+            rows.extend(cursor.fetchall())
+
+    since_date = timezone.localtime(since).date()
+    with transaction.atomic():
+        TenantItemDailyStats.objects.filter(
+            tenant__in=list(schemas.values()), date__gte=since_date
+        ).delete()
+        TenantItemDailyStats.objects.bulk_create([
+            TenantItemDailyStats(
+                tenant=schemas[schema_name], date=day, item_id=item_id,
+                quantity=quantity, revenue=revenue,
+            )
+            for schema_name, day, item_id, quantity, revenue in rows
+        ])
+    return len(rows)
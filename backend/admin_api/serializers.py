@@ -12,8 +12,9 @@ class TenantStatsSerializer(serializers.Serializer):
 
 
 class OrderSerializer(serializers.Serializer):
-    id = serializers.UUIDField()
+    id = serializers.CharField()
     order_number = serializers.CharField()
+    customer_name = serializers.CharField()
     user = serializers.EmailField(allow_null=True)
     status = serializers.CharField()
     total_amount = serializers.FloatField()
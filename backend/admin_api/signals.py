@@ -0,0 +1,18 @@
+from django.dispatch import receiver
+
+from orders.signals import order_status_changed, order_statuses_changed
+from .rollups import current_tenant, record_order_change, record_order_changes
+
+
+@receiver(order_status_changed)
+def update_daily_stats(sender, order, old_status, new_status, **kwargs):
+    tenant = current_tenant()
+    if tenant is not None:
+        record_order_change(tenant, order, old_status, new_status)
+
+
+@receiver(order_statuses_changed)
+def update_daily_stats_batch(sender, changes, **kwargs):
+    tenant = current_tenant()
+    if tenant is not None:
+        record_order_changes(tenant, changes)
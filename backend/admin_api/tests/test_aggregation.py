@@ -0,0 +1,182 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from admin_api.aggregation import distinct_customers, order_totals, popular_items, tenant_schemas
+from admin_api.hll import HyperLogLog
+from customers.models import Client
+from store.models import Category, Item
+
+
+def create_tenant_tables(schema):
+    """Create a minimal orders schema for a tenant inside the test transaction"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+        cursor.execute(f'''
+            CREATE TABLE "{schema}".orders_order (
+                id bigserial PRIMARY KEY,
+                customer_name varchar(200) NOT NULL DEFAULT '',
+                customer_phone varchar(20) NOT NULL DEFAULT '',
+                total_amount numeric(10, 2) NOT NULL,
+                status varchar(20) NOT NULL,
+                created_at timestamptz NOT NULL,
+                updated_at timestamptz NOT NULL DEFAULT now()
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TABLE "{schema}".orders_orderitem (
+                id bigserial PRIMARY KEY,
+                order_id bigint NOT NULL REFERENCES "{schema}".orders_order (id),
+                item_id bigint NOT NULL,
+                quantity integer NOT NULL,
+                unit_price numeric(10, 2) NOT NULL
+            )
+        ''')
+
+
+def insert_order(schema, phone, amount, status, created_at, lines=()):
+    """Insert an order and its (item_id, quantity, unit_price) lines; returns the order id"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO "{schema}".orders_order (customer_phone, total_amount, status, created_at) '
+            'VALUES (%s, %s, %s, %s) RETURNING id',
+            [phone, amount, status, created_at]
+        )
+        order_id = cursor.fetchone()[0]
+        for item_id, quantity, unit_price in lines:
+            cursor.execute(
+                f'INSERT INTO "{schema}".orders_orderitem (order_id, item_id, quantity, unit_price) '
+                'VALUES (%s, %s, %s, %s)',
+                [order_id, item_id, quantity, unit_price]
+            )
+    return order_id
+
+
+class HyperLogLogTests(SimpleTestCase):
+    """Test cases for the HyperLogLog sketch"""
+
+    def test_empty_sketch(self):
+        """Test an empty sketch counts zero"""
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_duplicates_not_counted(self):
+        """Test repeated values are only counted once"""
+        sketch = HyperLogLog()
+        for _ in range(3):
+            for i in range(100):
+                sketch.add(f'08{i:08d}')
+
+        self.assertAlmostEqual(sketch.count(), 100, delta=5)
+
+    def test_large_cardinality_within_error(self):
+        """Test the estimate stays within a few standard errors"""
+        sketch = HyperLogLog()
+        for i in range(50000):
+            sketch.add(f'08{i:08d}')
+
+        self.assertAlmostEqual(sketch.count(), 50000, delta=50000 * 0.1)
+
+    def test_merge(self):
+        """Test merging two sketches estimates the union"""
+        first, second = HyperLogLog(), HyperLogLog()
+        for i in range(1000):
+            first.add(i)
+            second.add(i + 500)
+        first.merge(second)
+
+        self.assertAlmostEqual(first.count(), 1500, delta=1500 * 0.1)
+
+
+class CrossTenantAggregationTests(TestCase):
+    """Test cases for UNION ALL aggregation across tenant schemas"""
+
+    def setUp(self):
+        now = timezone.now()
+        self.start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.end = self.start + timedelta(days=1)
+        yesterday = self.start - timedelta(hours=1)
+
+        for schema in ['agg_a', 'agg_b']:
+            Client.objects.create(schema_name=schema, name=schema.upper())
+            create_tenant_tables(schema)
+        # A tenant whose schema was never migrated is skipped
+        Client.objects.create(schema_name='agg_missing', name='Missing')
+
+        insert_order('agg_a', '0811111111', '100.00', 'completed', self.start)
+        insert_order('agg_a', '0822222222', '50.00', 'pending', self.start)
+        insert_order('agg_a', '0811111111', '70.00', 'completed', yesterday)
+        insert_order('agg_b', '0811111111', '30.00', 'completed', self.start)
+        insert_order('agg_b', '0833333333', '20.00', 'cancelled', self.start)
+
+    def test_tenant_schemas_skips_unmigrated(self):
+        """Test only schemas with an orders table are returned"""
+        self.assertEqual(sorted(tenant_schemas()), ['agg_a', 'agg_b'])
+
+    def test_order_totals_single_query(self):
+        """Test today's orders and revenue come from one statement"""
+        schemas = tenant_schemas()
+        with self.assertNumQueries(1):
+            orders, revenue = order_totals(schemas, self.start, self.end)
+
+        self.assertEqual(orders, 4)
+        self.assertEqual(revenue, Decimal('130.00'))
+
+    def test_distinct_customers(self):
+        """Test phones are counted once across tenants"""
+        schemas = tenant_schemas()
+        with self.assertNumQueries(1):
+            sketch = distinct_customers(schemas, self.start - timedelta(days=30))
+
+        self.assertEqual(sketch.count(), 3)
+
+    def test_no_tenants(self):
+        """Test aggregation over no schemas runs no queries"""
+        with self.assertNumQueries(0):
+            self.assertEqual(order_totals({}, self.start, self.end), (0, Decimal('0')))
+            self.assertEqual(distinct_customers({}, self.start).count(), 0)
+
+
+class PopularItemsTests(TestCase):
+    """Test cases for the live top-K popular items ranking"""
+
+    def setUp(self):
+        now = timezone.now()
+        self.since = now - timedelta(days=30)
+        category = Category.objects.create(name='Mains', slug='mains')
+        self.noodles = Item.objects.create(category=category, name='Noodles', price=Decimal('50.00'))
+        self.rice = Item.objects.create(category=category, name='Rice', price=Decimal('40.00'))
+        self.soup = Item.objects.create(category=category, name='Soup', price=Decimal('30.00'))
+
+        for schema in ['pop_a', 'pop_b']:
+            Client.objects.create(schema_name=schema, name=schema.upper())
+            create_tenant_tables(schema)
+
+        insert_order('pop_a', '081', '350.00', 'completed', now,
+                     lines=[(self.noodles.pk, 5, '50.00'), (self.rice.pk, 2, '40.00')])
+        insert_order('pop_a', '082', '150.00', 'completed', now, lines=[(self.noodles.pk, 3, '50.00')])
+        insert_order('pop_b', '083', '120.00', 'completed', now, lines=[(self.soup.pk, 4, '30.00')])
+        # Not counted: wrong status, and too old
+        insert_order('pop_b', '084', '300.00', 'pending', now, lines=[(self.rice.pk, 10, '30.00')])
+        insert_order('pop_b', '085', '300.00', 'completed', now - timedelta(days=60),
+                     lines=[(self.rice.pk, 10, '30.00')])
+
+    def test_ranking_across_tenants(self):
+        """Test items are grouped per tenant and ranked by quantity"""
+        schemas = tenant_schemas()
+        with self.assertNumQueries(2):
+            items = popular_items(schemas, self.since)
+
+        self.assertEqual(
+            [(item['tenant_name'], item['name'], item['quantity']) for item in items],
+            [('POP_A', 'Noodles', 8), ('POP_B', 'Soup', 4), ('POP_A', 'Rice', 2)]
+        )
+        self.assertEqual(items[0]['revenue'], Decimal('400.00'))
+
+    def test_limit(self):
+        """Test only the top `limit` rows are returned"""
+        items = popular_items(tenant_schemas(), self.since, limit=1)
+
+        self.assertEqual([item['name'] for item in items], ['Noodles'])
@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from admin_api.views import db_pool_stats, order_event_stats
+from orders.events import order_events
+from orderup.postgresql_backend.base import DatabaseWrapper, pool_metrics
+
+
+@override_settings(TENANT_LIMIT_SET_CALLS=True)
+class PersistentConnectionTests(SimpleTestCase):
+    """Test cases for the tenant backend on a kept-open Postgres connection"""
+
+    def setUp(self):
+        pool_metrics.reset()
+        self.db = DatabaseWrapper({
+            **connection.settings_dict,
+            'ENGINE': 'orderup.postgresql_backend',
+            'CONN_MAX_AGE': 60,
+            'CONN_HEALTH_CHECKS': True,
+        }, alias='pool_test')
+
+    def tearDown(self):
+        self.db.close()
+
+    def _search_path(self):
+        with self.db.cursor() as cursor:
+            cursor.execute('SHOW search_path')
+            return cursor.fetchone()[0]
+
+    def test_same_schema_skips_set(self):
+        """Test switching to the schema the session already has issues no SET"""
+        self.db.set_schema('pool_a')
+        self.assertIn('pool_a', self._search_path())
+        # A new request on the kept connection, for the same tenant
+        self.db.set_schema('pool_a')
+        self.assertIn('pool_a', self._search_path())
+
+        metrics = pool_metrics.snapshot()
+        self.assertEqual(metrics['search_path_sets'], 1)
+        self.assertEqual(metrics['connections_opened'], 1)
+
+    def test_schema_change_sets_path(self):
+        """Test a different tenant still gets its search_path"""
+        self.db.set_schema('pool_a')
+        self._search_path()
+        self.db.set_schema('pool_b')
+
+        self.assertIn('pool_b', self._search_path())
+        self.assertEqual(pool_metrics.snapshot()['search_path_sets'], 2)
+
+    def test_rollback_forgets_path(self):
+        """Test a rollback, which may undo the SET, forces the next one"""
+        self.db.set_schema('pool_a')
+        self.db.set_autocommit(False)
+        self._search_path()
+        self.db.rollback()
+        self.db.set_autocommit(True)
+        self.db.set_schema('pool_a')
+
+        self.assertIn('pool_a', self._search_path())
+        self.assertEqual(pool_metrics.snapshot()['search_path_sets'], 2)
+
+    def test_health_check(self):
+        """Test a dead kept connection fails its health check and is replaced"""
+        self._search_path()
+        self.assertTrue(self.db.is_usable())
+        self.db.connection.close()
+
+        self.db.close_if_unusable_or_obsolete()
+        self.db.close_if_health_check_failed()
+        self.assertIn('public', self._search_path())
+
+        metrics = pool_metrics.snapshot()
+        self.assertEqual(metrics['health_check_failures'], 1)
+        self.assertEqual(metrics['connections_opened'], 2)
+        self.assertEqual(metrics['open_connections'], 1)
+
+
+class DbPoolStatsViewTests(TestCase):
+    """Test cases for the connection metrics endpoint"""
+
+    def test_fields(self):
+        """Test the endpoint reports the counters and connection settings"""
+        request = APIRequestFactory().get('/api/admin/stats/db-pool/')
+        force_authenticate(request, user=get_user_model().objects.create_user(username='admin', is_staff=True))
+        response = db_pool_stats(request)
+
+        self.assertEqual(response.status_code, 200)
+        for field in pool_metrics.FIELDS + ('open_connections', 'conn_max_age', 'health_checks_enabled'):
+            self.assertIn(field, response.data)
+
+    def test_requires_admin(self):
+        """Test anonymous and non-staff users are refused"""
+        response = db_pool_stats(APIRequestFactory().get('/api/admin/stats/db-pool/'))
+        self.assertIn(response.status_code, (401, 403))
+
+        request = APIRequestFactory().get('/api/admin/stats/db-pool/')
+        force_authenticate(request, user=get_user_model().objects.create_user(username='customer'))
+        self.assertEqual(db_pool_stats(request).status_code, 403)
+
+
+class OrderEventStatsViewTests(TestCase):
+    """Test cases for the order event dispatcher metrics endpoint"""
+
+    def test_fields(self):
+        """Test the endpoint reports the dispatcher's counters"""
+        request = APIRequestFactory().get('/api/admin/stats/order-events/')
+        force_authenticate(request, user=get_user_model().objects.create_user(username='admin', is_staff=True))
+        response = order_event_stats(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), set(order_events.metrics()))
+        for field in ('queue_depth', 'dropped', 'failed', 'publish_latency_ms_avg'):
+            self.assertIn(field, response.data)
+
+    def test_requires_admin(self):
+        """Test anonymous and non-staff users are refused"""
+        response = order_event_stats(APIRequestFactory().get('/api/admin/stats/order-events/'))
+        self.assertIn(response.status_code, (401, 403))
+
+        request = APIRequestFactory().get('/api/admin/stats/order-events/')
+        force_authenticate(request, user=get_user_model().objects.create_user(username='customer'))
+        self.assertEqual(order_event_stats(request).status_code, 403)
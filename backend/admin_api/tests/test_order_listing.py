@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from admin_api.order_listing import decode_cursor, keyset_page, stream_orders
+from admin_api.views import tenant_orders
+from customers.models import Client
+from orders.models import Order, OrderItem
+from store.models import Category, Item
+
+
+class OrderListingTests(TestCase):
+    """Test cases for keyset pagination and streaming of tenant orders"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Mains', slug='mains')
+        item = Item.objects.create(category=category, name='Pad Thai', price=Decimal('60.00'))
+        now = timezone.now()
+        self.orders = []
+        for i in range(7):
+            order = Order.objects.create(customer_name=f'Guest {i}', total_amount=Decimal('60.00'))
+            OrderItem.objects.create(order=order, item=item, quantity=1, unit_price=Decimal('60.00'))
+            if i % 2:
+                OrderItem.objects.create(order=order, item=item, quantity=2, unit_price=Decimal('60.00'))
+            self.orders.append(order)
+        # Pairs of orders share a timestamp so the id tiebreaker matters
+        for i, order in enumerate(self.orders):
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(minutes=i // 2))
+
+    def test_pages_cover_all_orders_once(self):
+        """Test following next_cursor visits every order once, newest first"""
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page, cursor = keyset_page(Order.objects.all(), cursor, limit=3)
+            seen.extend(order['id'] for order in page)
+            if cursor is None:
+                break
+
+        expected = Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, [str(pk) for pk in expected])
+
+    def test_item_counts_annotated(self):
+        """Test each row carries its item count and the corrected fields"""
+        page, _ = keyset_page(Order.objects.filter(pk=self.orders[1].pk))
+
+        self.assertEqual(page[0]['items_count'], 2)
+        self.assertEqual(page[0]['order_number'], str(self.orders[1].pk))
+        self.assertIsNone(page[0]['user'])
+
+    def test_last_page_has_no_cursor(self):
+        """Test an exactly full last page doesn't advertise another page"""
+        page, cursor = keyset_page(Order.objects.all(), limit=7)
+
+        self.assertEqual(len(page), 7)
+        self.assertIsNone(cursor)
+
+    def test_invalid_cursor(self):
+        """Test malformed cursors are rejected"""
+        for cursor in ['not-base64!', 'bnVsbA==']:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_invalid_limit(self):
+        """Test a non-integer limit gets its own 400 rather than a date error"""
+        tenant = Client.objects.create(schema_name='listing_a', name='Listing A')
+        request = APIRequestFactory().get(f'/api/admin/tenants/{tenant.id}/orders/', {'limit': 'ten'})
+
+        response = tenant_orders(request, tenant_id=tenant.id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'limit must be an integer')
+
+    def test_stream_ndjson(self):
+        """Test NDJSON export yields one JSON object per line"""
+        lines = list(stream_orders(Order.objects.all(), 'ndjson'))
+
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(json.loads(lines[0])['customer_name'], 'Guest 1')
+
+    def test_stream_csv(self):
+        """Test CSV export yields a header then one row per order"""
+        rows = list(csv.reader(io.StringIO(''.join(stream_orders(Order.objects.all(), 'csv')))))
+
+        self.assertEqual(rows[0][:2], ['id', 'order_number'])
+        self.assertEqual(len(rows), 8)
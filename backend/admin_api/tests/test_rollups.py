@@ -0,0 +1,249 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from admin_api import views
+from admin_api.aggregation import tenant_schemas
+from admin_api.models import TenantDailyStats, TenantItemDailyStats
+from admin_api.rollups import (
+    rebuild_daily_stats, rebuild_item_stats, record_order_change, record_order_changes, tenant_totals, top_items,
+)
+from admin_api.tests.test_aggregation import create_tenant_tables, insert_order
+from customers.models import Client, Domain
+from orders.models import Order, OrderItem
+from store.models import Category, Item
+
+
+class DailyStatsRollupTests(TestCase):
+    """Test cases for incremental maintenance of TenantDailyStats"""
+
+    def setUp(self):
+        self.tenant = Client.objects.create(schema_name='rollup_a', name='Rollup A')
+        category = Category.objects.create(name='Mains', slug='mains')
+        self.item = Item.objects.create(category=category, name='Pad Thai', price=Decimal('60.00'))
+        self.today = timezone.localdate()
+
+    def _order(self, status='pending'):
+        order = Order.objects.create(customer_name='Guest', total_amount=Decimal('120.00'), status=status)
+        OrderItem.objects.create(order=order, item=self.item, quantity=2, unit_price=Decimal('60.00'))
+        return order
+
+    def _stats(self):
+        return TenantDailyStats.objects.get(tenant=self.tenant, date=self.today)
+
+    def test_new_and_completed_order(self):
+        """Test creation counts the order and completion adds revenue and quantity"""
+        order = self._order()
+        record_order_change(self.tenant, order, None, 'pending')
+        record_order_change(self.tenant, order, 'pending', 'completed')
+
+        stats = self._stats()
+        self.assertEqual(stats.orders_count, 1)
+        self.assertEqual(stats.completed_orders, 1)
+        self.assertEqual(stats.revenue, Decimal('120.00'))
+        self.assertEqual(stats.items_quantity, 2)
+        item_stats = TenantItemDailyStats.objects.get(tenant=self.tenant, date=self.today, item=self.item)
+        self.assertEqual(item_stats.quantity, 2)
+        self.assertEqual(item_stats.revenue, Decimal('120.00'))
+
+    def test_leaving_completed_reverses(self):
+        """Test moving a completed order back out of completed subtracts it"""
+        order = self._order()
+        record_order_change(self.tenant, order, None, 'completed')
+        record_order_change(self.tenant, order, 'completed', 'cancelled')
+
+        stats = self._stats()
+        self.assertEqual(stats.orders_count, 1)
+        self.assertEqual(stats.completed_orders, 0)
+        self.assertEqual(stats.revenue, Decimal('0.00'))
+        self.assertEqual(stats.items_quantity, 0)
+        self.assertEqual(top_items(self.today), [])
+
+    def test_batch_is_folded_into_fixed_statements(self):
+        """Test a batch of completions costs one items aggregate and two upserts"""
+        orders = [self._order() for _ in range(5)]
+
+        with self.assertNumQueries(3):
+            record_order_changes(self.tenant, [(order, 'pending', 'completed') for order in orders])
+
+        stats = self._stats()
+        self.assertEqual(stats.completed_orders, 5)
+        self.assertEqual(stats.revenue, Decimal('600.00'))
+        self.assertEqual(stats.items_quantity, 10)
+        item_stats = TenantItemDailyStats.objects.get(tenant=self.tenant, date=self.today, item=self.item)
+        self.assertEqual(item_stats.quantity, 10)
+
+    def test_non_revenue_transition_is_free(self):
+        """Test transitions that don't touch the rollup issue no queries"""
+        order = self._order()
+        with self.assertNumQueries(0):
+            record_order_change(self.tenant, order, 'pending', 'preparing')
+
+    def test_signal_uses_connection_tenant(self):
+        """Test order saves update the rollup for the active tenant"""
+        connection.tenant = self.tenant
+        try:
+            order = self._order()
+            order = Order.objects.get(pk=order.pk)
+            order.status = 'completed'
+            order.save()
+        finally:
+            del connection.tenant
+
+        stats = self._stats()
+        self.assertEqual(stats.orders_count, 1)
+        self.assertEqual(stats.revenue, Decimal('120.00'))
+
+
+class TopItemsTests(TestCase):
+    """Test cases for ranking popular items from the item rollup"""
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        category = Category.objects.create(name='Mains', slug='mains')
+        self.noodles = Item.objects.create(category=category, name='Noodles', price=Decimal('50.00'))
+        self.rice = Item.objects.create(category=category, name='Rice', price=Decimal('40.00'))
+        self.tenant_a = Client.objects.create(schema_name='top_a', name='Top A')
+        self.tenant_b = Client.objects.create(schema_name='top_b', name='Top B')
+
+        for days_ago in range(3):
+            date = self.today - timedelta(days=days_ago)
+            TenantItemDailyStats.objects.create(tenant=self.tenant_a, date=date, item=self.noodles,
+                                                quantity=2, revenue=Decimal('100.00'))
+            TenantItemDailyStats.objects.create(tenant=self.tenant_b, date=date, item=self.rice,
+                                                quantity=3, revenue=Decimal('120.00'))
+        TenantItemDailyStats.objects.create(tenant=self.tenant_a, date=self.today - timedelta(days=40),
+                                            item=self.rice, quantity=50, revenue=Decimal('2000.00'))
+
+    def test_top_items_single_query(self):
+        """Test the ranking is one GROUP BY over the rollup"""
+        with self.assertNumQueries(1):
+            items = top_items(self.today - timedelta(days=30))
+
+        self.assertEqual(
+            [(item['tenant_name'], item['name'], item['quantity']) for item in items],
+            [('Top B', 'Rice', 9), ('Top A', 'Noodles', 6)]
+        )
+        self.assertEqual(items[0]['revenue'], Decimal('360.00'))
+
+    def test_analytics_popular_items(self):
+        """Test the analytics view serves popular items from the rollup"""
+        request = APIRequestFactory().get('/api/admin/analytics/revenue/', {'days': 30})
+        response = views.analytics(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['popular_items'][0], {
+            'name': 'Rice',
+            'tenant_id': str(self.tenant_b.id),
+            'tenant_name': 'Top B',
+            'quantity': 9,
+            'revenue': 360.0,
+        })
+
+
+class TenantsListTests(TestCase):
+    """Test cases for tenants_list stats served from the daily rollup"""
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.tenants = []
+        for i in range(5):
+            tenant = Client.objects.create(schema_name=f'list_{i}', name=f'List {i}')
+            Domain.objects.create(tenant=tenant, domain=f'list{i}.localhost', is_primary=True)
+            for days_ago in range(i + 1):
+                TenantDailyStats.objects.create(
+                    tenant=tenant, date=self.today - timedelta(days=days_ago),
+                    orders_count=2, completed_orders=1, revenue=Decimal('10.00'),
+                )
+            self.tenants.append(tenant)
+
+    def _get(self, page_size):
+        request = APIRequestFactory().get('/api/admin/tenants/', {'page_size': page_size})
+        return views.tenants_list(request)
+
+    def test_tenant_totals(self):
+        """Test lifetime totals sum every day of the rollup"""
+        totals = tenant_totals([tenant.id for tenant in self.tenants[:2]])
+
+        self.assertEqual(totals, {
+            self.tenants[0].id: (2, Decimal('10.00')),
+            self.tenants[1].id: (4, Decimal('20.00')),
+        })
+
+    def test_constant_queries_per_page(self):
+        """Test the page costs the same number of queries at any size"""
+        with self.assertNumQueries(4):
+            small = self._get(2)
+        with self.assertNumQueries(4):
+            large = self._get(5)
+
+        self.assertEqual(len(small.data['tenants']), 2)
+        self.assertEqual(large.data['tenants'][4], {
+            'id': str(self.tenants[4].id),
+            'name': 'List 4',
+            'domain': 'list4.localhost',
+            'schema_name': 'list_4',
+            'created_at': self.today.isoformat(),
+            'orders_count': 10,
+            'total_sales': 50.0,
+        })
+
+
+class DailyStatsBackfillTests(TestCase):
+    """Test cases for rebuilding TenantDailyStats from tenant schemas"""
+
+    def setUp(self):
+        self.now = timezone.localtime()
+        self.tenant = Client.objects.create(schema_name='backfill_a', name='Backfill A')
+        create_tenant_tables('backfill_a')
+        category = Category.objects.create(name='Mains', slug='mains')
+        self.item_a = Item.objects.create(category=category, name='A', price=Decimal('50.00'))
+        self.item_b = Item.objects.create(category=category, name='B', price=Decimal('25.00'))
+        insert_order('backfill_a', '081', '100.00', 'completed', self.now, lines=[(self.item_a.pk, 2, '50.00')])
+        insert_order('backfill_a', '082', '40.00', 'pending', self.now, lines=[(self.item_a.pk, 1, '40.00')])
+        insert_order('backfill_a', '083', '75.00', 'completed', self.now - timedelta(days=2),
+                     lines=[(self.item_b.pk, 3, '25.00')])
+
+    def test_rebuild_daily_stats(self):
+        """Test rebuilding writes one row per tenant and day"""
+        since = self.now - timedelta(days=7)
+        rows = rebuild_daily_stats(tenant_schemas(), since)
+
+        self.assertEqual(rows, 2)
+        today = TenantDailyStats.objects.get(tenant=self.tenant, date=self.now.date())
+        self.assertEqual(today.orders_count, 2)
+        self.assertEqual(today.completed_orders, 1)
+        self.assertEqual(today.revenue, Decimal('100.00'))
+        self.assertEqual(today.items_quantity, 2)
+
+    def test_rebuild_item_stats(self):
+        """Test rebuilding writes item rows for completed orders only"""
+        rows = rebuild_item_stats(tenant_schemas(), self.now - timedelta(days=7))
+
+        self.assertEqual(rows, 2)
+        self.assertEqual(
+            sorted(TenantItemDailyStats.objects.values_list('item_id', 'quantity', 'revenue')),
+            [(self.item_a.pk, 2, Decimal('100.00')), (self.item_b.pk, 3, Decimal('75.00'))]
+        )
+
+    def test_rebuild_replaces_existing_rows(self):
+        """Test rebuilding twice doesn't double count"""
+        since = self.now - timedelta(days=7)
+        rebuild_daily_stats(tenant_schemas(), since)
+        rebuild_daily_stats(tenant_schemas(), since)
+
+        self.assertEqual(TenantDailyStats.objects.filter(tenant=self.tenant).count(), 2)
+
+    def test_backfill_command(self):
+        """Test the management command rebuilds the requested window"""
+        call_command('backfill_daily_stats', '--days', '1', '--schema', 'backfill_a', stdout=open('/dev/null', 'w'))
+
+        self.assertEqual(
+            list(TenantDailyStats.objects.filter(tenant=self.tenant).values_list('date', flat=True)),
+            [self.now.date()]
+        )
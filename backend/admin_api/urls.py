@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     # System statistics - เปลี่ยนเป็น overview/
     path('stats/overview/', views.system_stats, name='admin-stats-overview'),
+    path('stats/db-pool/', views.db_pool_stats, name='admin-stats-db-pool'),
+    path('stats/order-events/', views.order_event_stats, name='admin-stats-order-events'),
     
     # Tenant management - เพิ่ม POST method support
     path('tenants/', views.tenants_list, name='admin-tenants'),
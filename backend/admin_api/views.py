@@ -2,14 +2,21 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from django.db.models import Count, Sum, Q
+from django.db import connection
+from django.db.models import Count, Prefetch, Sum, Q
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django_tenants.utils import schema_context, get_tenant_model
-from customers.models import Client
-from orders.models import Order, OrderItem
-from store.models import Item
+from customers.models import Client, Domain
+from orders.events import order_events
+from orders.models import Order
+from .aggregation import tenant_schemas, order_totals, distinct_customers, popular_items
+from .models import TenantDailyStats
+from .rollups import tenant_totals, top_items
+from .order_listing import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, stream_orders
 from django.contrib.auth import get_user_model
+from orderup.postgresql_backend.base import pool_metrics
 
 User = get_user_model()
 
@@ -30,48 +37,23 @@ def system_stats(request):
         # Get today's date
         today = timezone.now().date()
         start_of_day = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-        end_of_day = timezone.make_aware(datetime.combine(today, datetime.max.time()))
-        
-        total_orders_today = 0
-        total_sales_today = 0
-        active_customers = set()
-        
-        # Iterate through all tenants to gather statistics
-        for tenant in Client.objects.all():
-            # Skip public tenant
-            if tenant.schema_name == 'public':
-                continue
-                
-            with schema_context(tenant.schema_name):
-                # Force connection to use the correct schema
-                from django.db import connection
-                connection.ensure_connection()
-                
-                # Count today's orders
-                orders_today = Order.objects.filter(
-                    created_at__range=[start_of_day, end_of_day]
-                ).count()
-                total_orders_today += orders_today
-                
-                # Sum today's sales
-                sales_today = Order.objects.filter(
-                    created_at__range=[start_of_day, end_of_day],
-                    status__in=['completed', 'paid']
-                ).aggregate(total=Sum('total_amount'))['total'] or 0
-                total_sales_today += sales_today
-                
-                # Get active customers (users who placed orders in last 30 days)
-                thirty_days_ago = timezone.now() - timedelta(days=30)
-                active_users = Order.objects.filter(
-                    created_at__gte=thirty_days_ago
-                ).values_list('customer_phone', flat=True).distinct()
-                active_customers.update(active_users)
+        end_of_day = start_of_day + timedelta(days=1)
+        thirty_days_ago = timezone.now() - timedelta(days=30)
+
+        # One UNION ALL statement across tenant schemas instead of a
+        # schema_context round-trip per tenant (see admin_api.aggregation)
+        schemas = tenant_schemas()
+        total_orders_today, total_sales_today = order_totals(schemas, start_of_day, end_of_day)
+
+        # Active customers (phones with orders in the last 30 days), estimated
+        # with a HyperLogLog sketch rather than a set of every phone number
+        active_customers = distinct_customers(schemas, thirty_days_ago)
         
         return Response({
             'total_tenants': tenants_count,  # เปลี่ยนจาก tenants_count
             'total_orders_today': total_orders_today,  # เปลี่ยนจาก orders_today
             'total_revenue_today': float(total_sales_today),  # เปลี่ยนจาก sales_today
-            'active_customers_30d': len(active_customers)  # เปลี่ยนจาก active_customers_count
+            'active_customers_30d': active_customers.count()  # เปลี่ยนจาก active_customers_count
         })
     
     except Exception as e:
@@ -81,6 +63,32 @@ def system_stats(request):
         )
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def db_pool_stats(request):
+    """
+    Database connection metrics for this worker process (see
+    orderup.postgresql_backend), plus a health check of its connection
+    """
+    metrics = pool_metrics.snapshot()
+    return Response({
+        **metrics,
+        'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE'),
+        'health_checks_enabled': connection.settings_dict.get('CONN_HEALTH_CHECKS', False),
+        'connection_healthy': connection.is_usable() if connection.connection is not None else None,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def order_event_stats(request):
+    """
+    WebSocket event dispatcher metrics for this worker process (see
+    orders.events): queue depth, dropped and failed events, publish latency
+    """
+    return Response(order_events.metrics())
+
+
 @api_view(['GET', 'POST'])  # เพิ่ม POST
 def tenants_list(request):
     """
@@ -93,49 +101,34 @@ def tenants_list(request):
             page_size = int(request.GET.get('page_size', 10))
             
             # Get all tenants
-            tenants = Client.objects.all()
+            tenants = Client.objects.order_by('id')
             total_count = tenants.count()
             
             # Apply pagination
             start = (page - 1) * page_size
             end = start + page_size
-            tenants_page = tenants[start:end]
+            tenants_page = list(tenants[start:end].prefetch_related(
+                Prefetch('domains', queryset=Domain.objects.filter(is_primary=True), to_attr='primary_domains')
+            ))
+            
+            # Order counts and sales come from the public-schema daily
+            # rollup in one query, so the page costs the same number of
+            # queries however many tenants or orders there are
+            totals = tenant_totals([tenant.id for tenant in tenants_page])
             
             # Prepare tenant data
             tenants_data = []
             for tenant in tenants_page:
-                # Skip tenant-specific queries for public tenant
-                if tenant.schema_name == 'public':
-                    tenants_data.append({
-                        'id': str(tenant.id),
-                        'name': tenant.name,
-                        'domain': tenant.domain_url,
-                        'schema_name': tenant.schema_name,
-                        'created_at': tenant.created_on.isoformat() if tenant.created_on else None,
-                        'orders_count': 0,
-                        'total_sales': 0
-                    })
-                    continue
-                    
-                with schema_context(tenant.schema_name):
-                    from django.db import connection
-                    connection.ensure_connection()
-                    
-                    # Get tenant-specific statistics
-                    orders_count = Order.objects.count()
-                    total_sales = Order.objects.filter(
-                        status__in=['completed', 'paid']
-                    ).aggregate(total=Sum('total_amount'))['total'] or 0
-                    
-                    tenants_data.append({
-                        'id': str(tenant.id),
-                        'name': tenant.name,
-                        'domain': tenant.domain_url,
-                        'schema_name': tenant.schema_name,
-                        'created_at': tenant.created_on.isoformat() if tenant.created_on else None,
-                        'orders_count': orders_count,
-                        'total_sales': float(total_sales)
-                    })
+                orders_count, total_sales = totals.get(tenant.id, (0, 0))
+                tenants_data.append({
+                    'id': str(tenant.id),
+                    'name': tenant.name,
+                    'domain': tenant.primary_domains[0].domain if tenant.primary_domains else None,
+                    'schema_name': tenant.schema_name,
+                    'created_at': tenant.created_on.isoformat() if tenant.created_on else None,
+                    'orders_count': orders_count,
+                    'total_sales': float(total_sales)
+                })
             
             return Response({
                 'tenants': tenants_data,
@@ -197,10 +190,23 @@ def tenants_list(request):
             )
 
 
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _in_schema(schema_name, chunks):
+    with schema_context(schema_name):
+        yield from chunks
+
+
 @api_view(['GET'])
 def tenant_orders(request, tenant_id):
     """
     Get orders for a specific tenant with filtering
+    - Keyset pagination: ?limit=N (max 500) and ?cursor=<next_cursor>
+    - Streaming export of every matching order: ?export=ndjson or ?export=csv
     """
     try:
         # Get tenant
@@ -216,45 +222,71 @@ def tenant_orders(request, tenant_id):
         start_date = request.GET.get('start_date')
         end_date = request.GET.get('end_date')
         status_filter = request.GET.get('status')
+        export_format = request.GET.get('export')
+        cursor = request.GET.get('cursor')
+        try:
+            limit = max(1, min(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+        except ValueError:
+            return Response(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if export_format not in (None, 'ndjson', 'csv'):
+            return Response(
+                {'error': 'export must be ndjson or csv'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        orders = Order.objects.all()
+        
+        # Apply date filters
+        if start_date:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            start_date = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+            orders = orders.filter(created_at__gte=start_date)
+        
+        if end_date:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            end_date = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
+            orders = orders.filter(created_at__lte=end_date)
+        
+        # Apply status filter
+        if status_filter:
+            orders = orders.filter(status=status_filter)
+        
+        if export_format:
+            # Streamed from a server-side cursor; the generator switches to
+            # the tenant schema itself since it runs after the view returns
+            response = StreamingHttpResponse(
+                _in_schema(tenant.schema_name, stream_orders(orders, export_format)),
+                content_type=EXPORT_CONTENT_TYPES[export_format]
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="{tenant.schema_name}-orders.{export_format}"'
+            )
+            return response
         
         with schema_context(tenant.schema_name):
-            orders = Order.objects.all().order_by('-created_at')
-            
-            # Apply date filters
-            if start_date:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-                start_date = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
-                orders = orders.filter(created_at__gte=start_date)
-            
-            if end_date:
-                end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-                end_date = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
-                orders = orders.filter(created_at__lte=end_date)
-            
-            # Apply status filter
-            if status_filter:
-                orders = orders.filter(status=status_filter)
-            
-            # Serialize orders data
-            orders_data = []
-            for order in orders:
-                orders_data.append({
-                    'id': str(order.id),
-                    'order_number': order.order_number,
-                    'user': order.user.email if order.user else None,
-                    'status': order.status,
-                    'total_amount': float(order.total_amount),
-                    'created_at': order.created_at.isoformat(),
-                    'updated_at': order.updated_at.isoformat(),
-                    'items_count': order.items.count()
-                })
+            try:
+                orders_data, next_cursor = keyset_page(orders, cursor, limit)
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid cursor'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
             return Response({
                 'tenant': {
                     'id': str(tenant.id),
                     'name': tenant.name
                 },
-                'orders': orders_data
+                'orders': orders_data,
+                'pagination': {
+                    'limit': limit,
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None
+                }
             })
     
     except ValueError as e:
@@ -282,96 +314,52 @@ def analytics(request):
         days = int(request.GET.get('days', 30))
         start_date = timezone.now() - timedelta(days=days)
         
-        # Top tenants by revenue
-        top_tenants = []
-        for tenant in Client.objects.all():
-            if tenant.schema_name == 'public':
-                continue
-                
-            with schema_context(tenant.schema_name):
-                from django.db import connection
-                connection.ensure_connection()
-                
-                revenue = Order.objects.filter(
-                    created_at__gte=start_date,
-                    status__in=['completed', 'paid']
-                ).aggregate(total=Sum('total_amount'))['total'] or 0
-                
-                if revenue > 0:
-                    top_tenants.append({
-                        'id': str(tenant.id),
-                        'name': tenant.name,
-                        'revenue': float(revenue)
-                    })
-        
-        # Sort by revenue and get top 10
-        top_tenants.sort(key=lambda x: x['revenue'], reverse=True)
-        top_tenants = top_tenants[:10]
-        
-        # Popular items across all tenants
-        item_stats = {}
-        for tenant in Client.objects.all():
-            if tenant.schema_name == 'public':
-                continue
-                
-            with schema_context(tenant.schema_name):
-                from django.db import connection
-                connection.ensure_connection()
-                
-                order_items = OrderItem.objects.filter(
-                    order__created_at__gte=start_date,
-                    order__status__in=['completed', 'paid']
-                ).select_related('item')
-                
-                for item in order_items:
-                    item_key = f"{tenant.id}_{item.item.name}"
-                    if item_key not in item_stats:
-                        item_stats[item_key] = {
-                            'name': item.item.name,
-                            'tenant_id': str(tenant.id),
-                            'tenant_name': tenant.name,
-                            'quantity': 0,
-                            'revenue': 0
-                        }
-                    
-                    item_stats[item_key]['quantity'] += item.quantity
-                    item_stats[item_key]['revenue'] += float(item.unit_price * item.quantity)
+        # Top tenants by revenue, from the daily rollup in one query
+        rollup = TenantDailyStats.objects.filter(date__gte=timezone.localtime(start_date).date())
+        top_tenants = [
+            {
+                'id': str(row['tenant_id']),
+                'name': row['tenant__name'],
+                'revenue': float(row['revenue'])
+            }
+            for row in rollup.values('tenant_id', 'tenant__name')
+            .annotate(revenue=Sum('revenue'))
+            .filter(revenue__gt=0)
+            .order_by('-revenue')[:10]
+        ]
         
-        # Convert to list and sort by quantity
-        popular_items = list(item_stats.values())
-        popular_items.sort(key=lambda x: x['quantity'], reverse=True)
-        popular_items = popular_items[:20]
+        # Popular items across all tenants: ranked in the database from the
+        # item rollup, or live from the order tables with ?source=live
+        if request.GET.get('source') == 'live':
+            items = popular_items(tenant_schemas(), start_date, limit=20)
+        else:
+            items = top_items(timezone.localtime(start_date).date(), limit=20)
+        popular_items_list = [
+            {
+                'name': item['name'],
+                'tenant_id': item['tenant_id'],
+                'tenant_name': item['tenant_name'],
+                'quantity': item['quantity'],
+                'revenue': float(item['revenue'])
+            }
+            for item in items
+        ]
         
-        # Revenue trends (daily for the last 30 days)
+        # Revenue trends (daily for the last 30 days), from the rollup in one query
+        daily_revenue = dict(
+            rollup.values_list('date').annotate(revenue=Sum('revenue')).order_by()
+        )
         revenue_trends = []
         for i in range(days):
-            date = start_date + timedelta(days=i)
-            day_start = timezone.make_aware(datetime.combine(date, datetime.min.time()))
-            day_end = timezone.make_aware(datetime.combine(date, datetime.max.time()))
-            
-            daily_revenue = 0
-            for tenant in Client.objects.all():
-                if tenant.schema_name == 'public':
-                    continue
-                    
-                with schema_context(tenant.schema_name):
-                    from django.db import connection
-                    connection.ensure_connection()
-                    
-                    revenue = Order.objects.filter(
-                        created_at__range=[day_start, day_end],
-                        status__in=['completed', 'paid']
-                    ).aggregate(total=Sum('total_amount'))['total'] or 0
-                    daily_revenue += revenue
-            
+            date = timezone.localtime(start_date + timedelta(days=i)).date()
             revenue_trends.append({
                 'date': date.strftime('%Y-%m-%d'),
-                'revenue': float(daily_revenue)
+                'revenue': float(daily_revenue.get(date, 0))
             })
         
         return Response({
             'top_tenants': top_tenants,
-            'popular_items': popular_items,
+            'popular_items': popular_items_list,
             'revenue_trends': revenue_trends,
             'period_days': days
         })
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Client, Domain
+from .tenant_registry import tenant_registry
+
+
+@receiver(pre_save, sender=Client)
+def remember_schema_name(sender, instance, **kwargs):
+    # A renamed schema must drop the entry cached under its old name too
+    instance._previous_schema_name = (
+        Client.objects.filter(pk=instance.pk).values_list('schema_name', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(pre_save, sender=Domain)
+def remember_domain(sender, instance, **kwargs):
+    instance._previous_domain = (
+        Domain.objects.filter(pk=instance.pk).values_list('domain', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_client(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_schema_name', None)
+    if previous and previous != instance.schema_name:
+        tenant_registry.invalidate(schema_name=previous)
+    tenant_registry.invalidate(schema_name=instance.schema_name)
+
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+def invalidate_domain(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_domain', None)
+    if previous and previous != instance.domain:
+        tenant_registry.invalidate(host=previous)
+    tenant_registry.invalidate(host=instance.domain)
@@ -0,0 +1,131 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class TenantRegistry:
+    """
+    In-process cache of resolved tenants.
+
+    Entries are keyed by schema name (the subdomain used by the frontend)
+    or by full host name, expire after a TTL and are dropped explicitly
+    when a Client or Domain is saved or deleted (see customers.signals).
+    Misses are cached too, so unknown subdomains don't hit the database
+    on every request either.
+
+    Invalidations also replace a version token in the shared cache
+    (VERSION_KEY); every lookup compares it with the one this process last
+    saw and drops all its entries when another process has changed it.
+    """
+
+    VERSION_KEY = 'tenant_registry:version'
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._schemas = {}
+        self._hosts = {}
+        self._generation = 0
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'TENANT_CACHE_TTL', 300)
+
+    def get_by_schema(self, schema_name):
+        """Return the Client for a schema name (subdomain), or None"""
+        def load():
+            from customers.models import Client
+            return Client.objects.filter(schema_name=schema_name).first()
+        return self._resolve(self._schemas, schema_name, load)
+
+    def get_by_host(self, host):
+        """Return the Client owning a Domain row for this host, or None"""
+        host = host.split(':')[0].lower()
+
+        def load():
+            from customers.models import Domain
+            domain = Domain.objects.select_related('tenant').filter(domain=host).first()
+            return domain.tenant if domain else None
+        return self._resolve(self._hosts, host, load)
+
+    def _shared_version(self):
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            cache.add(self.VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(self.VERSION_KEY)
+        return version
+
+    def _resolve(self, entries, key, load):
+        version = self._shared_version()
+        now = time.monotonic()
+        with self._lock:
+            if version != self._version:
+                # Another process invalidated something since our last lookup
+                self._generation += 1
+                self._schemas.clear()
+                self._hosts.clear()
+                self._version = version
+            entry = entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        tenant = load()
+        if self.ttl > 0:
+            with self._lock:
+                # Don't store a result that an invalidation raced past
+                if generation == self._generation:
+                    entries[key] = (tenant, now + self.ttl)
+        return tenant
+
+    def invalidate(self, schema_name=None, host=None):
+        """
+        Drop cached entries for a schema and/or host (and hosts mapped to
+        that schema) here, and everything cached by other processes
+        """
+        version = uuid.uuid4().hex
+        cache.set(self.VERSION_KEY, version, None)
+        with self._lock:
+            self.invalidations += 1
+            self._generation += 1
+            self._version = version
+            if schema_name is not None:
+                self._schemas.pop(schema_name, None)
+                for key, (tenant, _) in list(self._hosts.items()):
+                    if tenant is not None and tenant.schema_name == schema_name:
+                        del self._hosts[key]
+            if host is not None:
+                self._hosts.pop(host.lower(), None)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += 1
+            self._generation += 1
+            self._schemas.clear()
+            self._hosts.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'cached_schemas': len(self._schemas),
+                'cached_hosts': len(self._hosts),
+            }
+
+
+tenant_registry = TenantRegistry()
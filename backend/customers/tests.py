@@ -1,9 +1,11 @@
 from decimal import Decimal
 from datetime import datetime, date
+from unittest import mock
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from customers.models import Customer, Membership, LoyaltyTransaction
+from customers.models import Client, Domain, Customer, Membership, LoyaltyTransaction
+from customers.tenant_registry import TenantRegistry, tenant_registry
 
 User = get_user_model()
 
@@ -327,4 +329,98 @@ class TenantIsolationTests(TestCase):
         
         # Check ordering (should be most recent first)
         self.assertEqual(transactions[0], transaction2)
-        self.assertEqual(transactions[1], transaction1)
\ No newline at end of file
+        self.assertEqual(transactions[1], transaction1)
+
+
+class TenantRegistryTests(TestCase):
+    """Test cases for the in-process tenant registry"""
+
+    def setUp(self):
+        self.tenant = Client.objects.create(schema_name='pizza', name='Pizza Lover')
+        Domain.objects.create(domain='pizza.localhost', tenant=self.tenant, is_primary=True)
+        self.registry = TenantRegistry(ttl=60)
+
+    def test_get_by_schema_cached(self):
+        """Test that a second lookup is served without a query"""
+        self.assertEqual(self.registry.get_by_schema('pizza'), self.tenant)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.registry.get_by_schema('pizza'), self.tenant)
+
+        stats = self.registry.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_unknown_schema_cached_as_miss(self):
+        """Test that unknown subdomains are negatively cached"""
+        self.assertIsNone(self.registry.get_by_schema('nope'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.registry.get_by_schema('nope'))
+
+    def test_get_by_host(self):
+        """Test host lookups go through the Domain table"""
+        self.assertEqual(self.registry.get_by_host('pizza.localhost:3000'), self.tenant)
+        self.assertIsNone(self.registry.get_by_host('sushi.localhost'))
+
+    def test_invalidate_schema_drops_host_entries(self):
+        """Test invalidating a schema also drops hosts resolved to it"""
+        self.registry.get_by_schema('pizza')
+        self.registry.get_by_host('pizza.localhost')
+        self.registry.invalidate(schema_name='pizza')
+
+        stats = self.registry.stats()
+        self.assertEqual(stats['cached_schemas'], 0)
+        self.assertEqual(stats['cached_hosts'], 0)
+
+    def test_zero_ttl_disables_cache(self):
+        """Test that a TTL of 0 always goes to the database"""
+        registry = TenantRegistry(ttl=0)
+        registry.get_by_schema('pizza')
+        with self.assertNumQueries(1):
+            registry.get_by_schema('pizza')
+
+    def test_invalidation_reaches_other_processes(self):
+        """Test an invalidation in one registry drops what another has cached"""
+        other = TenantRegistry(ttl=60)
+        self.registry.get_by_schema('pizza')
+        other.get_by_schema('pizza')
+
+        other.invalidate(schema_name='sushi')
+
+        with self.assertNumQueries(1):
+            self.registry.get_by_schema('pizza')
+        with self.assertNumQueries(0):
+            self.registry.get_by_schema('pizza')
+
+    def test_renamed_schema_evicts_old_name(self):
+        """Test saving a Client under a new schema name drops the old name's entry"""
+        self.assertEqual(tenant_registry.get_by_schema('pizza'), self.tenant)
+        self.tenant.schema_name = 'pizza2'
+        # Only the rename matters here, not building the new schema
+        with mock.patch.object(Client, 'create_schema'):
+            self.tenant.save()
+
+        self.assertIsNone(tenant_registry.get_by_schema('pizza'))
+        self.assertEqual(tenant_registry.get_by_schema('pizza2'), self.tenant)
+
+    def test_renamed_domain_evicts_old_host(self):
+        """Test saving a Domain under a new host drops the old host's entry"""
+        self.assertEqual(tenant_registry.get_by_host('pizza.localhost'), self.tenant)
+        domain = Domain.objects.get(domain='pizza.localhost')
+        domain.domain = 'pizzeria.localhost'
+        domain.save()
+
+        self.assertIsNone(tenant_registry.get_by_host('pizza.localhost'))
+
+    def test_client_delete_invalidates_shared_registry(self):
+        """Test that deleting a Client drops its cached entry"""
+        self.assertEqual(tenant_registry.get_by_schema('pizza'), self.tenant)
+        self.tenant.delete()
+
+        self.assertIsNone(tenant_registry.get_by_schema('pizza'))
+
+    def test_domain_delete_invalidates_shared_registry(self):
+        """Test that deleting a Domain drops its cached host"""
+        self.assertEqual(tenant_registry.get_by_host('pizza.localhost'), self.tenant)
+        Domain.objects.filter(domain='pizza.localhost').first().delete()
+
+        self.assertIsNone(tenant_registry.get_by_host('pizza.localhost'))
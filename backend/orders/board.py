@@ -0,0 +1,148 @@
+"""
+Kitchen board: the active (pending/preparing) orders, with a change cursor.
+
+Every insert or update of an order stamps `change_xid` with the id of the
+writing transaction (trigger orders_order_change_xid, see CHANGE_TRIGGER_SQL).
+A board response carries the cursor pg_snapshot_xmin(pg_current_snapshot()),
+taken before the orders are read: every transaction older than it has
+finished, so a later `since=<cursor>` only needs the rows stamped at or
+after it, which includes writes that were still in flight when the cursor
+was taken. Orders can therefore come back more than once; screens key them
+by id.
+
+Deleted orders leave no row to stamp, so an AFTER DELETE trigger
+(TOMBSTONE_TRIGGER_SQL) records each one in OrderTombstone with the
+deleting transaction's id, and `since` reads those as removals too.
+Tombstones are kept for TOMBSTONE_RETENTION; a screen whose cursor is
+older than that reloads the full board.
+"""
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import connection
+from django.db.models import F, OuterRef
+from django.db.models.functions import JSONObject
+
+from .models import Order, OrderItem, OrderItemModifier, OrderTombstone
+
+ACTIVE_STATUSES = ('pending', 'preparing')
+
+CHANGE_TRIGGER_SQL = [
+    'CREATE OR REPLACE FUNCTION orders_order_stamp_change() RETURNS trigger AS $$ '
+    'BEGIN NEW.change_xid := pg_current_xact_id()::text::bigint; RETURN NEW; END '
+    '$$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS orders_order_change_xid ON orders_order',
+    'CREATE TRIGGER orders_order_change_xid BEFORE INSERT OR UPDATE ON orders_order '
+    'FOR EACH ROW EXECUTE FUNCTION orders_order_stamp_change()',
+]
+
+DROP_CHANGE_TRIGGER_SQL = [
+    'DROP TRIGGER IF EXISTS orders_order_change_xid ON orders_order',
+    'DROP FUNCTION IF EXISTS orders_order_stamp_change()',
+]
+
+
+TOMBSTONE_RETENTION = '1 day'
+
+TOMBSTONE_TRIGGER_SQL = [
+    'CREATE OR REPLACE FUNCTION orders_order_record_deletion() RETURNS trigger AS $$ '
+    'BEGIN INSERT INTO orders_ordertombstone (order_id, change_xid, deleted_at) '
+    'VALUES (OLD.id, pg_current_xact_id()::text::bigint, now()); RETURN OLD; END '
+    '$$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS orders_order_tombstone ON orders_order',
+    'CREATE TRIGGER orders_order_tombstone AFTER DELETE ON orders_order '
+    'FOR EACH ROW EXECUTE FUNCTION orders_order_record_deletion()',
+    # Once per DELETE statement, drop the tombstones no cursor still needs
+    'CREATE OR REPLACE FUNCTION orders_order_purge_tombstones() RETURNS trigger AS $$ '
+    f"BEGIN DELETE FROM orders_ordertombstone WHERE deleted_at < now() - interval '{TOMBSTONE_RETENTION}'; "
+    'RETURN NULL; END '
+    '$$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS orders_order_tombstone_purge ON orders_order',
+    'CREATE TRIGGER orders_order_tombstone_purge AFTER DELETE ON orders_order '
+    'FOR EACH STATEMENT EXECUTE FUNCTION orders_order_purge_tombstones()',
+]
+
+DROP_TOMBSTONE_TRIGGER_SQL = [
+    'DROP TRIGGER IF EXISTS orders_order_tombstone ON orders_order',
+    'DROP TRIGGER IF EXISTS orders_order_tombstone_purge ON orders_order',
+    'DROP FUNCTION IF EXISTS orders_order_record_deletion()',
+    'DROP FUNCTION IF EXISTS orders_order_purge_tombstones()',
+]
+
+
+def install_change_trigger():
+    """Create the change_xid and tombstone triggers in the current schema (idempotent)"""
+    with connection.cursor() as cursor:
+        for sql in CHANGE_TRIGGER_SQL + TOMBSTONE_TRIGGER_SQL:
+            cursor.execute(sql)
+
+
+def current_cursor():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+        return cursor.fetchone()[0]
+
+
+def board_rows(queryset):
+    """
+    Compact board rows, with each order's lines and their modifier names
+    aggregated in the same query. The lines are matched on the order's
+    created_at too, so on partitioned tables only its month is read.
+    """
+    modifiers = (
+        OrderItemModifier.objects.filter(order_item=OuterRef('pk'), created_at=OuterRef('created_at'))
+        .order_by('id').values('modifier_option__name')
+    )
+    lines = (
+        OrderItem.objects.filter(order=OuterRef('pk'), created_at=OuterRef('created_at')).order_by('id')
+        .values(line=JSONObject(
+            name='item__name',
+            quantity='quantity',
+            notes='special_instructions',
+            modifiers=ArraySubquery(modifiers),
+        ))
+    )
+    return (
+        queryset.order_by('created_at', 'id')
+        .annotate(table_name=F('table__name'), lines=ArraySubquery(lines))
+        .values(
+            'id', 'status', 'payment_status', 'customer_name', 'table_name',
+            'special_instructions', 'created_at', 'lines',
+        )
+    )
+
+
+def serialize_row(row):
+    return {
+        'id': str(row['id']),
+        'status': row['status'],
+        'payment_status': row['payment_status'],
+        'customer_name': row['customer_name'],
+        'table_name': row['table_name'],
+        'special_instructions': row['special_instructions'],
+        'created_at': row['created_at'].isoformat(),
+        'items': row['lines'],
+    }
+
+
+def read_board(since=None):
+    """
+    {'cursor', 'orders', 'removed'}: every active order, or with `since`
+    only the orders changed at or after that cursor, where `removed` lists
+    the ids of changed orders that have left the board and of orders
+    deleted since.
+    """
+    cursor = current_cursor()
+    if since is None:
+        rows = board_rows(Order.objects.filter(status__in=ACTIVE_STATUSES))
+    else:
+        rows = board_rows(Order.objects.filter(change_xid__gte=since))
+
+    orders, removed = [], []
+    for row in rows:
+        if row['status'] in ACTIVE_STATUSES:
+            orders.append(serialize_row(row))
+        else:
+            removed.append(str(row['id']))
+    if since is not None:
+        deleted = OrderTombstone.objects.filter(change_xid__gte=since).values_list('order_id', flat=True)
+        removed.extend(str(order_id) for order_id in deleted)
+    return {'cursor': str(cursor), 'orders': orders, 'removed': removed}
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class OrderEventDispatcher:
+    """
+    Publishes order events to the channel layer off the request path.
+
+    publish() only puts the event on a bounded in-process queue. A daemon
+    worker drains the queue in batches, groups events per tenant group
+    (keeping their order within a group) and sends each batch from its own
+    event loop. When the queue is full the event is dropped and counted,
+    so a slow or unavailable channel layer never blocks a request.
+    """
+
+    def __init__(self, max_queue_size=None, batch_size=None, channel_layer=None):
+        self.max_queue_size = max_queue_size or getattr(settings, 'ORDER_EVENTS_MAX_QUEUE_SIZE', 1000)
+        self.batch_size = batch_size or getattr(settings, 'ORDER_EVENTS_BATCH_SIZE', 100)
+        self._channel_layer = channel_layer
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+
+        self.enqueued = 0
+        self.published = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batches = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latency_last = 0.0
+
+    @property
+    def channel_layer(self):
+        if self._channel_layer is None:
+            self._channel_layer = get_channel_layer()
+        return self._channel_layer
+
+    def publish(self, group_name, message):
+        """Queue a message for group_name; returns False if it was dropped"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((group_name, message, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning(f"Order event queue full, dropped event for {group_name}")
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def flush(self, timeout=5.0):
+        """Block until every queued event has been handled (mainly for tests)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def metrics(self):
+        with self._lock:
+            handled = self.published + self.failed
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_size': self.max_queue_size,
+                'enqueued': self.enqueued,
+                'published': self.published,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'batches': self.batches,
+                'publish_latency_ms_last': self._latency_last * 1000,
+                'publish_latency_ms_avg': (self._latency_total / handled * 1000) if handled else 0.0,
+                'publish_latency_ms_max': self._latency_max * 1000,
+            }
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='order-event-dispatcher', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._loop.run_until_complete(self._send_batch(batch))
+            except Exception as e:
+                logger.warning(f"Order event batch failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _send_batch(self, batch):
+        groups = {}
+        for group_name, message, queued_at in batch:
+            groups.setdefault(group_name, []).append((message, queued_at))
+
+        with self._lock:
+            self.batches += 1
+        await asyncio.gather(*(
+            self._send_group(group_name, events) for group_name, events in groups.items()
+        ))
+
+    async def _send_group(self, group_name, events):
+        channel_layer = self.channel_layer
+        for message, queued_at in events:
+            ok = False
+            try:
+                if channel_layer is None:
+                    raise RuntimeError('No channel layer configured')
+                # Normalise Decimal/UUID/datetime values for the layer's msgpack encoding
+                payload = json.loads(json.dumps(message, cls=JSONEncoder))
+                await channel_layer.group_send(group_name, payload)
+                ok = True
+            except Exception as e:
+                logger.warning(f"Failed to send websocket update to {group_name}: {e}")
+            self._record(ok, time.monotonic() - queued_at)
+
+    def _record(self, ok, latency):
+        with self._lock:
+            if ok:
+                self.published += 1
+            else:
+                self.failed += 1
+            self._latency_last = latency
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+
+order_events = OrderEventDispatcher()
@@ -0,0 +1,123 @@
+"""
+Idempotent checkout.
+
+PublicOrderCreateView keys each checkout by the client's Idempotency-Key
+header or, without one, by a hash of the cart and order details. The key is
+claimed in the cache before the order is created and the response is
+stored under it afterwards, so a retried request is answered from the
+stored response instead of creating the order again. A retry that arrives
+after the cart was closed finds the response through the session's last
+checkout key. The order also records the key (Order.idempotency_key,
+unique), so a retry after a worker died before storing the response, or
+after the cache lost it, finds the existing order instead of creating a
+second one.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+DEFAULT_TTL = 15 * 60
+# How long a claim blocks concurrent retries if the worker dies mid-checkout
+PENDING_TTL = 30
+
+PENDING = 'pending'
+DONE = 'done'
+
+
+class IdempotencyConflict(Exception):
+    """The key is being processed, or was used for a different request"""
+
+    def __init__(self, message, in_progress=False):
+        super().__init__(message)
+        self.in_progress = in_progress
+
+
+def _ttl():
+    return getattr(settings, 'CHECKOUT_IDEMPOTENCY_TTL', DEFAULT_TTL)
+
+
+def _key(key):
+    schema = getattr(connection, 'schema_name', 'public')
+    return f'idempotency:checkout:{schema}:{key}'
+
+
+def _session_key(session_id):
+    schema = getattr(connection, 'schema_name', 'public')
+    return f'idempotency:checkout-session:{schema}:{session_id}'
+
+
+def checkout_fingerprint(session_id, cart, details):
+    """
+    Content hash of a checkout: the cart (its lines, ids included, so a
+    later cart with the same contents hashes differently) and the order
+    details taken from the request.
+    """
+    payload = {
+        'session_id': session_id,
+        'cart': [cart.id, cart.created_at.isoformat() if cart.created_at else None],
+        'lines': [
+            [str(line.id), line.item_id, line.quantity, line.special_instructions, sorted(line.modifiers)]
+            for line in cart.lines
+        ],
+        'details': details,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def claim(key, fingerprint):
+    """
+    Claim `key` for a new checkout. Returns None once claimed, or the
+    stored (status, data) when the key already completed. Raises
+    IdempotencyConflict while another request holds the key or when the key
+    was used for a different request.
+    """
+    pending = {'state': PENDING, 'fingerprint': fingerprint}
+    if cache.add(_key(key), pending, PENDING_TTL):
+        return None
+
+    record = cache.get(_key(key))
+    if record is None:
+        # Expired between add() and get()
+        if cache.add(_key(key), pending, PENDING_TTL):
+            return None
+        raise IdempotencyConflict('A request with this idempotency key is in progress', in_progress=True)
+    if record['fingerprint'] != fingerprint:
+        raise IdempotencyConflict('Idempotency key was already used for a different request')
+    if record['state'] == PENDING:
+        raise IdempotencyConflict('A request with this idempotency key is in progress', in_progress=True)
+    return record['status'], record['data']
+
+
+def release(key):
+    """Give up a claim without storing a result, so the request can be retried"""
+    cache.delete(_key(key))
+
+
+def store_result(key, fingerprint, session_id, status, data):
+    """Store the response for `key` and remember it as the session's last checkout"""
+    ttl = _ttl()
+    cache.set(_key(key), {
+        'state': DONE, 'fingerprint': fingerprint, 'session_id': session_id, 'status': status, 'data': data,
+    }, ttl)
+    cache.set(_session_key(session_id), key, ttl)
+
+
+def stored_result(key, session_id):
+    """
+    The stored (status, data) for `key`, or for the session's last checkout
+    when no key is given; None if there is none or it was stored for
+    another session.
+    """
+    if key is None:
+        key = cache.get(_session_key(session_id))
+    if key is None:
+        return None
+    record = cache.get(_key(key))
+    if record is None or record['state'] != DONE or record.get('session_id') != session_id:
+        return None
+    return record['status'], record['data']
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.partitions import maintain_all_schemas, months_ahead, retention_months
+
+
+class Command(BaseCommand):
+    help = (
+        'Partitions tenant order tables by month (ORDER_PARTITIONING), creates upcoming partitions '
+        'and detaches old ones (run daily from cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int,
+                            help=f'Months of partitions to create ahead (default: {months_ahead()})')
+        parser.add_argument('--retain', type=int,
+                            help='Detach partitions older than N months (default: ORDER_PARTITION_RETENTION_MONTHS, '
+                                 'or keep everything)')
+        parser.add_argument('--no-convert', action='store_false', dest='convert',
+                            help='Only maintain schemas that are already partitioned')
+        parser.add_argument('--schema', action='append', dest='schemas',
+                            help='Tenant schema to maintain (repeatable; default: every tenant with order tables)')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'ORDER_PARTITIONING', False):
+            raise CommandError('Order partitioning is off; set ORDER_PARTITIONING=true to opt in')
+        ahead = months_ahead() if options['ahead'] is None else options['ahead']
+        retain = retention_months() if options['retain'] is None else options['retain']
+        if ahead < 0 or (retain is not None and retain < 1):
+            raise CommandError('--ahead must not be negative and --retain must be at least 1')
+
+        results = maintain_all_schemas(
+            schemas=options['schemas'], ahead=ahead, retain=retain, convert=options['convert'],
+        )
+        for schema_name, result in results.items():
+            if result['converted']:
+                self.stdout.write(f'{schema_name}: converted to monthly partitions')
+            for name in result['created']:
+                self.stdout.write(f'{schema_name}: created {name}')
+            for name in result['detached']:
+                self.stdout.write(f'{schema_name}: detached {name}')
+        self.stdout.write(self.style.SUCCESS(f'Maintained order partitions in {len(results)} schema(s)'))
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_create_orders_tables_in_tenant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatsCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders_today', models.PositiveIntegerField(default=0)),
+                ('orders_completed_today', models.PositiveIntegerField(default=0)),
+                ('revenue_today', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('active_orders', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+# Same as orders.board.CHANGE_TRIGGER_SQL / DROP_CHANGE_TRIGGER_SQL
+STAMP_CHANGE_SQL = [
+    'CREATE OR REPLACE FUNCTION orders_order_stamp_change() RETURNS trigger AS $$ '
+    'BEGIN NEW.change_xid := pg_current_xact_id()::text::bigint; RETURN NEW; END '
+    '$$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS orders_order_change_xid ON orders_order',
+    'CREATE TRIGGER orders_order_change_xid BEFORE INSERT OR UPDATE ON orders_order '
+    'FOR EACH ROW EXECUTE FUNCTION orders_order_stamp_change()',
+]
+
+DROP_STAMP_CHANGE_SQL = [
+    'DROP TRIGGER IF EXISTS orders_order_change_xid ON orders_order',
+    'DROP FUNCTION IF EXISTS orders_order_stamp_change()',
+]
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_stats_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='change_xid',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['change_xid'], name='idx_order_change_xid'),
+        ),
+        migrations.RunSQL(STAMP_CHANGE_SQL, reverse_sql=DROP_STAMP_CHANGE_SQL),
+    ]
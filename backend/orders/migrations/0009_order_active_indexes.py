@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_change_xid'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], include=('status', 'total_amount'), name='idx_order_created_at_cover'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'preparing'])), fields=['created_at', 'id'], include=('status', 'table'), name='idx_order_active'),
+        ),
+        # Dropped once their replacements exist: idx_order_status is covered by
+        # idx_order_status_created_at and, for the live orders, idx_order_active
+        migrations.RemoveIndex(
+            model_name='order',
+            name='idx_order_status',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='idx_order_created_at',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitemmodifier',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # Existing modifiers take their line's timestamp
+        migrations.RunSQL(
+            'UPDATE orders_orderitemmodifier m SET created_at = i.created_at '
+            'FROM orders_orderitem i WHERE i.id = m.order_item_id',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='orderitem',
+            options={'ordering': ['created_at', 'id']},
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='orderitemmodifier',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        # Existing lines and modifiers take their order's timestamp
+        migrations.RunSQL(
+            'UPDATE orders_orderitem i SET created_at = o.created_at '
+            'FROM orders_order o WHERE o.id = i.order_id AND i.created_at <> o.created_at',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            'UPDATE orders_orderitemmodifier m SET created_at = i.created_at '
+            'FROM orders_orderitem i WHERE i.id = m.order_item_id AND m.created_at <> i.created_at',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:51
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# Same as orders.board.TOMBSTONE_TRIGGER_SQL / DROP_TOMBSTONE_TRIGGER_SQL
+TOMBSTONE_SQL = [
+    'CREATE OR REPLACE FUNCTION orders_order_record_deletion() RETURNS trigger AS $$ '
+    'BEGIN INSERT INTO orders_ordertombstone (order_id, change_xid, deleted_at) '
+    'VALUES (OLD.id, pg_current_xact_id()::text::bigint, now()); RETURN OLD; END '
+    '$$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS orders_order_tombstone ON orders_order',
+    'CREATE TRIGGER orders_order_tombstone AFTER DELETE ON orders_order '
+    'FOR EACH ROW EXECUTE FUNCTION orders_order_record_deletion()',
+    'CREATE OR REPLACE FUNCTION orders_order_purge_tombstones() RETURNS trigger AS $$ '
+    "BEGIN DELETE FROM orders_ordertombstone WHERE deleted_at < now() - interval '1 day'; "
+    'RETURN NULL; END '
+    '$$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS orders_order_tombstone_purge ON orders_order',
+    'CREATE TRIGGER orders_order_tombstone_purge AFTER DELETE ON orders_order '
+    'FOR EACH STATEMENT EXECUTE FUNCTION orders_order_purge_tombstones()',
+]
+
+DROP_TOMBSTONE_SQL = [
+    'DROP TRIGGER IF EXISTS orders_order_tombstone ON orders_order',
+    'DROP TRIGGER IF EXISTS orders_order_tombstone_purge ON orders_order',
+    'DROP FUNCTION IF EXISTS orders_order_record_deletion()',
+    'DROP FUNCTION IF EXISTS orders_order_purge_tombstones()',
+]
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_line_created_at_from_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField()),
+                ('change_xid', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['change_xid'], name='idx_order_tombstone_xid'), models.Index(fields=['deleted_at'], name='idx_order_tombstone_deleted')],
+            },
+        ),
+        migrations.RunSQL(TOMBSTONE_SQL, reverse_sql=DROP_TOMBSTONE_SQL),
+    ]
@@ -1,6 +1,10 @@
+from decimal import Decimal
+
 from django.db import models
+from django.utils import timezone
 from django_tenants.models import TenantMixin
 from django.contrib.auth import get_user_model
+from store.pricing import adjustment_total, line_total
 
 User = get_user_model()
 
@@ -49,24 +53,54 @@ class Order(models.Model):
     qr_code = models.ForeignKey('qrcodes.QRCode', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     table = models.ForeignKey('store.Table', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     session_id = models.CharField(max_length=255, blank=True, null=True, help_text="Cart session ID for linking with customer")
+    # Checkout key (orders.idempotency); a retried checkout finds its order by it
+    idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True, editable=False)
     customer = models.ForeignKey('customers.Customer', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     special_instructions = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Id of the transaction that last wrote the row, set by a database
+    # trigger; the kitchen board's change cursor (see orders.board)
+    change_xid = models.BigIntegerField(null=True, blank=True, editable=False)
+    # Bumped by every write; orders.transitions only updates a row at the
+    # version it was read at
+    version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['status'], name='idx_order_status'),
-            models.Index(fields=['created_at'], name='idx_order_created_at'),
+            # Covers the "today" part of orders.stats.compute_order_stats
+            models.Index(
+                fields=['created_at'], include=['status', 'total_amount'], name='idx_order_created_at_cover'
+            ),
             models.Index(fields=['status', 'created_at'], name='idx_order_status_created_at'),
             models.Index(fields=['qr_code'], name='idx_order_qr_code'),
             models.Index(fields=['session_id'], name='idx_order_session_id'),
+            models.Index(fields=['change_xid'], name='idx_order_change_xid'),
+            # Only the live orders, in board order (orders.board): the board,
+            # kitchen lists and the active count never touch the history
+            models.Index(
+                fields=['created_at', 'id'], include=['status', 'table'],
+                condition=models.Q(status__in=['pending', 'preparing']), name='idx_order_active',
+            ),
         ]
 
     def __str__(self):
         return f"Order {self.id} - {self.customer_name} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so post_save can tell what changed
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            # So conditional writes in orders.transitions notice this one
+            self.version += 1
+        super().save(*args, **kwargs)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -74,17 +108,32 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Price at time of order")
     special_instructions = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # The order's created_at, so lines land in their order's partition when
+    # orders are partitioned by month (orders.partitions)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    # Prefetches and subqueries also match lines to their order on this, so
+    # partition pruning applies (orders.query_plan, orders.board)
+    partition_key = 'created_at'
 
     class Meta:
-        ordering = ['created_at']
+        ordering = ['created_at', 'id']
 
     def __str__(self):
         return f"{self.quantity}x {self.item.name} in Order {self.order.id}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.order_id:
+            self.created_at = self.order.created_at
+        super().save(*args, **kwargs)
+
     @property
     def total_price(self):
-        return self.quantity * self.unit_price
+        """The line including its modifier adjustments (prefetch `modifiers` when listing)"""
+        return line_total(
+            self.quantity, self.unit_price,
+            sum((modifier.total_price for modifier in self.modifiers.all()), Decimal('0.00')),
+        )
 
 
 class OrderItemModifier(models.Model):
@@ -92,6 +141,10 @@ class OrderItemModifier(models.Model):
     modifier_option = models.ForeignKey('store.ModifierOption', on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField(default=1)
     price_adjustment = models.DecimalField(max_digits=6, decimal_places=2, help_text="Price adjustment at time of order")
+    # The order's created_at, as on OrderItem
+    created_at = models.DateTimeField(default=timezone.now)
+
+    partition_key = 'created_at'
 
     class Meta:
         unique_together = ['order_item', 'modifier_option']
@@ -99,6 +152,47 @@ class OrderItemModifier(models.Model):
     def __str__(self):
         return f"{self.quantity}x {self.modifier_option.name} for OrderItem {self.order_item.id}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.order_item_id:
+            self.created_at = self.order_item.created_at
+        super().save(*args, **kwargs)
+
     @property
     def total_price(self):
-        return self.quantity * self.price_adjustment
\ No newline at end of file
+        return adjustment_total(self.price_adjustment, self.quantity)
+
+
+class OrderTombstone(models.Model):
+    """
+    A deleted order, recorded by a database trigger so the kitchen board's
+    change cursor can report it as removed (see orders.board)
+    """
+    order_id = models.BigIntegerField()
+    change_xid = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['change_xid'], name='idx_order_tombstone_xid'),
+            models.Index(fields=['deleted_at'], name='idx_order_tombstone_deleted'),
+        ]
+
+    def __str__(self):
+        return f"Deleted order {self.order_id}"
+
+
+class OrderStatsCounter(models.Model):
+    """
+    Dashboard counters for the current tenant, updated as orders change
+    (see orders.stats). A single row per schema; the day fields reset when
+    `date` rolls over.
+    """
+    date = models.DateField()
+    orders_today = models.PositiveIntegerField(default=0)
+    orders_completed_today = models.PositiveIntegerField(default=0)
+    revenue_today = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    active_orders = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Order stats for {self.date}"
@@ -0,0 +1,278 @@
+"""
+Monthly partitioning of a tenant's order tables (opt-in, ORDER_PARTITIONING).
+
+partition_order_tables() turns orders_order, orders_orderitem and
+orders_orderitemmodifier into tables range-partitioned by created_at,
+one partition per month plus a default one, and copies the existing rows
+across (one transaction per schema; run it in a quiet period). Lines and
+modifiers carry their order's created_at, so an order and its lines share
+a month and are detached together, and line lookups that also match on
+created_at (OrderItem.partition_key) are pruned to that month. After that
+ensure_partitions() keeps the coming months created ahead of time and
+detach_partitions() detaches months older than the retention window, so
+the board, kitchen lists and every index scan only walk recent partitions.
+Detached months stay in the schema as ordinary tables
+(e.g. orders_order_p2025_01) to archive or drop.
+
+Postgres requires unique keys of a partitioned table to include the
+partition key, so the conversion:
+- makes the primary keys (id, created_at) and appends created_at to the
+  other unique constraints (order_item/modifier_option becomes unique per
+  timestamp; the cart validation in store.modifiers is the real guard);
+- keeps Order.idempotency_key unique across partitions in a plain table,
+  orders_order_idempotency, maintained by a trigger (IDEMPOTENCY_SQL), so
+  a reused key still fails the INSERT as it did before;
+- drops the foreign keys that point at the three tables (order lines to
+  orders, modifiers to lines, loyalty transactions to orders). Django
+  still cascades deletes itself.
+Later migrations that add a unique constraint without created_at will
+fail on converted schemas.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django_tenants.utils import get_public_schema_name, schema_context
+
+# Parents before children, so rows are copied in dependency order
+ORDER_TABLES = ('orders_order', 'orders_orderitem', 'orders_orderitemmodifier')
+PARTITION_KEY = 'created_at'
+DEFAULT_MONTHS_AHEAD = 3
+
+# (idempotency_key, created_at) no longer stops a second order with the
+# same key, so the keys get a table of their own
+IDEMPOTENCY_SQL = [
+    'CREATE TABLE orders_order_idempotency AS '
+    'SELECT idempotency_key, id AS order_id FROM orders_order WHERE idempotency_key IS NOT NULL',
+    'ALTER TABLE orders_order_idempotency ADD PRIMARY KEY (idempotency_key)',
+    'CREATE OR REPLACE FUNCTION orders_order_claim_idempotency_key() RETURNS trigger AS $$ '
+    "BEGIN IF TG_OP <> 'INSERT' AND OLD.idempotency_key IS NOT NULL THEN "
+    'DELETE FROM orders_order_idempotency WHERE idempotency_key = OLD.idempotency_key; END IF; '
+    "IF TG_OP <> 'DELETE' AND NEW.idempotency_key IS NOT NULL THEN "
+    'INSERT INTO orders_order_idempotency VALUES (NEW.idempotency_key, NEW.id); END IF; '
+    'RETURN NULL; END '
+    '$$ LANGUAGE plpgsql',
+    'CREATE TRIGGER orders_order_idempotency AFTER INSERT OR UPDATE OF idempotency_key OR DELETE '
+    'ON orders_order FOR EACH ROW EXECUTE FUNCTION orders_order_claim_idempotency_key()',
+]
+
+
+def months_ahead():
+    return getattr(settings, 'ORDER_PARTITION_MONTHS_AHEAD', DEFAULT_MONTHS_AHEAD)
+
+
+def retention_months():
+    """Months of partitions to keep attached; None keeps them all"""
+    return getattr(settings, 'ORDER_PARTITION_RETENTION_MONTHS', None)
+
+
+def month_start(value, offset=0):
+    """Start of the (local) month `offset` months from the one `value` is in"""
+    value = timezone.localtime(value)
+    index = value.year * 12 + value.month - 1 + offset
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def partition_name(table, start):
+    return f'{table}_p{start.year}_{start.month:02d}'
+
+
+def is_partitioned(table='orders_order'):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [table])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def partitions(table):
+    """Names of the partitions currently attached to `table`"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass ORDER BY c.relname',
+            [table],
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def _create_partition(cursor, table, start):
+    end = month_start(start, 1)
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS {partition_name(table, start)} PARTITION OF {table} '
+        'FOR VALUES FROM (%s) TO (%s)',
+        [start, end],
+    )
+
+
+def _table_ddl(cursor, table):
+    """The constraints, indexes and triggers to recreate on the partitioned table"""
+    cursor.execute(
+        'SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint '
+        "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f') "
+        'AND NOT (contype = %s AND confrelid = ANY(%s::regclass[]))',
+        [table, 'f', list(ORDER_TABLES)],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        'SELECT c.relname, i.indisunique, pg_get_indexdef(i.indexrelid) FROM pg_index i '
+        'JOIN pg_class c ON c.oid = i.indexrelid WHERE i.indrelid = %s::regclass '
+        'AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)',
+        [table],
+    )
+    indexes = cursor.fetchall()
+    unique = [name for name, is_unique, _ in indexes if is_unique]
+    if unique:
+        raise ValueError(f'{table} has unique indexes without the partition key: {unique}')
+    cursor.execute(
+        'SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger '
+        'WHERE tgrelid = %s::regclass AND NOT tgisinternal',
+        [table],
+    )
+    triggers = cursor.fetchall()
+    return constraints, indexes, triggers
+
+
+def partition_order_tables(ahead=None, now=None):
+    """
+    Convert the current schema's order tables to monthly partitions.
+    Returns False if they already are.
+    """
+    if is_partitioned():
+        return False
+    ahead = months_ahead() if ahead is None else ahead
+    now = now or timezone.now()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # ALTER TABLE refuses to run with deferred FK checks still pending
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        ddl = {table: _table_ddl(cursor, table) for table in ORDER_TABLES}
+
+        cursor.execute(
+            'SELECT conrelid::regclass::text, conname FROM pg_constraint '
+            "WHERE contype = 'f' AND confrelid = ANY(%s::regclass[])",
+            [list(ORDER_TABLES)],
+        )
+        for referencing, name in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT {name}')
+
+        for table in ORDER_TABLES:
+            constraints, indexes, triggers = ddl[table]
+            old = f'{table}_unpartitioned'
+            # Free the schema-wide index names for the new table
+            for name, contype, _ in constraints:
+                if contype in ('p', 'u'):
+                    cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+            for name, _, _ in indexes:
+                cursor.execute(f'DROP INDEX {name}')
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {old}')
+            cursor.execute(
+                f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING IDENTITY '
+                f'INCLUDING CONSTRAINTS INCLUDING STORAGE) PARTITION BY RANGE ({PARTITION_KEY})'
+            )
+
+            for name, contype, definition in constraints:
+                if contype in ('p', 'u'):
+                    definition = definition.replace(')', f', {PARTITION_KEY})', 1)
+                cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+            # The definitions name the table as `table`, which is now the new one
+            for _, _, definition in indexes:
+                cursor.execute(definition)
+            for _, definition in triggers:
+                cursor.execute(definition)
+
+            cursor.execute(f'SELECT min({PARTITION_KEY}) FROM {old}')
+            oldest = cursor.fetchone()[0] or now
+            start, last = month_start(oldest), month_start(now, ahead)
+            while start <= last:
+                _create_partition(cursor, table, start)
+                start = month_start(start, 1)
+            cursor.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+            cursor.execute(f'INSERT INTO {table} OVERRIDING SYSTEM VALUE SELECT * FROM {old}')
+            cursor.execute(f'DROP TABLE {old}')
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+            sequence = cursor.fetchone()[0]
+            if sequence:
+                cursor.execute(
+                    f'SELECT setval(%s, coalesce((SELECT max(id) FROM {table}), 0) + 1, false)', [sequence]
+                )
+                # LIKE had to pick a new name while the old table held the original
+                if sequence.rpartition('.')[2] != f'{table}_id_seq':
+                    cursor.execute(f'ALTER SEQUENCE {sequence} RENAME TO {table}_id_seq')
+
+        for sql in IDEMPOTENCY_SQL:
+            cursor.execute(sql)
+    return True
+
+
+def ensure_partitions(ahead=None, now=None):
+    """Create the partitions for this month and `ahead` more; returns their names"""
+    ahead = months_ahead() if ahead is None else ahead
+    start = month_start(now or timezone.now())
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table in ORDER_TABLES:
+            existing = set(partitions(table))
+            for offset in range(ahead + 1):
+                month = month_start(start, offset)
+                if partition_name(table, month) not in existing:
+                    _create_partition(cursor, table, month)
+                    created.append(partition_name(table, month))
+    return created
+
+
+def detach_partitions(retain, now=None):
+    """
+    Detach the partitions of months that ended more than `retain` months
+    before the current one; returns their names
+    """
+    cutoff = month_start(now or timezone.now(), -retain)
+    detached = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table in ORDER_TABLES:
+            for name in partitions(table):
+                suffix = name[len(table):]
+                if not suffix.startswith('_p'):
+                    continue
+                year, month = suffix[2:].split('_')
+                if month_start(timezone.make_aware(datetime(int(year), int(month), 1)), 1) <= cutoff:
+                    cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+                    detached.append(name)
+    return detached
+
+
+def order_schemas():
+    """Tenant schemas that have order tables"""
+    from customers.models import Client
+
+    schemas = list(Client.objects.exclude(schema_name=get_public_schema_name()).values_list('schema_name', flat=True))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT table_schema FROM information_schema.tables WHERE table_name = %s AND table_schema = ANY(%s)',
+            ['orders_order', schemas],
+        )
+        found = {schema for schema, in cursor.fetchall()}
+    return [schema for schema in schemas if schema in found]
+
+
+def maintain_all_schemas(schemas=None, ahead=None, retain=None, convert=True, now=None):
+    """
+    Schedulable entry point: for each schema (default: order_schemas()),
+    convert it if needed and `convert`, create partitions ahead and detach
+    those past `retain` months. Returns {schema_name: {'converted',
+    'created', 'detached'}}; schemas left unpartitioned are skipped.
+    """
+    retain = retention_months() if retain is None else retain
+    results = {}
+    for schema_name in schemas or order_schemas():
+        with schema_context(schema_name):
+            converted = convert and partition_order_tables(ahead, now)
+            if not is_partitioned():
+                continue
+            results[schema_name] = {
+                'converted': converted,
+                'created': ensure_partitions(ahead, now),
+                'detached': detach_partitions(retain, now) if retain is not None else [],
+            }
+    return results
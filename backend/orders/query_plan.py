@@ -0,0 +1,181 @@
+"""
+Query plans derived from serializers.
+
+A serializer using QueryPlanMixin builds the queryset it needs from its
+own fields: a dotted `source` such as 'table.name' becomes
+select_related('table'), a nested `many=True` serializer becomes a
+Prefetch whose queryset is planned from the nested serializer, and model
+columns are loaded with .only(). Fields computed from other attributes
+(properties, method fields) declare what they read in Meta.requires as
+ORM paths, e.g. {'total_price': ['quantity', 'modifiers__price_adjustment']}.
+Models whose rows share their parent's partition key name it in a
+`partition_key` attribute, and their prefetches match on it as well.
+
+Serializers also take `fields=` (dotted for nested serializers, e.g.
+['id', 'items.item_name']) to narrow their output; the plan then covers
+only the remaining fields. QueryPlanViewMixin wires both into a view: the
+queryset is planned from get_serializer() and ?fields=id,status,items.quantity
+is passed through, so listing N orders runs a fixed number of queries.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+
+
+class _Plan:
+    """Columns, select_related paths and reverse relations for one model"""
+
+    def __init__(self, model):
+        self.model = model
+        self.only = {model._meta.pk.name}
+        self.related = set()
+        # {lookup: [nested serializer or None, [paths]]}
+        self.prefetch = {}
+
+    def add(self, path, prefix='', model=None):
+        model = model or self.model
+        name, _, rest = path.partition('__')
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # A property or method; its needs come from Meta.requires
+            return
+        lookup = prefix + field.name
+        if field.many_to_many or field.one_to_many:
+            entry = self.prefetch.setdefault(lookup, [None, []])
+            if rest:
+                entry[1].append(rest)
+        elif field.is_relation:
+            if field.concrete:
+                self.only.add(lookup)
+            if rest:
+                self.related.add(lookup)
+                self.add(rest, lookup + '__', field.related_model)
+        else:
+            self.only.add(prefix + name)
+
+    def add_serializer(self, serializer, prefix='', model=None):
+        """Add what each of the serializer's readable fields reads"""
+        requires = getattr(serializer.Meta, 'requires', {})
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            for path in requires.get(name, ()):
+                self.add(path, prefix, model)
+            if field.source == '*':
+                continue
+            path = field.source.replace('.', '__')
+            if isinstance(field, serializers.ListSerializer) and isinstance(field.child, QueryPlanMixin):
+                self.add(path, prefix, model)
+                self.prefetch[prefix + path][0] = field.child
+            elif isinstance(field, QueryPlanMixin):
+                relation = (model or self.model)._meta.get_field(path)
+                if relation.concrete:
+                    self.only.add(prefix + path)
+                self.related.add(prefix + path)
+                self.add_serializer(field, prefix + path + '__', relation.related_model)
+            else:
+                self.add(path, prefix, model)
+
+    def apply(self, queryset, columns=True):
+        if self.related:
+            queryset = queryset.select_related(*sorted(self.related))
+        if columns:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset.prefetch_related(*[
+            Prefetch(lookup, queryset=self._prefetch_queryset(lookup, child, paths, columns))
+            for lookup, (child, paths) in sorted(self.prefetch.items())
+        ])
+
+    def _prefetch_queryset(self, lookup, child, paths, columns):
+        model = self.model
+        for name in lookup.split('__'):
+            relation = model._meta.get_field(name)
+            model = relation.related_model
+        plan = _Plan(model)
+        queryset = model._default_manager.all()
+        if relation.one_to_many:
+            # The prefetcher matches rows to their parent by this column
+            plan.only.add(relation.field.attname)
+            key = getattr(model, 'partition_key', None)
+            if key:
+                # Rows share their parent's partition key; matching on it
+                # too lets Postgres skip the other partitions
+                queryset = queryset.filter(**{key: F(f'{relation.field.name}__{key}')})
+        if child is not None:
+            plan.add_serializer(child)
+        for path in paths:
+            plan.add(path)
+        return plan.apply(queryset, columns)
+
+
+class QueryPlanMixin:
+    """
+    For ModelSerializers: plan_queryset() from the fields, and a `fields`
+    argument to narrow them (see module docstring)
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            self.project(fields)
+
+    def project(self, fields):
+        """Keep only `fields`; 'items.quantity' narrows the nested `items` serializer"""
+        nested = {}
+        for path in fields:
+            name, _, rest = path.partition('.')
+            nested.setdefault(name, [])
+            if rest:
+                nested[name].append(rest)
+
+        unknown = set(nested) - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({FIELDS_PARAM: f'Unknown fields: {sorted(unknown)}'})
+        for name in list(self.fields):
+            if name not in nested:
+                self.fields.pop(name)
+            elif nested[name]:
+                field = self.fields[name]
+                child = getattr(field, 'child', field)
+                if not isinstance(child, QueryPlanMixin):
+                    raise serializers.ValidationError({FIELDS_PARAM: f'{name} has no nested fields'})
+                child.project(nested[name])
+
+    def plan_queryset(self, queryset, columns=True):
+        """
+        `queryset` with the select_related, Prefetch and (with `columns`)
+        .only() calls these fields need
+        """
+        plan = _Plan(queryset.model)
+        plan.add_serializer(self)
+        return plan.apply(queryset, columns)
+
+
+def requested_fields(request):
+    """The ?fields= projection as a list, or None for every field"""
+    value = request.query_params.get(FIELDS_PARAM)
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class QueryPlanViewMixin:
+    """
+    For GenericAPIViews whose serializer uses QueryPlanMixin: reads plan
+    their columns and relations from the (projected) serializer, writes
+    only their relations.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request is not None and self.request.method in SAFE_METHODS:
+            kwargs.setdefault('fields', requested_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        columns = self.request.method in SAFE_METHODS
+        return self.get_serializer().plan_queryset(queryset, columns=columns)
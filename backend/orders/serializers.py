@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from .models import Order, OrderItem, OrderItemModifier
+from .query_plan import QueryPlanMixin
 
 
-class OrderItemModifierSerializer(serializers.ModelSerializer):
+class OrderItemModifierSerializer(QueryPlanMixin, serializers.ModelSerializer):
     modifier_name = serializers.CharField(source='modifier_option.name', read_only=True)
     price_adjustment = serializers.DecimalField(max_digits=6, decimal_places=2, read_only=True)
 
@@ -10,9 +11,10 @@ class OrderItemModifierSerializer(serializers.ModelSerializer):
         model = OrderItemModifier
         fields = ['modifier_option_id', 'modifier_name', 'quantity', 'price_adjustment', 'total_price']
         read_only_fields = ['price_adjustment', 'total_price']
+        requires = {'total_price': ['quantity', 'price_adjustment']}
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(QueryPlanMixin, serializers.ModelSerializer):
     item_name = serializers.CharField(source='item.name', read_only=True)
     item_description = serializers.CharField(source='item.description', read_only=True)
     modifiers = OrderItemModifierSerializer(many=True, read_only=True)
@@ -25,9 +27,12 @@ class OrderItemSerializer(serializers.ModelSerializer):
             'unit_price', 'special_instructions', 'modifiers', 'total_price'
         ]
         read_only_fields = ['unit_price', 'total_price']
+        requires = {
+            'total_price': ['quantity', 'unit_price', 'modifiers__quantity', 'modifiers__price_adjustment'],
+        }
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(QueryPlanMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     table_name = serializers.CharField(source='table.name', read_only=True)
     qr_code_str = serializers.CharField(source='qr_code.code', read_only=True)
@@ -38,9 +43,10 @@ class OrderSerializer(serializers.ModelSerializer):
             'id', 'customer_name', 'customer_phone', 'total_amount',
             'status', 'payment_status', 'payment_method',
             'delivery_address', 'table_name', 'qr_code_str',
-            'special_instructions', 'items', 'created_at', 'updated_at'
+            'special_instructions', 'items', 'version', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        # Status only changes through the status endpoints (orders.transitions)
+        read_only_fields = ['status', 'version', 'created_at', 'updated_at']
 
 
 class OrderStatusUpdateSerializer(serializers.Serializer):
@@ -50,6 +56,21 @@ class OrderStatusUpdateSerializer(serializers.Serializer):
         required=False,
         allow_null=True
     )
+    version = serializers.IntegerField(
+        required=False, min_value=0, help_text="Order version the change is based on"
+    )
+
+
+class BulkOrderStatusSerializer(serializers.Serializer):
+    """Move the orders of a table, or the given orders, to one status"""
+    status = serializers.ChoiceField(choices=Order.ORDER_STATUS_CHOICES)
+    table = serializers.IntegerField(required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if 'table' not in attrs and 'ids' not in attrs:
+            raise serializers.ValidationError('Give a table or a list of order ids')
+        return attrs
 
 
 class OrderStatsSerializer(serializers.Serializer):
@@ -59,6 +80,18 @@ class OrderStatsSerializer(serializers.Serializer):
     active_orders = serializers.IntegerField()
 
 
+class CheckoutModifierSerializer(serializers.Serializer):
+    modifier_option_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    item_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+    special_instructions = serializers.CharField(allow_blank=True, default='')
+    modifiers = CheckoutModifierSerializer(many=True, default=list)
+
+
 class PublicOrderSerializer(serializers.ModelSerializer):
     """Serializer for creating orders from cart (public API)"""
     items = serializers.ListField(
@@ -68,43 +101,62 @@ class PublicOrderSerializer(serializers.ModelSerializer):
         help_text="List of cart items with modifiers"
     )
 
+    # Statements issued by create() for any cart with modifiers, with a warm
+    # store.pricing table (see create)
+    CREATE_QUERY_COUNT = 5
+
     class Meta:
         model = Order
         fields = [
             'customer_name', 'customer_phone', 'total_amount',
             'delivery_address', 'special_instructions', 'items'
         ]
+        # Priced from the items in create()
+        extra_kwargs = {'total_amount': {'required': False}}
 
-    def create(self, validated_data):
-        items_data = validated_data.pop('items')
-
-        # Create order
-        order = Order.objects.create(**validated_data)
+    def validate_items(self, value):
+        """Type-check each line and its modifiers (see CheckoutItemSerializer)"""
+        serializer = CheckoutItemSerializer(data=value, many=True)
+        if not serializer.is_valid():
+            raise serializers.ValidationError(serializer.errors)
+        return serializer.validated_data
 
-        # Create order items from cart items
+    def create(self, validated_data):
+        """
+        Materialise the order through orders.checkout with a fixed number of
+        statements, whatever the cart size: one SELECT for items, one for
+        modifier options (skipped when there are none), then one INSERT each
+        for the order, its lines and the line modifiers. Pass the snapshot
+        as context['checkout_lines'] to skip the two SELECTs.
+        """
         from store.models import Item, ModifierOption
-        for item_data in items_data:
-            item = Item.objects.get(id=item_data['item_id'])
-            order_item = OrderItem.objects.create(
-                order=order,
-                item=item,
-                quantity=item_data.get('quantity', 1),
-                unit_price=item.price,
-                special_instructions=item_data.get('special_instructions', '')
-            )
-
-            # Add modifiers
-            for modifier_data in item_data.get('modifiers', []):
-                modifier_option = ModifierOption.objects.get(id=modifier_data['modifier_option_id'])
-                OrderItemModifier.objects.create(
-                    order_item=order_item,
-                    modifier_option=modifier_option,
-                    quantity=modifier_data.get('quantity', 1),
-                    price_adjustment=modifier_option.price_adjustment
-                )
+        from .checkout import CheckoutError, materialise, price, snapshot, validate
 
-        # Recalculate total amount
-        order.total_amount = sum(item.total_price for item in order.items.all())
-        order.save()
+        items_data = validated_data.pop('items')
+        lines = self.context.get('checkout_lines')
+        try:
+            if lines is None:
+                raw_lines = [
+                    (
+                        item_data['item_id'],
+                        item_data['quantity'],
+                        item_data['special_instructions'],
+                        [
+                            (modifier_data['modifier_option_id'], modifier_data['quantity'])
+                            for modifier_data in item_data['modifiers']
+                        ],
+                    )
+                    for item_data in items_data
+                ]
+                option_ids = {option_id for _, _, _, modifiers in raw_lines for option_id, _ in modifiers}
+                lines = snapshot(
+                    raw_lines,
+                    Item.objects.in_bulk({item_id for item_id, _, _, _ in raw_lines}),
+                    ModifierOption.objects.in_bulk(option_ids) if option_ids else {},
+                )
+            validate(lines)
+        except CheckoutError as e:
+            raise serializers.ValidationError({'items': e.errors})
 
-        return order
\ No newline at end of file
+        validated_data['total_amount'] = price(lines)
+        return materialise(lines, **validated_data)
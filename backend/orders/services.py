@@ -3,6 +3,7 @@ from datetime import datetime
 import random
 import uuid
 from django.db import transaction
+from django.db.models import Case, F, Value, When
 from django.utils import timezone
 from .models import Order
 from customers.models import Customer, Membership, LoyaltyTransaction
@@ -209,4 +210,38 @@ class PaymentService:
             'status': 'completed',  # Always completed in mock
             'timestamp': timezone.now().isoformat(),
             'message': 'Payment completed successfully'
-        }
\ No newline at end of file
+        }
+
+
+def award_completion_points(orders):
+    """
+    Credit the store customer with each order's phone 1 point per 10
+    currency units, for orders that have just been completed. Customers are
+    created as needed and credited with one INSERT and one UPDATE however
+    many orders there are; errors are reported, never raised.
+    """
+    from store.models import Customer as StoreCustomer
+
+    points, names = {}, {}
+    for order in orders:
+        if not order.customer_phone:
+            continue
+        points[order.customer_phone] = points.get(order.customer_phone, 0) + int(order.total_amount / 10)
+        names.setdefault(order.customer_phone, order.customer_name)
+    if not points:
+        return
+
+    try:
+        with transaction.atomic():
+            StoreCustomer.objects.bulk_create(
+                [StoreCustomer(phone=phone, name=names[phone]) for phone in points], ignore_conflicts=True
+            )
+            StoreCustomer.objects.filter(phone__in=list(points)).update(
+                points=F('points') + Case(
+                    *[When(phone=phone, then=Value(earned)) for phone, earned in points.items()],
+                    default=Value(0),
+                ),
+                updated_at=timezone.now(),
+            )
+    except Exception as e:
+        print(f"Error adding points: {e}")
@@ -0,0 +1,47 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Order
+from .stats import record_status_change, record_status_changes
+
+# Sent after an order is created, changes status or is deleted, with
+# `order`, `old_status` (None when created) and `new_status` (None when
+# deleted). Rollups outside this app subscribe to it.
+order_status_changed = Signal()
+
+# Sent once for a batch of status changes made in one statement (see
+# orders.transitions.bulk_transition), with `changes`: a list of
+# (order, old_status, new_status). Receivers should fold them in one go.
+order_statuses_changed = Signal()
+
+
+def order_changed(order, old_status, new_status):
+    if old_status == new_status:
+        return
+    record_status_change(old_status, new_status, order.total_amount, order.created_at)
+    order_status_changed.send(sender=Order, order=order, old_status=old_status, new_status=new_status)
+
+
+def orders_changed(changes):
+    """Report a batch of (order, old_status, new_status) changes"""
+    changes = [change for change in changes if change[1] != change[2]]
+    if not changes:
+        return
+    record_status_changes([
+        (old_status, new_status, order.total_amount, order.created_at) for order, old_status, new_status in changes
+    ])
+    order_statuses_changed.send(sender=Order, changes=changes)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    if created:
+        order_changed(instance, None, instance.status)
+    elif hasattr(instance, '_loaded_status'):
+        order_changed(instance, instance._loaded_status, instance.status)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    order_changed(instance, instance.status, None)
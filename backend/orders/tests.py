@@ -1,12 +1,35 @@
 from decimal import Decimal
+from unittest import mock
 from datetime import datetime, timedelta
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
-from django.db import transaction
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from customers.models import Client, Domain, Customer, Membership, LoyaltyTransaction
-from orders.models import Order, OrderItem, OrderItemModifier
-from orders.services import PaymentService
+from orders.models import Order, OrderItem, OrderItemModifier, OrderStatsCounter, OrderTombstone
+from orders import idempotency
+from orders.board import ACTIVE_STATUSES, board_rows, install_change_trigger, read_board
+from orders.checkout import CHECKOUT_QUERY_BUDGET
+from orders.events import OrderEventDispatcher, order_events
+from orders.partitions import (
+    ORDER_TABLES, detach_partitions, ensure_partitions, is_partitioned, month_start, partition_name,
+    partition_order_tables, partitions,
+)
+from orders.serializers import OrderSerializer, PublicOrderSerializer
+from orders.services import PaymentService, award_completion_points
+from orders.stats import compute_order_stats, read_order_stats, rebuild_order_stats
+from orders.transitions import InvalidTransition, StaleOrder, apply_change, bulk_transition
+from orders.views import (
+    KitchenBoardView, OrderBulkStatusView, OrderStatusUpdateView, OrderViewSet, PublicOrderCreateView,
+    send_bulk_order_update
+)
+from rest_framework.test import APIRequestFactory, force_authenticate
+from django.contrib.auth import get_user_model
+from store.cart_store import DatabaseCartStore, get_cart_store
+from store.pricing import get_price_table
 from store.models import Category, Item, ModifierGroup, ModifierOption, Table
+from store.models import Customer as StoreCustomer
 
 
 class OrderModelTests(TestCase):
@@ -740,4 +763,979 @@ class MultiTenantOrderTests(TestCase):
             session_id=session_id
         )
         
-        self.assertEqual(order.session_id, session_id)
\ No newline at end of file
+        self.assertEqual(order.session_id, session_id)
+
+
+class PublicOrderSerializerTests(TestCase):
+    """Test cases for order materialisation from cart data"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.category = Category.objects.create(name='Main Course')
+        self.items = [
+            Item.objects.create(category=self.category, name=f'Dish {i}', price=Decimal('100.00'))
+            for i in range(10)
+        ]
+        group = ModifierGroup.objects.create(item=self.items[0], name='Extras', max_selection=2)
+        self.options = [
+            ModifierOption.objects.create(group=group, name='Cheese', price_adjustment=Decimal('15.00')),
+            ModifierOption.objects.create(group=group, name='Egg', price_adjustment=Decimal('10.00')),
+        ]
+
+    def _order_data(self, lines):
+        return {
+            'customer_name': 'John Doe',
+            'customer_phone': '0812345678',
+            'total_amount': Decimal('0.00'),
+            'items': [
+                {
+                    'item_id': item.id,
+                    'quantity': 2,
+                    'special_instructions': '',
+                    'modifiers': [
+                        {'modifier_option_id': option.id, 'quantity': 1} for option in self.options
+                    ]
+                }
+                for item in lines
+            ]
+        }
+
+    def _create(self, lines):
+        serializer = PublicOrderSerializer(data=self._order_data(lines))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.save()
+
+    def test_create_order_with_lines_and_modifiers(self):
+        """Test lines, modifiers and price snapshots are written"""
+        order = self._create(self.items[:3])
+
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(OrderItemModifier.objects.filter(order_item__order=order).count(), 6)
+        # 3 lines of 2 x 100.00, each with 15.00 + 10.00 of modifiers
+        self.assertEqual(order.total_amount, Decimal('675.00'))
+        modifier = OrderItemModifier.objects.get(order_item__order=order, order_item__item=self.items[0],
+                                                 modifier_option=self.options[0])
+        self.assertEqual(modifier.price_adjustment, Decimal('15.00'))
+
+    def test_create_query_count_independent_of_cart_size(self):
+        """Test materialisation uses the same number of queries for 1 or 10 lines"""
+        get_price_table([item.pk for item in self.items], [option.pk for option in self.options])
+        # +2 for the savepoint and release around the test's outer transaction
+        expected = PublicOrderSerializer.CREATE_QUERY_COUNT + 2
+        with self.assertNumQueries(expected):
+            self._create(self.items[:1])
+        with self.assertNumQueries(expected):
+            self._create(self.items)
+
+    def test_create_rejects_unknown_item(self):
+        """Test unknown items fail validation without writing an order"""
+        data = self._order_data(self.items[:1])
+        data['items'][0]['item_id'] = 999999
+        serializer = PublicOrderSerializer(data=data)
+        self.assertTrue(serializer.is_valid())
+
+        from rest_framework.exceptions import ValidationError
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        self.assertFalse(Order.objects.exists())
+
+    def test_malformed_items_are_invalid(self):
+        """Test non-integer ids and quantities fail validation instead of reaching create"""
+        for field, value in [('item_id', 'abc'), ('quantity', 0)]:
+            data = self._order_data(self.items[:1])
+            data['items'][0][field] = value
+            serializer = PublicOrderSerializer(data=data)
+            self.assertFalse(serializer.is_valid())
+            self.assertIn(field, serializer.errors['items'][0])
+
+        data = self._order_data(self.items[:1])
+        data['items'][0]['modifiers'][0]['modifier_option_id'] = 'abc'
+        serializer = PublicOrderSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('modifier_option_id', serializer.errors['items'][0]['modifiers'][0])
+
+        serializer = PublicOrderSerializer(data={**self._order_data([]), 'items': [{'quantity': 1}]})
+        self.assertFalse(serializer.is_valid())
+        self.assertFalse(Order.objects.exists())
+
+
+class RecordingChannelLayer:
+    """Channel layer stand-in that records group_send calls"""
+
+    def __init__(self, fail=False, delay=0):
+        self.sent = []
+        self.fail = fail
+        self.delay = delay
+
+    async def group_send(self, group, message):
+        import asyncio
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError('channel layer unavailable')
+        self.sent.append((group, message))
+
+
+class OrderEventDispatcherTests(TestCase):
+    """Test cases for the background order event dispatcher"""
+
+    def test_publish_is_delivered_in_order_per_group(self):
+        """Test events reach their group in the order they were published"""
+        layer = RecordingChannelLayer()
+        dispatcher = OrderEventDispatcher(channel_layer=layer)
+
+        for i in range(5):
+            dispatcher.publish('orders_pizza', {'type': 'order_update', 'seq': i})
+        dispatcher.publish('orders_sushi', {'type': 'order_update', 'seq': 0})
+        self.assertTrue(dispatcher.flush())
+
+        pizza = [message['seq'] for group, message in layer.sent if group == 'orders_pizza']
+        self.assertEqual(pizza, [0, 1, 2, 3, 4])
+        metrics = dispatcher.metrics()
+        self.assertEqual(metrics['published'], 6)
+        self.assertEqual(metrics['queue_depth'], 0)
+
+    def test_message_values_normalised(self):
+        """Test Decimal values are converted before reaching the layer"""
+        layer = RecordingChannelLayer()
+        dispatcher = OrderEventDispatcher(channel_layer=layer)
+
+        dispatcher.publish('orders_pizza', {'type': 'order_update', 'total': Decimal('12.50')})
+        dispatcher.flush()
+
+        self.assertEqual(layer.sent[0][1]['total'], 12.5)
+
+    def test_failed_publish_is_counted(self):
+        """Test channel layer errors are counted, not raised"""
+        dispatcher = OrderEventDispatcher(channel_layer=RecordingChannelLayer(fail=True))
+
+        self.assertTrue(dispatcher.publish('orders_pizza', {'type': 'order_update'}))
+        dispatcher.flush()
+
+        self.assertEqual(dispatcher.metrics()['failed'], 1)
+
+    def test_full_queue_drops_without_blocking(self):
+        """Test a stalled channel layer makes publish drop instead of wait"""
+        dispatcher = OrderEventDispatcher(
+            max_queue_size=1, batch_size=1, channel_layer=RecordingChannelLayer(delay=0.2)
+        )
+
+        results = [dispatcher.publish('orders_pizza', {'seq': i}) for i in range(5)]
+
+        self.assertIn(False, results)
+        self.assertGreater(dispatcher.metrics()['dropped'], 0)
+        dispatcher.flush()
+
+    def test_view_publish_failure_is_logged(self):
+        """Test a failing publish from a view is logged with its traceback, not raised"""
+        request = APIRequestFactory().post('/api/orders/bulk-status/')
+        with mock.patch.object(order_events, 'publish', side_effect=RuntimeError('layer down')), \
+                self.assertLogs('orders.views', level='ERROR') as logs:
+            send_bulk_order_update(request, 'ready', [1])
+
+        self.assertIn('Failed to send websocket update', logs.output[0])
+        self.assertIn('RuntimeError: layer down', logs.output[0])
+
+
+class OrderStatsTests(TestCase):
+    """Test cases for dashboard stats aggregation and counters"""
+
+    def setUp(self):
+        """Set up orders across today and yesterday"""
+        yesterday = timezone.now() - timedelta(days=1)
+        for status, amount in [('pending', '100.00'), ('preparing', '50.00'),
+                               ('completed', '200.00'), ('completed', '300.00'),
+                               ('cancelled', '80.00')]:
+            Order.objects.create(customer_name='Guest', total_amount=Decimal(amount), status=status)
+
+        old_active = Order.objects.create(customer_name='Guest', total_amount=Decimal('40.00'))
+        old_completed = Order.objects.create(
+            customer_name='Guest', total_amount=Decimal('999.00'), status='completed'
+        )
+        Order.objects.filter(pk__in=[old_active.pk, old_completed.pk]).update(created_at=yesterday)
+
+    def assertStats(self, stats, orders, completed, revenue, active):
+        self.assertEqual(stats['orders_today'], orders)
+        self.assertEqual(stats['orders_completed_today'], completed)
+        self.assertEqual(stats['revenue_today'], Decimal(revenue))
+        self.assertEqual(stats['active_orders'], active)
+
+    def test_compute_order_stats_single_query(self):
+        """Test all four figures come from one query"""
+        with self.assertNumQueries(1):
+            stats = compute_order_stats()
+
+        self.assertStats(stats, 5, 2, '500.00', 3)
+
+    def test_compute_order_stats_empty(self):
+        """Test revenue is zero rather than None with no orders"""
+        Order.objects.all().delete()
+
+        self.assertStats(compute_order_stats(), 0, 0, '0.00', 0)
+
+    @override_settings(ORDER_STATS_COUNTERS=True)
+    def test_counter_row_tracks_changes(self):
+        """Test the counter row follows creates, transitions and deletes"""
+        self.assertStats(read_order_stats(), 5, 2, '500.00', 3)
+
+        order = Order.objects.create(customer_name='Guest', total_amount=Decimal('70.00'))
+        self.assertStats(read_order_stats(), 6, 2, '500.00', 4)
+
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'completed'
+        order.save()
+        self.assertStats(read_order_stats(), 6, 3, '570.00', 3)
+
+        order.status = 'cancelled'
+        order.save()
+        self.assertStats(read_order_stats(), 6, 2, '500.00', 3)
+
+        order.delete()
+        self.assertStats(read_order_stats(), 5, 2, '500.00', 3)
+        self.assertStats(read_order_stats(), *compute_order_stats().values())
+
+    @override_settings(ORDER_STATS_COUNTERS=True)
+    def test_counter_read_is_one_query(self):
+        """Test polling the counter row is a single primary-key read"""
+        read_order_stats()
+        with self.assertNumQueries(1):
+            read_order_stats()
+
+    @override_settings(ORDER_STATS_COUNTERS=True)
+    def test_counter_day_rollover(self):
+        """Test a counter row from a previous day reports only active orders"""
+        read_order_stats()
+        OrderStatsCounter.objects.filter(pk=1).update(date=timezone.localdate() - timedelta(days=1))
+
+        self.assertStats(read_order_stats(), 0, 0, '0.00', 3)
+
+
+@override_settings(CART_STORE={'BACKEND': 'store.cart_store.InMemoryCartStore'})
+class CheckoutIdempotencyTests(TestCase):
+    """Test cases for retried checkouts"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.view = PublicOrderCreateView.as_view()
+        category = Category.objects.create(name='Drinks')
+        self.item = Item.objects.create(category=category, name='Tea', price=Decimal('40.00'))
+        for session_id in ['idem-1', 'idem-2']:
+            get_cart_store().close(session_id)
+        get_cart_store().add_line('idem-1', self.item.pk, quantity=2)
+
+    def _checkout(self, key=None, session_id='idem-1', **data):
+        headers = {'HTTP_X_SESSION_ID': session_id}
+        if key:
+            headers['HTTP_IDEMPOTENCY_KEY'] = key
+        return self.view(self.factory.post('/api/orders/', {'customer_name': 'Ann', **data}, format='json', **headers))
+
+    def test_retry_with_key_replays_response(self):
+        """Test a retried key returns the first response without a new order"""
+        first = self._checkout('key-1')
+        with self.assertNumQueries(0):
+            retry = self._checkout('key-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retry_without_key_replays_session_checkout(self):
+        """Test a keyless retry after the cart closed gets the stored order"""
+        first = self._checkout()
+        retry = self._checkout()
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_not_replayed_to_other_session(self):
+        """Test another session presenting a known key doesn't get that order back"""
+        self._checkout('key-1')
+
+        # Without a cart, with one, and once only the order's key is left
+        responses = [self._checkout('key-1', 'idem-2')]
+        get_cart_store().add_line('idem-2', self.item.pk)
+        responses.append(self._checkout('key-1', 'idem-2'))
+        cache.clear()
+        responses.append(self._checkout('key-1', 'idem-2'))
+
+        self.assertEqual([response.status_code for response in responses], [404, 422, 422])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_different_request(self):
+        """Test a key can't be replayed for different order details"""
+        get_cart_store().add_line('idem-2', self.item.pk)
+        self._checkout('key-1')
+        response = self.view(self.factory.post(
+            '/api/orders/', {'customer_name': 'Bob'}, format='json',
+            HTTP_X_SESSION_ID='idem-2', HTTP_IDEMPOTENCY_KEY='key-1'
+        ))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_in_progress_key(self):
+        """Test a concurrent retry is told to wait rather than ordering twice"""
+        cart = get_cart_store().get('idem-1')
+        details = {'customer_name': 'Ann', 'customer_phone': '', 'delivery_address': '',
+                   'special_instructions': '', 'qr_code_id': ''}
+        idempotency.claim('key-1', idempotency.checkout_fingerprint('idem-1', cart, details))
+
+        response = self._checkout('key-1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_retry_after_crash_finds_order(self):
+        """Test a retry after the worker died and the stored response was lost reuses the order"""
+        with mock.patch.object(type(get_cart_store()), 'close', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self._checkout('key-1')
+        self.assertTrue(idempotency.stored_result('key-1', 'idem-1'))
+        cache.clear()
+
+        retry = self._checkout('key-1')
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(retry.data['id'], Order.objects.get().pk)
+        self.assertEqual(len(retry.data['items']), 1)
+        self.assertIsNone(get_cart_store().get('idem-1'))
+
+    def test_new_cart_is_new_checkout(self):
+        """Test the same contents in a later cart place a second order"""
+        self._checkout()
+        get_cart_store().add_line('idem-1', self.item.pk, quantity=2)
+        self._checkout()
+
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class CheckoutPipelineTests(TestCase):
+    """Test cases for the checkout pipeline and its query budget"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.view = PublicOrderCreateView.as_view()
+        category = Category.objects.create(name='Drinks')
+        self.items = [
+            Item.objects.create(category=category, name=f'Drink {i}', price=Decimal('40.00')) for i in range(10)
+        ]
+        self.options = {}
+        for item in self.items:
+            group = ModifierGroup.objects.create(item=item, name='Extras')
+            self.options[item.pk] = ModifierOption.objects.create(
+                group=group, name='Pearls', price_adjustment=Decimal('10.00')
+            )
+
+    def _fill(self, store, session_id, items):
+        for item in items:
+            store.add_line(session_id, item.pk, quantity=2, modifiers=[(self.options[item.pk].pk, 1)])
+
+    def _checkout(self, session_id):
+        return self.view(self.factory.post(
+            '/api/orders/', {'customer_name': 'Ann'}, format='json', HTTP_X_SESSION_ID=session_id
+        ))
+
+    def test_query_budget_database_store(self):
+        """Test checkout stays within the documented budget for 1 or 10 lines"""
+        store = DatabaseCartStore()
+        self._fill(store, 'small', self.items[:1])
+        self._fill(store, 'large', self.items)
+
+        # +2 for the savepoint and release around the test's outer transaction
+        with self.assertNumQueries(CHECKOUT_QUERY_BUDGET + 2):
+            response = self._checkout('small')
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(CHECKOUT_QUERY_BUDGET + 2):
+            response = self._checkout('large')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['items']), 10)
+        self.assertEqual(response.data['items'][0]['item_name'], 'Drink 0')
+        self.assertEqual(response.data['items'][0]['modifiers'][0]['modifier_name'], 'Pearls')
+        # 10 lines of 2 x 40.00 plus one 10.00 modifier each
+        self.assertEqual(Order.objects.get(pk=response.data['id']).total_amount, Decimal('900.00'))
+
+    @override_settings(CART_STORE={'BACKEND': 'store.cart_store.InMemoryCartStore'})
+    def test_query_budget_hash_store(self):
+        """Test hash-backed carts skip the close write"""
+        store = get_cart_store()
+        store.close('hashed')
+        self._fill(store, 'hashed', self.items)
+
+        with self.assertNumQueries(CHECKOUT_QUERY_BUDGET - 1 + 2):
+            response = self._checkout('hashed')
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_unavailable_item_rejected(self):
+        """Test items taken off the menu since they were added can't be ordered"""
+        store = DatabaseCartStore()
+        self._fill(store, 'stale', self.items[:2])
+        Item.objects.filter(pk=self.items[1].pk).update(is_available=False)
+
+        response = self._checkout('stale')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Drink 1', response.data['items'][0])
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderQueryPlanTests(TestCase):
+    """Test cases for serializer-planned order queries and ?fields="""
+
+    def setUp(self):
+        category = Category.objects.create(name='Main Course')
+        item = Item.objects.create(category=category, name='Pad Thai', description='Rice noodles', price=Decimal('80.00'))
+        group = ModifierGroup.objects.create(item=item, name='Spice')
+        option = ModifierOption.objects.create(group=group, name='Extra hot', price_adjustment=Decimal('5.00'))
+        table = Table.objects.create(name='Table 3')
+        for i in range(20):
+            order = Order.objects.create(customer_name=f'Guest {i}', table=table, total_amount=Decimal('170.00'))
+            for _ in range(2):
+                order_item = OrderItem.objects.create(order=order, item=item, quantity=1, unit_price=Decimal('80.00'))
+                OrderItemModifier.objects.create(
+                    order_item=order_item, modifier_option=option, price_adjustment=Decimal('5.00')
+                )
+        self.factory = APIRequestFactory()
+        self.user = get_user_model().objects.create_user(username='staff', password='pass12345')
+        self.view = OrderViewSet.as_view({'get': 'list'})
+
+    def _list(self, **params):
+        request = self.factory.get('/api/orders/', params)
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def test_list_runs_fixed_queries(self):
+        """Test listing orders with lines, items, modifiers and table costs three queries"""
+        with self.assertNumQueries(3):
+            response = self._list()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 20)
+        row = response.data[0]
+        self.assertEqual(row['table_name'], 'Table 3')
+        self.assertEqual(row['items'][0]['item_description'], 'Rice noodles')
+        self.assertEqual(row['items'][0]['modifiers'][0]['modifier_name'], 'Extra hot')
+        self.assertEqual(row['items'][0]['total_price'], Decimal('85.00'))
+
+    def test_fields_projection(self):
+        """Test ?fields= narrows the output and the queries"""
+        with self.assertNumQueries(1):
+            response = self._list(fields='id,status,table_name')
+        self.assertEqual(set(response.data[0]), {'id', 'status', 'table_name'})
+
+        with self.assertNumQueries(3):
+            response = self._list(fields='id,items.item_name,items.total_price')
+        self.assertEqual(set(response.data[0]), {'id', 'items'})
+        self.assertEqual(response.data[0]['items'][0], {'item_name': 'Pad Thai', 'total_price': Decimal('85.00')})
+
+    def test_unknown_fields_rejected(self):
+        """Test unknown projected fields are a 400"""
+        self.assertEqual(self._list(fields='id,nope').status_code, 400)
+        self.assertEqual(self._list(fields='status.value').status_code, 400)
+
+
+def explain_plans(func):
+    """Run func() and EXPLAIN (FORMAT JSON) each SELECT it issued; returns [(sql, plan)]"""
+    with CaptureQueriesContext(connection) as captured:
+        func()
+    plans = []
+    with connection.cursor() as cursor:
+        for query in captured.captured_queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + query['sql'])
+            plan = cursor.fetchone()[0]
+            plans.append((query['sql'], plan[0]['Plan'] if isinstance(plan, list) else plan))
+    return plans
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+class OrderTransitionTests(TestCase):
+    """Test cases for the order state machine and bulk status changes"""
+
+    def setUp(self):
+        self.table = Table.objects.create(name='Table 5')
+        self.other_table = Table.objects.create(name='Table 6')
+        self.factory = APIRequestFactory()
+        self.user = get_user_model().objects.create_user(username='staff', password='pass12345')
+
+    def _order(self, status='pending', table=None):
+        return Order.objects.create(
+            customer_name='Ann', status=status, table=table or self.table, total_amount=Decimal('100.00')
+        )
+
+    def _patch(self, order, data):
+        request = self.factory.patch(f'/api/admin/orders/{order.pk}/status/', data, format='json')
+        force_authenticate(request, user=self.user)
+        return OrderStatusUpdateView.as_view()(request, pk=order.pk)
+
+    def test_transition_writes_changed_fields_only(self):
+        """Test a status change is one conditional UPDATE of the changed columns"""
+        order = self._order()
+        loaded = Order.objects.get(pk=order.pk)
+
+        with CaptureQueriesContext(connection) as captured:
+            apply_change(loaded, status='preparing')
+
+        updates = [q['sql'] for q in captured.captured_queries if q['sql'].startswith('UPDATE "orders_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"status" = ', updates[0].split('WHERE')[0])
+        self.assertNotIn('"customer_name"', updates[0])
+        self.assertEqual(loaded.version, 1)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.version), ('preparing', 1))
+
+    def test_racing_updates_conflict(self):
+        """Test the second of two writers working from the same read loses"""
+        order = self._order()
+        first = Order.objects.get(pk=order.pk)
+        second = Order.objects.get(pk=order.pk)
+
+        apply_change(first, status='preparing')
+        with self.assertRaises(StaleOrder) as raised:
+            apply_change(second, status='cancelled')
+
+        self.assertEqual(raised.exception.current['status'], 'preparing')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'preparing')
+
+    def test_invalid_transition(self):
+        """Test finished orders can't be reopened"""
+        order = self._order('completed')
+        with self.assertRaises(InvalidTransition):
+            apply_change(order, status='pending')
+
+    def test_save_bumps_version(self):
+        """Test plain saves also invalidate earlier reads"""
+        order = self._order()
+        stale = Order.objects.get(pk=order.pk)
+        order.customer_name = 'Ben'
+        order.save()
+
+        with self.assertRaises(StaleOrder):
+            apply_change(stale, status='preparing')
+
+    def test_status_view(self):
+        """Test the status endpoint applies, rejects and detects stale versions"""
+        order = self._order()
+
+        response = self._patch(order, {'status': 'preparing', 'version': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], 1)
+
+        response = self._patch(order, {'status': 'completed', 'version': 0})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['current']['version'], 1)
+
+        response = self._patch(order, {'status': 'pending'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_status_view_response_is_planned(self):
+        """Test the status response costs the same whatever the number of lines"""
+        item = Item.objects.create(category=Category.objects.create(name='Drinks'), name='Tea', price=Decimal('40.00'))
+        counts = []
+        for lines in (1, 5):
+            order = self._order()
+            for _ in range(lines):
+                OrderItem.objects.create(order=order, item=item, unit_price=Decimal('40.00'))
+            with CaptureQueriesContext(connection) as captured:
+                response = self._patch(order, {'status': 'preparing'})
+            self.assertEqual(len(response.data['items']), lines)
+            counts.append(len(captured))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_viewset_cannot_change_status(self):
+        """Test a plain order update can't bypass the state machine"""
+        order = self._order('completed')
+        request = self.factory.patch(
+            f'/api/orders/{order.pk}/', {'status': 'pending', 'customer_name': 'Ben'}, format='json'
+        )
+        force_authenticate(request, user=self.user)
+        response = OrderViewSet.as_view({'patch': 'partial_update'})(request, pk=order.pk)
+
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.customer_name), ('completed', 'Ben'))
+
+    def test_bulk_transition_one_statement(self):
+        """Test a table's open orders are completed with a single UPDATE"""
+        open_orders = [self._order('pending'), self._order('preparing')]
+        done = self._order('cancelled')
+        elsewhere = self._order('pending', self.other_table)
+
+        with CaptureQueriesContext(connection) as captured:
+            moved = bulk_transition(Order.objects.filter(table=self.table), 'completed')
+
+        updates = [q for q in captured.captured_queries if q['sql'].startswith('UPDATE orders_order')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual({order.pk for order in moved}, {order.pk for order in open_orders})
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[open_orders[0].pk], 'completed')
+        self.assertEqual(statuses[done.pk], 'cancelled')
+        self.assertEqual(statuses[elsewhere.pk], 'pending')
+        self.assertEqual(Order.objects.get(pk=open_orders[1].pk).version, 1)
+
+    @override_settings(ORDER_STATS_COUNTERS=True)
+    def test_bulk_transition_cost_is_fixed(self):
+        """Test bulk moves update the stats counter once, whatever the number of orders"""
+        rebuild_order_stats()
+        self._order('pending')
+        with CaptureQueriesContext(connection) as one:
+            bulk_transition(Order.objects.filter(table=self.table), 'preparing')
+        for _ in range(5):
+            self._order('pending', self.other_table)
+        with CaptureQueriesContext(connection) as five:
+            bulk_transition(Order.objects.filter(table=self.other_table), 'preparing')
+
+        self.assertEqual(len(five), len(one))
+        self.assertEqual(read_order_stats()['active_orders'], 6)
+
+    def test_bulk_completion_awards_points(self):
+        """Test completing a table's orders in bulk credits every customer"""
+        for phone in ('0811111111', '0811111111', '0822222222'):
+            Order.objects.create(
+                customer_name='Ann', customer_phone=phone, table=self.table, total_amount=Decimal('100.00')
+            )
+        StoreCustomer.objects.create(phone='0822222222', name='Ben', points=5)
+
+        moved = bulk_transition(Order.objects.filter(table=self.table), 'completed')
+        award_completion_points(moved)
+
+        points = dict(StoreCustomer.objects.values_list('phone', 'points'))
+        self.assertEqual(points, {'0811111111': 20, '0822222222': 15})
+
+    def test_bulk_view_by_ids(self):
+        """Test the bulk endpoint moves just the listed orders, given as numbers or strings"""
+        picked = [self._order(), self._order()]
+        other = self._order()
+
+        request = self.factory.post(
+            '/api/orders/bulk-status/', {'status': 'preparing', 'ids': [picked[0].pk, str(picked[1].pk)]},
+            format='json'
+        )
+        force_authenticate(request, user=self.user)
+        response = OrderBulkStatusView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['orders']), sorted(str(order.pk) for order in picked))
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[order.pk] for order in picked + [other]], ['preparing', 'preparing', 'pending'])
+
+    def test_bulk_view_sends_one_event(self):
+        """Test the bulk endpoint reports the moved orders in one notification"""
+        for _ in range(3):
+            self._order('preparing')
+        enqueued = order_events.enqueued
+
+        request = self.factory.post(
+            '/api/orders/bulk-status/', {'status': 'completed', 'table': self.table.pk}, format='json'
+        )
+        force_authenticate(request, user=self.user)
+        response = OrderBulkStatusView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(order_events.enqueued - enqueued, 1)
+
+        request = self.factory.post('/api/orders/bulk-status/', {'status': 'pending', 'table': 1}, format='json')
+        force_authenticate(request, user=self.user)
+        self.assertEqual(OrderBulkStatusView.as_view()(request).status_code, 400)
+
+
+class OrderIndexPlanTests(TestCase):
+    """Test the live order queries use indexes rather than scanning the history"""
+
+    HISTORY = 20000
+
+    def setUp(self):
+        cache.clear()
+        # As in a migrated schema; switched off while seeding so the
+        # explicit change_xid values (the board cursor's history) stick
+        install_change_trigger()
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE orders_order DISABLE TRIGGER orders_order_change_xid')
+        orders = [
+            Order(customer_name=f'Guest {i}', status='completed', total_amount=Decimal('100.00'), change_xid=i)
+            for i in range(self.HISTORY)
+        ]
+        orders += [
+            Order(customer_name=f'Live {i}', status=status, total_amount=Decimal('100.00'), change_xid=self.HISTORY + i)
+            for i, status in enumerate(ACTIVE_STATUSES * 10)
+        ]
+        Order.objects.bulk_create(orders, batch_size=5000)
+        with connection.cursor() as cursor:
+            # A year of history, roughly 55 orders a day; the live ones are recent
+            cursor.execute(
+                'UPDATE orders_order SET created_at = now() - make_interval(days => ((%s - rank) / 55)::int) '
+                'FROM (SELECT id, row_number() OVER (ORDER BY id) AS rank FROM orders_order) ranked '
+                'WHERE orders_order.id = ranked.id',
+                [self.HISTORY + 20],
+            )
+            # ALTER TABLE refuses to run with deferred FK checks still pending
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute('ALTER TABLE orders_order ENABLE TRIGGER orders_order_change_xid')
+            cursor.execute('ANALYZE orders_order')
+        self.assertEqual(Order.objects.filter(change_xid__gte=self.HISTORY).count(), 20)
+        self.assertGreater(
+            (timezone.now() - Order.objects.order_by('created_at').first().created_at).days, 300
+        )
+
+    def assertIndexed(self, func, index=None):
+        """No SELECT func() issues scans orders_order sequentially; `index` is used"""
+        plans = explain_plans(func)
+        self.assertTrue(plans)
+        if index is not None:
+            used = {node.get('Index Name') for _, plan in plans for node in plan_nodes(plan)}
+            self.assertIn(index, used)
+        for sql, plan in plans:
+            scans = [
+                node for node in plan_nodes(plan)
+                if node.get('Relation Name') == 'orders_order' and node['Node Type'] == 'Seq Scan'
+            ]
+            self.assertEqual(scans, [], f'Sequential scan of orders_order in: {sql}')
+
+    def test_board_query(self):
+        """Test the board's active orders come from idx_order_active"""
+        self.assertIndexed(
+            lambda: list(board_rows(Order.objects.filter(status__in=ACTIVE_STATUSES))), 'idx_order_active'
+        )
+
+    def test_board_since_query(self):
+        """Test polling the board reads idx_order_change_xid"""
+        self.assertIndexed(
+            lambda: list(board_rows(Order.objects.filter(change_xid__gte=self.HISTORY))), 'idx_order_change_xid'
+        )
+
+    def test_active_count(self):
+        """Test the active count and dashboard stats avoid sequential scans"""
+        self.assertIndexed(lambda: Order.objects.filter(status__in=ACTIVE_STATUSES).count(), 'idx_order_active')
+        self.assertIndexed(compute_order_stats)
+
+    def test_active_list(self):
+        """Test a projected kitchen list of active orders is index-driven"""
+        self.assertIndexed(lambda: list(
+            Order.objects.filter(status__in=ACTIVE_STATUSES).order_by('created_at').values('id', 'status')
+        ), 'idx_order_active')
+
+
+class KitchenBoardTests(TransactionTestCase):
+    """Test cases for the kitchen board and its change cursor"""
+
+    def setUp(self):
+        # Each write commits in its own transaction, as it would in production
+        install_change_trigger()
+        category = Category.objects.create(name='Main Course')
+        self.item = Item.objects.create(category=category, name='Pad Thai', price=Decimal('80.00'))
+        group = ModifierGroup.objects.create(item=self.item, name='Spice')
+        self.option = ModifierOption.objects.create(group=group, name='Extra hot')
+        self.table = Table.objects.create(name='Table 3')
+
+    def _order(self, status='pending', name='Ann'):
+        order = Order.objects.create(customer_name=name, status=status, table=self.table, total_amount=Decimal('80.00'))
+        order_item = OrderItem.objects.create(
+            order=order, item=self.item, quantity=2, unit_price=Decimal('80.00'), special_instructions='No peanuts'
+        )
+        OrderItemModifier.objects.create(
+            order_item=order_item, modifier_option=self.option, price_adjustment=Decimal('0.00')
+        )
+        return order
+
+    def test_board_lists_active_orders_compactly(self):
+        """Test the board returns pending and preparing orders with their lines"""
+        pending = self._order('pending', 'Ann')
+        preparing = self._order('preparing', 'Ben')
+        self._order('completed', 'Cat')
+
+        with self.assertNumQueries(2):
+            board = read_board()
+
+        self.assertEqual([row['id'] for row in board['orders']], [str(pending.pk), str(preparing.pk)])
+        self.assertEqual(board['removed'], [])
+        row = board['orders'][0]
+        self.assertEqual(row['table_name'], 'Table 3')
+        self.assertEqual(row['items'], [
+            {'name': 'Pad Thai', 'quantity': 2, 'notes': 'No peanuts', 'modifiers': ['Extra hot']},
+        ])
+
+    def test_since_returns_only_changes(self):
+        """Test polling with the cursor returns changed orders and removals"""
+        unchanged = self._order('pending', 'Ann')
+        finished = self._order('preparing', 'Ben')
+        cursor = int(read_board()['cursor'])
+
+        self.assertEqual(read_board(cursor)['orders'], [])
+
+        new = self._order('pending', 'Cat')
+        finished.status = 'ready'
+        finished.save()
+        board = read_board(cursor)
+
+        self.assertEqual([row['id'] for row in board['orders']], [str(new.pk)])
+        self.assertEqual(board['removed'], [str(finished.pk)])
+        self.assertNotIn(str(unchanged.pk), [row['id'] for row in board['orders']])
+        self.assertGreaterEqual(int(board['cursor']), cursor)
+
+    def test_since_reports_deleted_orders(self):
+        """Test a deleted order is reported as removed and old tombstones are purged"""
+        deleted = self._order('pending', 'Ann')
+        cursor = int(read_board()['cursor'])
+        OrderTombstone.objects.create(order_id=0, change_xid=0, deleted_at=timezone.now() - timedelta(days=2))
+
+        order_id = deleted.pk
+        deleted.delete()
+
+        self.assertEqual(read_board(cursor)['removed'], [str(order_id)])
+        self.assertEqual(list(OrderTombstone.objects.values_list('order_id', flat=True)), [order_id])
+
+    def test_view(self):
+        """Test the board endpoint requires auth and validates the cursor"""
+        self._order()
+        factory = APIRequestFactory()
+        view = KitchenBoardView.as_view()
+        user = get_user_model().objects.create_user(username='kitchen', password='pass12345')
+
+        self.assertIn(view(factory.get('/api/kitchen/board/')).status_code, (401, 403))
+
+        request = factory.get('/api/kitchen/board/')
+        force_authenticate(request, user=user)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['orders']), 1)
+
+        request = factory.get('/api/kitchen/board/', {'since': 'abc'})
+        force_authenticate(request, user=user)
+        self.assertEqual(view(request).status_code, 400)
+
+
+class OrderPartitionTests(TestCase):
+    """Test cases for monthly partitioning of the order tables"""
+
+    def setUp(self):
+        install_change_trigger()
+        category = Category.objects.create(name='Main Course')
+        self.item = Item.objects.create(category=category, name='Pad Thai', price=Decimal('80.00'))
+        group = ModifierGroup.objects.create(item=self.item, name='Spice')
+        self.option = ModifierOption.objects.create(group=group, name='Extra hot', price_adjustment=Decimal('5.00'))
+        self.now = timezone.now()
+        # One order in each of the last four months
+        self.orders = [self._order(month_start(self.now, -offset) + timedelta(days=3)) for offset in range(4)]
+
+    def _order(self, created_at=None):
+        order = Order.objects.create(customer_name='Ann', total_amount=Decimal('85.00'))
+        order_item = OrderItem.objects.create(order=order, item=self.item, quantity=1, unit_price=Decimal('80.00'))
+        OrderItemModifier.objects.create(
+            order_item=order_item, modifier_option=self.option, price_adjustment=Decimal('5.00')
+        )
+        if created_at is not None:
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+            OrderItem.objects.filter(order=order).update(created_at=created_at)
+            OrderItemModifier.objects.filter(order_item__order=order).update(created_at=created_at)
+        return order
+
+    def test_convert_keeps_rows_and_behaviour(self):
+        """Test conversion moves every row into monthly partitions the ORM keeps using"""
+        self.assertTrue(partition_order_tables(ahead=2, now=self.now))
+
+        self.assertTrue(is_partitioned())
+        self.assertFalse(partition_order_tables(now=self.now))
+        expected = {partition_name('orders_order', month_start(self.now, offset)) for offset in range(-3, 3)}
+        self.assertEqual(set(partitions('orders_order')), expected | {'orders_order_default'})
+        self.assertEqual(Order.objects.count(), 4)
+        self.assertEqual(OrderItemModifier.objects.filter(order_item__order__in=self.orders).count(), 4)
+
+        order = self._order()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT tableoid::regclass::text, change_xid FROM orders_order WHERE id = %s', [order.pk]
+            )
+            table, change_xid = cursor.fetchone()
+        self.assertEqual(table, partition_name('orders_order', month_start(self.now)))
+        self.assertIsNotNone(change_xid)
+        # The identity sequence carried on from the copied rows
+        older = OrderItem.objects.exclude(order=order).values_list('pk', flat=True)
+        self.assertGreater(order.items.get().pk, max(older))
+        loaded = Order.objects.prefetch_related('items__modifiers').get(pk=order.pk)
+        self.assertEqual(loaded.items.all()[0].total_price, Decimal('85.00'))
+
+    def test_convert_keeps_ids_and_idempotency_keys(self):
+        """Test orders created after conversion continue the id sequence and keys stay unique"""
+        Order.objects.filter(pk=self.orders[0].pk).update(idempotency_key='key-1')
+        partition_order_tables(ahead=1, now=self.now)
+
+        order = self._order()
+        self.assertEqual(order.pk, max(existing.pk for existing in self.orders) + 1)
+        self.assertEqual(Order.objects.count(), 5)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(customer_name='Ben', total_amount=Decimal('85.00'), idempotency_key='key-1')
+        Order.objects.create(customer_name='Ben', total_amount=Decimal('85.00'), idempotency_key='key-2')
+
+        # Deleting the order frees its key
+        Order.objects.filter(idempotency_key='key-1').delete()
+        Order.objects.create(customer_name='Cat', total_amount=Decimal('85.00'), idempotency_key='key-1')
+
+    def _table_of(self, model, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT tableoid::regclass::text FROM {model._meta.db_table} WHERE id = %s', [pk])
+            return cursor.fetchone()[0]
+
+    def test_lines_follow_their_order(self):
+        """Test lines added later land, and are detached, with their order's month"""
+        partition_order_tables(ahead=1, now=self.now)
+        order = Order.objects.get(pk=self.orders[3].pk)
+        line = OrderItem.objects.create(order=order, item=self.item, unit_price=Decimal('80.00'))
+        modifier = OrderItemModifier.objects.create(
+            order_item=line, modifier_option=self.option, price_adjustment=Decimal('5.00')
+        )
+
+        month = month_start(self.now, -3)
+        self.assertEqual(self._table_of(OrderItem, line.pk), partition_name('orders_orderitem', month))
+        self.assertEqual(
+            self._table_of(OrderItemModifier, modifier.pk), partition_name('orders_orderitemmodifier', month)
+        )
+        detach_partitions(2, now=self.now)
+        self.assertFalse(OrderItem.objects.filter(order=order).exists())
+
+    def test_line_lookups_match_partition_key(self):
+        """Test planned prefetches and board rows match lines on the order's created_at"""
+        with CaptureQueriesContext(connection) as captured:
+            list(OrderSerializer().plan_queryset(Order.objects.all()))
+            list(board_rows(Order.objects.all()))
+
+        sql = ' '.join(query['sql'] for query in captured.captured_queries)
+        self.assertIn('"orders_orderitem"."created_at" = ("orders_order"."created_at")', sql)
+        self.assertIn('"orders_orderitemmodifier"."created_at" = ("orders_orderitem"."created_at")', sql)
+        self.assertIn('V0."created_at" = ("orders_order"."created_at")', sql)
+
+    def test_ensure_and_detach(self):
+        """Test upcoming months are created and months past retention detached"""
+        partition_order_tables(ahead=0, now=self.now)
+
+        created = ensure_partitions(ahead=2, now=self.now)
+        self.assertIn(partition_name('orders_orderitem', month_start(self.now, 2)), created)
+        self.assertEqual(ensure_partitions(ahead=2, now=self.now), [])
+
+        detached = detach_partitions(1, now=self.now)
+
+        oldest = [month_start(self.now, -3), month_start(self.now, -2)]
+        self.assertEqual(
+            sorted(detached),
+            sorted(partition_name(table, month) for table in ORDER_TABLES for month in oldest),
+        )
+        self.assertEqual(Order.objects.count(), 2)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {partition_name('orders_order', oldest[0])}")
+            self.assertEqual(cursor.fetchone()[0], 1)
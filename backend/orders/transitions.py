@@ -0,0 +1,135 @@
+"""
+Order state machine.
+
+Status changes are applied with a conditional UPDATE that only matches the
+status and version the change was decided against (the client can send
+the version it saw), and writes just the changed columns plus `version`
+and `updated_at`. Two tablets moving the same order therefore can't both
+win: the second UPDATE matches no row and gets a StaleOrder with the
+current state instead of silently overwriting the first.
+
+These writes bypass Model.save(), so they report their changes to the
+stats counters and rollups themselves: order_changed for one order,
+orders_changed once for a whole bulk move.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order
+from .signals import order_changed, orders_changed
+
+# {from status: statuses it may move to}
+TRANSITIONS = {
+    'pending': {'preparing', 'completed', 'cancelled'},
+    'preparing': {'completed', 'cancelled'},
+    'completed': set(),
+    'cancelled': set(),
+}
+
+
+class InvalidTransition(Exception):
+    """The state machine doesn't allow this status change"""
+
+
+class StaleOrder(Exception):
+    """The order changed since it was read; `current` is its stored state"""
+
+    def __init__(self, current):
+        super().__init__('Order was modified by another request')
+        self.current = current
+
+
+def sources(new_status):
+    """Statuses an order may be moved to `new_status` from"""
+    return [old for old, targets in TRANSITIONS.items() if new_status in targets]
+
+
+def check_transition(old_status, new_status):
+    if new_status != old_status and new_status not in TRANSITIONS.get(old_status, ()):
+        raise InvalidTransition(f'Cannot change status from {old_status} to {new_status}')
+
+
+def apply_change(order, status=None, expected_version=None, **fields):
+    """
+    Move `order` to `status` and/or set `fields` with one conditional
+    UPDATE against the status and version it was loaded with (or the
+    client's `expected_version`). Updates `order` in place and returns it;
+    raises InvalidTransition or StaleOrder.
+    """
+    version = order.version if expected_version is None else expected_version
+    if version != order.version:
+        raise StaleOrder(current_state(order.pk))
+
+    old_status = order.status
+    new_status = old_status if status is None else status
+    check_transition(old_status, new_status)
+
+    changes = {name: value for name, value in fields.items() if getattr(order, name) != value}
+    if new_status != old_status:
+        changes['status'] = new_status
+    if not changes:
+        return order
+
+    now = timezone.now()
+    updated = Order.objects.filter(pk=order.pk, status=old_status, version=version).update(
+        version=F('version') + 1, updated_at=now, **changes
+    )
+    if not updated:
+        raise StaleOrder(current_state(order.pk))
+
+    for name, value in changes.items():
+        setattr(order, name, value)
+    order.updated_at = now
+    order.version = version + 1
+    order._loaded_status = new_status
+    order_changed(order, old_status, new_status)
+    return order
+
+
+def current_state(pk):
+    return Order.objects.filter(pk=pk).values('id', 'status', 'version').first()
+
+
+BULK_TRANSITION_SQL = (
+    'UPDATE orders_order o SET status = %s, version = o.version + 1, updated_at = %s '
+    'FROM ({}) old WHERE o.id = old.id '
+    'RETURNING o.id, old.status, o.total_amount, o.created_at, o.customer_phone, o.customer_name'
+)
+
+
+def bulk_transition(queryset, new_status):
+    """
+    Move every order in `queryset` that may go to `new_status` there in one
+    statement; orders in other statuses are left alone. Returns the moved
+    orders (id, status, total_amount, created_at and customer fields only).
+    """
+    allowed = sources(new_status)
+    if not allowed:
+        raise InvalidTransition(f'No status can change to {new_status}')
+
+    with transaction.atomic():
+        # Lock the matching rows in id order so concurrent bulk moves can't deadlock
+        locked = (
+            queryset.filter(status__in=allowed).select_for_update()
+            .order_by('id').values('id', 'status')
+        )
+        select_sql, select_params = locked.query.sql_with_params()
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(BULK_TRANSITION_SQL.format(select_sql), [new_status, now, *select_params])
+            rows = cursor.fetchall()
+
+        changes = [
+            (
+                Order(
+                    id=pk, status=new_status, total_amount=total_amount, created_at=created_at,
+                    customer_phone=customer_phone, customer_name=customer_name, updated_at=now,
+                ),
+                old_status,
+                new_status,
+            )
+            for pk, old_status, total_amount, created_at, customer_phone, customer_name in rows
+        ]
+        orders_changed(changes)
+    return [order for order, _, _ in changes]
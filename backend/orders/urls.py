@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    OrderViewSet, OrderStatsView, OrderStatusUpdateView,
+    KitchenBoardView, OrderBulkStatusView, OrderViewSet, OrderStatsView, OrderStatusUpdateView,
     PublicOrderCreateView, PublicOrderDetailView, OrderPaymentView
 )
 
@@ -10,7 +10,10 @@ router.register(r'orders', OrderViewSet)
 router.register(r'order-stats', OrderStatsView, basename='order-stats')
 
 urlpatterns = [
+    # Before the router, whose orders/<pk>/ would match it
+    path('orders/bulk-status/', OrderBulkStatusView.as_view(), name='order-bulk-status'),
     path('', include(router.urls)),
+    path('kitchen/board/', KitchenBoardView.as_view(), name='kitchen-board'),
     path('orders/<uuid:pk>/status/', OrderStatusUpdateView.as_view(), name='order-status-update'),
     path('orders/<uuid:pk>/payment/', OrderPaymentView.as_view(), name='order-payment'),
     # Public APIs (for customers)
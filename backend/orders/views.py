@@ -1,44 +1,79 @@
-from django.db.models import Sum
-from django.utils import timezone
+import logging
+
 from rest_framework import viewsets, generics, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from django.db import IntegrityError
 from django.shortcuts import get_object_or_404
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from . import idempotency
+from .board import read_board
+from .checkout import CheckoutError, cart_snapshot
+from .events import order_events
 from .models import Order
+from .query_plan import QueryPlanViewMixin
+from .services import award_completion_points
+from .stats import read_order_stats
+from .transitions import InvalidTransition, StaleOrder, apply_change, bulk_transition
 from .serializers import (
+    BulkOrderStatusSerializer,
     OrderSerializer,
     OrderStatusUpdateSerializer,
     OrderStatsSerializer,
     PublicOrderSerializer
 )
 
+logger = logging.getLogger(__name__)
+
+
+def planned_orders():
+    """Orders loaded with the relations OrderSerializer renders (see orders.query_plan)"""
+    return OrderSerializer().plan_queryset(Order.objects.all(), columns=False)
+
 
-def send_order_update(request, order, update_type='updated'):
-    """Helper to send order updates via WebSocket"""
+def send_order_update(request, order, update_type='updated', data=None):
+    """
+    Helper to send order updates via WebSocket.
+
+    The event is handed to orders.events.order_events and published by its
+    worker thread, so the request never waits on the channel layer. Pass
+    `data` when the order has already been serialized for the response;
+    otherwise the order is reloaded through planned_orders().
+    """
     try:
-        channel_layer = get_channel_layer()
-        host = request.get_host().split(':')[0]
-        safe_host = host.replace('.', '_').replace('-', '_')
-        group_name = f'orders_{safe_host}'
-        
-        serializer = OrderSerializer(order)
-        
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                'type': 'order_update',
-                'action': update_type,
-                'order': serializer.data
-            }
-        )
-    except Exception as e:
-        print(f"Failed to send websocket update: {e}")
+        if data is None:
+            data = OrderSerializer(planned_orders().get(pk=order.pk)).data
+
+        order_events.publish(order_group_name(request), {
+            'type': 'order_update',
+            'action': update_type,
+            'order': data
+        })
+    except Exception:
+        logger.exception('Failed to send websocket update')
+
+
+def send_bulk_order_update(request, new_status, order_ids):
+    """One WebSocket event for a bulk status change, listing the moved orders"""
+    try:
+        order_events.publish(order_group_name(request), {
+            'type': 'order_update',
+            'action': 'bulk_status_changed',
+            'status': new_status,
+            'orders': order_ids,
+        })
+    except Exception:
+        logger.exception('Failed to send websocket update')
+
 
+def order_group_name(request):
+    host = request.get_host().split(':')[0]
+    safe_host = host.replace('.', '_').replace('-', '_')
+    return f'orders_{safe_host}'
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all().prefetch_related('items__modifiers')
+
+class OrderViewSet(QueryPlanViewMixin, viewsets.ModelViewSet):
+    # Relations and columns are planned from OrderSerializer (see orders.query_plan)
+    queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -47,76 +82,95 @@ class OrderStatsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # Calculate today's stats
-        today = timezone.now().date()
-        orders_today = Order.objects.filter(created_at__date=today).count()
-        completed_today = Order.objects.filter(
-            created_at__date=today,
-            status='completed'
-        ).count()
-        revenue_today = Order.objects.filter(
-            created_at__date=today,
-            status='completed'
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        active_orders = Order.objects.filter(
-            status__in=['pending', 'preparing']
-        ).count()
-
-        serializer = OrderStatsSerializer({
-            'orders_today': orders_today,
-            'orders_completed_today': completed_today,
-            'revenue_today': revenue_today,
-            'active_orders': active_orders
-        })
+        # One conditional-aggregate query, or the counter row when enabled
+        serializer = OrderStatsSerializer(read_order_stats())
         return Response(serializer.data)
 
 
+class KitchenBoardView(APIView):
+    """Active orders for kitchen screens; poll with ?since=<cursor> for changes only"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return Response({'since': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(read_board(since))
+
+
 class OrderStatusUpdateView(generics.UpdateAPIView):
-    queryset = Order.objects.all()
     serializer_class = OrderStatusUpdateSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        # Loaded for the OrderSerializer response
+        return planned_orders()
+
     def patch(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(data=request.data)
 
         if serializer.is_valid():
-            # Update status
-            if 'status' in serializer.validated_data:
-                new_status = serializer.validated_data['status']
-                old_status = instance.status
-                instance.status = new_status
-                
-                # Calculate points if order is completed
-                if new_status == 'completed' and old_status != 'completed' and instance.customer_phone:
-                    try:
-                        from store.models import Customer
-                        customer, created = Customer.objects.get_or_create(
-                            phone=instance.customer_phone,
-                            defaults={'name': instance.customer_name}
-                        )
-                        # 1 point per 10 currency units
-                        points_earned = int(instance.total_amount / 10)
-                        customer.points += points_earned
-                        customer.save()
-                    except Exception as e:
-                        print(f"Error adding points: {e}")
-
-            if 'payment_status' in serializer.validated_data:
-                instance.payment_status = serializer.validated_data['payment_status']
-            instance.save()
+            data = serializer.validated_data
+            old_status = instance.status
+            fields = {}
+            if data.get('payment_status') is not None:
+                fields['payment_status'] = data['payment_status']
+
+            # Conditional on the status and version read above (see orders.transitions)
+            try:
+                apply_change(instance, status=data['status'], expected_version=data.get('version'), **fields)
+            except InvalidTransition as e:
+                return Response({'status': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+            except StaleOrder as e:
+                return Response({'error': str(e), 'current': e.current}, status=status.HTTP_409_CONFLICT)
+
+            if instance.status == 'completed' and old_status != 'completed':
+                award_completion_points([instance])
 
             # Return the updated order with full serializer
             response_serializer = OrderSerializer(instance)
             
             # Send WebSocket update
-            send_order_update(request, instance, update_type='status_changed')
+            send_order_update(request, instance, update_type='status_changed', data=response_serializer.data)
             
             return Response(response_serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class OrderBulkStatusView(APIView):
+    """Move many orders (a table's, or a list of ids) to one status in one statement"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkOrderStatusSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+
+        orders = Order.objects.all()
+        if 'table' in data:
+            orders = orders.filter(table_id=data['table'])
+        if 'ids' in data:
+            orders = orders.filter(id__in=data['ids'])
+        try:
+            moved = bulk_transition(orders, data['status'])
+        except InvalidTransition as e:
+            return Response({'status': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+
+        if data['status'] == 'completed':
+            award_completion_points(moved)
+
+        order_ids = [str(order.pk) for order in moved]
+        if order_ids:
+            send_bulk_order_update(request, data['status'], order_ids)
+        return Response({'status': data['status'], 'updated': len(order_ids), 'orders': order_ids})
+
+
 class PublicOrderCreateView(APIView):
     """Public API for creating orders from cart (customer orders)"""
     permission_classes = [permissions.AllowAny]
@@ -129,87 +183,128 @@ class PublicOrderCreateView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get cart items from session
-        from store.models import Cart, CartItem, CartItemModifier
-        try:
-            cart = Cart.objects.get(session_id=session_id, is_active=True)
-            cart_items = cart.items.all().prefetch_related('modifiers')
-
-            if not cart_items.exists():
+        # Snapshot the cart graph once; it drives validation, pricing and
+        # order creation (see orders.checkout for the query budget)
+        from store.cart_store import bump_cart_version, get_cart_store
+        cart_store = get_cart_store()
+        cart, items, options = cart_store.load_checkout(session_id)
+        idempotency_key = request.headers.get(idempotency.IDEMPOTENCY_HEADER)
+        if cart is None or not cart.lines:
+            # A retry of this session's checkout that already closed the cart
+            stored = idempotency.stored_result(idempotency_key, session_id)
+            if stored is not None:
+                return self.replay(*stored)
+            if cart is None:
                 return Response(
-                    {'error': 'Cart is empty'},
-                    status=status.HTTP_400_BAD_REQUEST
+                    {'error': 'Cart not found'},
+                    status=status.HTTP_404_NOT_FOUND
                 )
+            return Response(
+                {'error': 'Cart is empty'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            # Prepare order data
-            items_data = []
-            total_amount = 0
-
-            for cart_item in cart_items:
-                item_total = cart_item.total_price
-                item_data = {
-                    'item_id': cart_item.item.id,
-                    'quantity': cart_item.quantity,
-                    'special_instructions': cart_item.special_instructions or '',
-                    'modifiers': []
-                }
-
-                # Add modifiers
-                for modifier in cart_item.modifiers.all():
-                    item_total += modifier.total_price
-                    item_data['modifiers'].append({
-                        'modifier_option_id': modifier.modifier_option.id,
-                        'quantity': modifier.quantity
-                    })
-
-                items_data.append(item_data)
-                total_amount += item_total
-
-            # Create order
-            order_data = {
-                'customer_name': request.data.get('customer_name', ''),
-                'customer_phone': request.data.get('customer_phone', ''),
-                'total_amount': total_amount,
-                'delivery_address': request.data.get('delivery_address', ''),
-                'special_instructions': request.data.get('special_instructions', ''),
-                'session_id': session_id
-            }
+        try:
+            lines = cart_snapshot(cart, items, options)
+        except CheckoutError as e:
+            return Response({'items': e.errors}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Get QR code and table if available
-            qr_code_id = request.data.get('qr_code_id')
-            if qr_code_id:
-                from qrcodes.models import QRCode
-                try:
-                    qr_code = QRCode.objects.get(id=qr_code_id)
-                    order_data['qr_code'] = qr_code
-                    order_data['table'] = qr_code.table
-                    order_data['customer_name'] = f"Table {qr_code.table.name}"
-                except QRCode.DoesNotExist:
-                    pass
+        # Prepare order data
+        items_data = [
+            {
+                'item_id': line.item_id,
+                'quantity': line.quantity,
+                'special_instructions': line.special_instructions,
+                'modifiers': [
+                    {'modifier_option_id': option_id, 'quantity': quantity}
+                    for option_id, quantity in line.modifiers
+                ]
+            }
+            for line in cart.lines
+        ]
+
+        # Create order; the total is priced by PublicOrderSerializer.create
+        order_data = {
+            'customer_name': request.data.get('customer_name', ''),
+            'customer_phone': request.data.get('customer_phone', ''),
+            'delivery_address': request.data.get('delivery_address', ''),
+            'special_instructions': request.data.get('special_instructions', ''),
+            'session_id': session_id
+        }
+
+        # Get QR code and table if available
+        qr_code_id = request.data.get('qr_code_id')
+        if qr_code_id:
+            from qrcodes.models import QRCode
+            try:
+                qr_code = QRCode.objects.select_related('table').get(id=qr_code_id)
+                order_data['qr_code'] = qr_code
+                order_data['table'] = qr_code.table
+                order_data['customer_name'] = f"Table {qr_code.table.name}"
+            except QRCode.DoesNotExist:
+                pass
+
+        # Claim the checkout so retries are answered from its stored result
+        fingerprint = idempotency.checkout_fingerprint(session_id, cart, {
+            field: request.data.get(field, '')
+            for field in ['customer_name', 'customer_phone', 'delivery_address', 'special_instructions', 'qr_code_id']
+        })
+        idempotency_key = idempotency_key or fingerprint
+        try:
+            stored = idempotency.claim(idempotency_key, fingerprint)
+        except idempotency.IdempotencyConflict as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_409_CONFLICT if e.in_progress else status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if stored is not None:
+            return self.replay(*stored)
 
+        try:
             # Use PublicOrderSerializer to create order
-            serializer = PublicOrderSerializer(data={**order_data, 'items': items_data})
-            if serializer.is_valid():
-                order = serializer.save()
+            serializer = PublicOrderSerializer(
+                data={**order_data, 'items': items_data}, context={'checkout_lines': lines}
+            )
+            if not serializer.is_valid():
+                idempotency.release(idempotency_key)
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                order = serializer.save(idempotency_key=idempotency_key, session_id=session_id)
+            except IntegrityError:
+                # A retry after the worker died before storing the result
+                # (or the cache lost it): the key's order already exists.
+                # Only this session's order is handed back
+                order = planned_orders().filter(idempotency_key=idempotency_key, session_id=session_id).first()
+                if order is None:
+                    idempotency.release(idempotency_key)
+                    return Response(
+                        {'error': 'Idempotency key was already used for a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+        except Exception:
+            idempotency.release(idempotency_key)
+            raise
+
+        # Store the result before anything else can fail, so retries replay it.
+        # The order carries its lines and modifiers, so this runs no queries
+        response_serializer = OrderSerializer(order)
+        idempotency.store_result(
+            idempotency_key, fingerprint, session_id, status.HTTP_201_CREATED, response_serializer.data
+        )
 
-                # Mark cart as inactive
-                cart.is_active = False
-                cart.save()
+        # The cart has become an order
+        cart_store.close(session_id)
+        bump_cart_version(session_id)
 
-                response_serializer = OrderSerializer(order)
-                
-                # Send WebSocket update
-                send_order_update(request, order, update_type='new_order')
-                
-                return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        # Send WebSocket update
+        send_order_update(request, order, update_type='new_order', data=response_serializer.data)
 
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
-        except Cart.DoesNotExist:
-            return Response(
-                {'error': 'Cart not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+    def replay(self, status_code, data):
+        response = Response(data, status=status_code)
+        response['Idempotent-Replayed'] = 'true'
+        return response
 
 
 class PublicOrderDetailView(APIView):
@@ -220,7 +315,7 @@ class PublicOrderDetailView(APIView):
         session_id = request.headers.get('X-Session-ID') or request.GET.get('session_id')
 
         try:
-            order = get_object_or_404(Order, id=order_id)
+            order = get_object_or_404(planned_orders(), id=order_id)
 
             # Allow access if same session or if it's an authenticated request
             if session_id and order.session_id != session_id:
@@ -268,7 +363,7 @@ class OrderPaymentView(APIView):
         )
         
         if result['success']:
-            # Send WebSocket update
+            # Send WebSocket update (reloads the order the payment changed)
             send_order_update(request, order, update_type='payment_processed')
             return Response(result, status=status.HTTP_200_OK)
         else:
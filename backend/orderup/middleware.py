@@ -2,6 +2,8 @@ from django.db import connection
 from django.http import Http404
 from django.conf import settings
 
+from customers.tenant_registry import tenant_registry
+
 
 class HeaderTenantMiddleware:
     """
@@ -11,6 +13,9 @@ class HeaderTenantMiddleware:
     Usage:
     - Frontend sends: X-Tenant-Host: pizza.localhost
     - Or direct test: X-Tenant-Subdomain: pizza
+
+    Tenants are resolved through customers.tenant_registry, so steady-state
+    requests don't query the public schema.
     """
 
     def __init__(self, get_response):
@@ -28,6 +33,7 @@ class HeaderTenantMiddleware:
         subdomain = request.META.get('HTTP_X_TENANT_SUBDOMAIN')
 
         # 2. If not found, try from X-Tenant-Host header (sent by frontend)
+        host_header = None
         if not subdomain:
             host_header = request.META.get('HTTP_X_TENANT_HOST')
             if host_header and '.' in host_header:
@@ -45,9 +51,15 @@ class HeaderTenantMiddleware:
 
         if subdomain and subdomain not in ['localhost', 'public', 'www']:
             try:
-                from customers.models import Client
-                tenant = Client.objects.get(schema_name=subdomain)
-                logger.info(f"TenantMiddleware: Found tenant={tenant.name} (schema={tenant.schema_name})")
+                # A registered Domain wins; otherwise the subdomain is the schema name
+                if host_header:
+                    tenant = tenant_registry.get_by_host(host_header)
+                if tenant is None:
+                    tenant = tenant_registry.get_by_schema(subdomain)
+                if tenant is not None:
+                    logger.info(f"TenantMiddleware: Found tenant={tenant.name} (schema={tenant.schema_name})")
+                else:
+                    logger.warning(f"TenantMiddleware: No tenant for {subdomain}")
             except Exception as e:
                 # If specified tenant not found, don't crash, let standard logic fail or fallback
                 logger.warning(f"TenantMiddleware: Failed to find tenant for {subdomain}: {e}")
@@ -66,10 +78,11 @@ class HeaderTenantMiddleware:
         logger.info("TenantMiddleware: Using fallback to public schema (ROOT_URLCONF)")
         request.urlconf = settings.ROOT_URLCONF
         # Set tenant to public schema
-        from customers.models import Client
         try:
-            request.tenant = Client.objects.get(schema_name='public')
-            connection.set_tenant(request.tenant)
+            public_tenant = tenant_registry.get_by_schema('public')
+            if public_tenant is not None:
+                request.tenant = public_tenant
+                connection.set_tenant(request.tenant)
         except Exception:
             pass
         return None
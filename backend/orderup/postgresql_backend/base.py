@@ -0,0 +1,109 @@
+"""
+django_tenants' PostgreSQL backend, tuned for persistent connections.
+
+With CONN_MAX_AGE > 0 each worker thread keeps its connection between
+requests (Django health-checks it before reuse when CONN_HEALTH_CHECKS is
+on), which is the connection pool for this deployment. django_tenants
+forgets the connection's search_path on every set_tenant(), so each request
+would still start with a SET search_path; this backend remembers what the
+session actually has and skips the SET when the tenant's schema is the
+same. pool_metrics counts connections, health checks and search_path
+switches for the admin API (see admin_api.views.db_pool_stats).
+
+Requires TENANT_LIMIT_SET_CALLS = True (otherwise django_tenants sets the
+search_path on every cursor).
+"""
+import threading
+
+from django.core.exceptions import ValidationError
+from django_tenants.postgresql_backend import base as tenant_backend
+from django_tenants.utils import get_limit_set_calls
+
+
+class PoolMetrics:
+    """Process-wide connection counters"""
+
+    FIELDS = (
+        'connections_opened', 'connections_closed', 'health_checks', 'health_check_failures',
+        'search_path_sets', 'search_path_skips',
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, field):
+        with self._lock:
+            self._counts[field] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts['open_connections'] = counts['connections_opened'] - counts['connections_closed']
+        return counts
+
+
+pool_metrics = PoolMetrics()
+
+
+class DatabaseWrapper(tenant_backend.DatabaseWrapper):
+    # search_path the live session has, as set by the last successful SET
+    session_search_paths = None
+
+    def connect(self):
+        super().connect()
+        self.session_search_paths = None
+        pool_metrics.incr('connections_opened')
+
+    def close(self):
+        was_open = self.connection is not None
+        self.session_search_paths = None
+        super().close()
+        if was_open and self.connection is None:
+            pool_metrics.incr('connections_closed')
+
+    def is_usable(self):
+        pool_metrics.incr('health_checks')
+        usable = super().is_usable()
+        if not usable:
+            pool_metrics.incr('health_check_failures')
+        return usable
+
+    def set_tenant(self, tenant, include_public=True):
+        super().set_tenant(tenant, include_public)
+        if self.connection is None or self.session_search_paths is None:
+            return
+        try:
+            search_paths = self._get_cursor_search_paths()
+        except ValidationError:
+            return
+        if search_paths == self.session_search_paths:
+            # The session is already there; let _cursor skip the SET
+            self.search_path_set_schemas = search_paths
+
+    def _cursor(self, name=None):
+        sets_path = not get_limit_set_calls() or not self.search_path_set_schemas
+        cursor = super()._cursor(name=name)
+        if not sets_path:
+            pool_metrics.incr('search_path_skips')
+        elif self.search_path_set_schemas:
+            pool_metrics.incr('search_path_sets')
+            self.session_search_paths = self.search_path_set_schemas
+        return cursor
+
+    # A rollback can undo a SET search_path issued inside the transaction,
+    # so stop trusting the remembered path
+
+    def _rollback(self):
+        self.session_search_paths = None
+        self.search_path_set_schemas = None
+        return super()._rollback()
+
+    def _savepoint_rollback(self, sid):
+        self.session_search_paths = None
+        self.search_path_set_schemas = None
+        return super()._savepoint_rollback(sid)
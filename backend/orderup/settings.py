@@ -40,6 +40,9 @@ INSTALLED_APPS = list(SHARED_APPS) + [app for app in TENANT_APPS if app not in S
 TENANT_MODEL = "customers.Client" # app.Model
 TENANT_DOMAIN_MODEL = "customers.Domain" # app.Model
 
+# Seconds a resolved tenant stays in the in-process registry (0 disables caching)
+TENANT_CACHE_TTL = int(os.environ.get('TENANT_CACHE_TTL', 300))
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,17 +78,28 @@ TEMPLATES = [
 WSGI_APPLICATION = 'orderup.wsgi.application'
 ASGI_APPLICATION = 'orderup.asgi.application'
 
+# Connections are kept open between requests for DB_CONN_MAX_AGE seconds
+# (0 closes them after every request) and health-checked before reuse. The
+# backend wraps django_tenants' and skips SET search_path when the kept
+# connection is already on the request's schema (orderup.postgresql_backend).
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django_tenants.postgresql_backend', # mandatory
+        'ENGINE': 'orderup.postgresql_backend', # wraps django_tenants.postgresql_backend (mandatory)
         'NAME': os.environ.get('POSTGRES_DB', 'orderup'),
         'USER': os.environ.get('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'password'),
         'HOST': os.environ.get('POSTGRES_HOST', 'db'),
         'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_MAX_AGE > 0,
     }
 }
 
+# Set the search_path once per tenant switch rather than on every cursor
+TENANT_LIMIT_SET_CALLS = True
+
 DATABASE_ROUTERS = (
     'django_tenants.routers.TenantSyncRouter',
 )
@@ -117,6 +131,7 @@ if DEBUG:
         'x-tenant-subdomain',
         'accept',
         'authorization',
+        'idempotency-key',
     ]
     CORS_ALLOW_METHODS = [
         'GET',
@@ -136,6 +151,7 @@ else:
         'x-tenant-subdomain',
         'accept',
         'authorization',
+        'idempotency-key',
     ]
     CORS_ALLOW_METHODS = [
         'GET',
@@ -171,6 +187,55 @@ LOGGING = {
     },
 }
 
+# The default cache holds state shared between workers (tenant registry,
+# menu snapshots, cart versions, checkout idempotency): set CACHE_BACKEND to
+# django.core.cache.backends.redis.RedisCache (at CACHE_URL) when running
+# more than one process. Unset, each process keeps its own local memory.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+    },
+}
+if CACHES['default']['BACKEND'] == 'django.core.cache.backends.redis.RedisCache':
+    CACHES['default']['LOCATION'] = os.environ.get('CACHE_URL', 'redis://redis:6379/1')
+
+# Keep an incrementally updated stats row per tenant for the kitchen dashboard
+# (orders.stats); when off, OrderStatsView runs one aggregate query instead.
+ORDER_STATS_COUNTERS = os.environ.get('ORDER_STATS_COUNTERS', 'false').lower() == 'true'
+
+# Opt-in monthly partitioning of the tenant order tables (orders.partitions):
+# when on, `manage.py order_partitions` (run it daily) converts each tenant's
+# tables, creates partitions this many months ahead and, if a retention is
+# set, detaches months older than that.
+ORDER_PARTITIONING = os.environ.get('ORDER_PARTITIONING', 'false').lower() == 'true'
+ORDER_PARTITION_MONTHS_AHEAD = int(os.environ.get('ORDER_PARTITION_MONTHS_AHEAD', 3))
+ORDER_PARTITION_RETENTION_MONTHS = (
+    int(os.environ['ORDER_PARTITION_RETENTION_MONTHS']) if os.environ.get('ORDER_PARTITION_RETENTION_MONTHS') else None
+)
+
+# Order WebSocket events are queued and published by a background worker
+# (orders.events); events beyond the queue size are dropped, never blocked on.
+ORDER_EVENTS_MAX_QUEUE_SIZE = int(os.environ.get('ORDER_EVENTS_MAX_QUEUE_SIZE', 1000))
+ORDER_EVENTS_BATCH_SIZE = int(os.environ.get('ORDER_EVENTS_BATCH_SIZE', 100))
+
+# Where session carts live (store.cart_store): database rows by default, or
+# store.cart_store.RedisCartStore for TTL'd Redis hashes that only reach
+# Postgres at checkout.
+CART_STORE = {
+    'BACKEND': os.environ.get('CART_STORE_BACKEND', 'store.cart_store.DatabaseCartStore'),
+    'OPTIONS': {},
+}
+if CART_STORE['BACKEND'] == 'store.cart_store.RedisCartStore':
+    CART_STORE['OPTIONS'] = {
+        'LOCATION': os.environ.get('CART_STORE_URL', 'redis://redis:6379/2'),
+        'TTL': int(os.environ.get('CART_STORE_TTL', 60 * 60 * 24)),
+    }
+
+# Checkout responses are kept this long (seconds) under their idempotency key
+# so retried POSTs replay them instead of creating a second order
+# (orders.idempotency).
+CHECKOUT_IDEMPOTENCY_TTL = int(os.environ.get('CHECKOUT_IDEMPOTENCY_TTL', 15 * 60))
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -19,5 +19,11 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+
 # Use test runner
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
\ No newline at end of file
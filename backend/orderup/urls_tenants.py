@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from store.views import MenuViewSet, TenantInfoView, CartViewSet
-from orders.views import OrderViewSet, OrderStatsView, OrderStatusUpdateView
+from orders.views import OrderBulkStatusView, OrderViewSet, OrderStatsView, OrderStatusUpdateView
 
 router = DefaultRouter()
 router.register(r'menu', MenuViewSet, basename='menu')
@@ -10,6 +10,8 @@ router.register(r'admin/orders', OrderViewSet, basename='admin-orders')
 
 urlpatterns = [
     path('api/tenant/', TenantInfoView.as_view(), name='tenant-info'),
+    # Before the router, whose admin/orders/<pk>/ would match it
+    path('api/admin/orders/bulk-status/', OrderBulkStatusView.as_view(), name='admin-order-bulk-status'),
     path('api/', include(router.urls)),
     path('api/admin/order-stats/', OrderStatsView.as_view(), name='admin-order-stats'),
     path('api/admin/orders/<uuid:pk>/status/', OrderStatusUpdateView.as_view(), name='order-status-update'),
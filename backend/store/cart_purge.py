@@ -0,0 +1,112 @@
+"""
+Purging of checked-out and abandoned carts.
+
+Carts are deleted in small batches, each one a single statement that
+removes the carts together with their lines and modifiers, so no lock is
+held for longer than one batch and other sessions' carts are skipped
+rather than waited on. Statement-level deletes also keep the per-row
+cart-total signals (see store.signals) out of the way.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django_tenants.utils import get_public_schema_name, schema_context
+
+from .models import Cart, CartItem, CartItemModifier
+
+DEFAULT_BATCH_SIZE = 500
+
+PURGE_SQL = (
+    'WITH doomed AS ('
+    'SELECT id FROM {cart} '
+    'WHERE (is_active = false AND updated_at < %s) OR updated_at < %s '
+    'ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED'
+    '), lines AS ('
+    'SELECT id FROM {line} WHERE cart_id IN (SELECT id FROM doomed)'
+    '), modifiers AS ('
+    'DELETE FROM {modifier} WHERE cart_item_id IN (SELECT id FROM lines) RETURNING 1'
+    '), deleted_lines AS ('
+    'DELETE FROM {line} WHERE id IN (SELECT id FROM lines) RETURNING 1'
+    '), carts AS ('
+    'DELETE FROM {cart} WHERE id IN (SELECT id FROM doomed) RETURNING 1'
+    ') '
+    'SELECT (SELECT count(*) FROM carts), (SELECT count(*) FROM deleted_lines), '
+    '(SELECT count(*) FROM modifiers)'
+)
+
+
+def cart_schemas():
+    """Schemas holding cart tables: every tenant if store is a tenant app, else public"""
+    if 'store' not in settings.TENANT_APPS:
+        return [get_public_schema_name()]
+
+    from customers.models import Client
+
+    return list(
+        Client.objects.exclude(schema_name=get_public_schema_name())
+        .order_by('schema_name').values_list('schema_name', flat=True)
+    )
+
+
+def purge_batch(inactive_before, abandoned_before, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Delete up to `batch_size` carts that were checked out before
+    `inactive_before` or last touched before `abandoned_before`, in the
+    current schema. Returns (carts, lines, modifiers) deleted.
+    """
+    sql = PURGE_SQL.format(
+        cart=connection.ops.quote_name(Cart._meta.db_table),
+        line=connection.ops.quote_name(CartItem._meta.db_table),
+        modifier=connection.ops.quote_name(CartItemModifier._meta.db_table),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, [inactive_before, abandoned_before, batch_size])
+        return cursor.fetchone()
+
+
+def purge_carts(inactive_age, abandoned_age, batch_size=DEFAULT_BATCH_SIZE, pause=0,
+                max_batches=None, progress=None):
+    """
+    Purge carts from the current schema batch by batch until none are
+    left (or `max_batches` ran), sleeping `pause` seconds between batches.
+    `progress(carts, lines, modifiers)` is called with the running totals
+    after each batch. Returns the final totals.
+    """
+    now = timezone.now()
+    inactive_before, abandoned_before = now - inactive_age, now - abandoned_age
+    totals = [0, 0, 0]
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        deleted = purge_batch(inactive_before, abandoned_before, batch_size)
+        batches += 1
+        totals = [total + count for total, count in zip(totals, deleted)]
+        if progress:
+            progress(*totals)
+        if deleted[0] < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return tuple(totals)
+
+
+def purge_all_schemas(inactive_days=7, abandoned_days=30, schemas=None, **kwargs):
+    """
+    Schedulable entry point: purge `schemas` (default: cart_schemas()).
+    Takes the same keyword arguments as purge_carts, except that `progress`
+    receives the schema name first. Returns {schema_name: (carts, lines,
+    modifiers)}.
+    """
+    progress = kwargs.pop('progress', None)
+    results = {}
+    for schema_name in schemas or cart_schemas():
+        with schema_context(schema_name):
+            results[schema_name] = purge_carts(
+                timedelta(days=inactive_days),
+                timedelta(days=abandoned_days),
+                progress=(lambda *totals, schema_name=schema_name: progress(schema_name, *totals)) if progress else None,
+                **kwargs
+            )
+    return results
@@ -0,0 +1,822 @@
+"""
+Pluggable storage for anonymous session carts.
+
+CartViewSet and PublicOrderCreateView talk to the store returned by
+get_cart_store(), chosen by settings.CART_STORE:
+
+- DatabaseCartStore (default) keeps Cart/CartItem/CartItemModifier rows.
+- RedisCartStore keeps each cart as one Redis hash with a TTL, so carts
+  never touch Postgres until they are checked out and abandoned ones
+  simply expire.
+- InMemoryCartStore is the same hash layout in a process-local dict, for
+  tests and single-process development.
+
+Stores hold compact state only (item and modifier option ids and
+quantities, plus price snapshots taken when a line is added);
+render_cart() turns it into the API representation and render_slim_cart()
+into one that only references menu ids. Each session cart also has a
+version token in the cache (get_cart_version), which CartViewSet uses as
+the cart's ETag.
+"""
+import json
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+from .pricing import get_price_table, line_total, modifiers_total
+
+DEFAULT_CART_TTL = 60 * 60 * 24
+
+
+class CartLineNotFound(Exception):
+    """A batch operation referenced a line the cart doesn't have"""
+
+    def __init__(self, line_id):
+        super().__init__(f'Cart line {line_id} not found')
+        self.line_id = line_id
+
+
+class CartLine:
+    """
+    One cart line; `modifiers` is a list of (modifier_option_id, quantity).
+    `unit_price` and `modifiers_total` are the prices when the line was
+    added; modifier adjustments count once per line, not per unit.
+    """
+
+    __slots__ = ('id', 'item_id', 'quantity', 'special_instructions', 'modifiers', 'unit_price', 'modifiers_total')
+
+    def __init__(self, id, item_id, quantity=1, special_instructions='', modifiers=(),
+                 unit_price=None, modifiers_total=None):
+        self.id = id
+        self.item_id = item_id
+        self.quantity = quantity
+        self.special_instructions = special_instructions or ''
+        self.modifiers = [(int(option_id), int(qty)) for option_id, qty in modifiers]
+        self.unit_price = Decimal(unit_price) if unit_price is not None else None
+        self.modifiers_total = Decimal(modifiers_total) if modifiers_total is not None else Decimal('0.00')
+
+    @property
+    def line_total(self):
+        return line_total(self.quantity, self.unit_price, self.modifiers_total)
+
+
+class CartState:
+    """A session cart as held by a store"""
+
+    def __init__(self, session_id, lines=(), id=None, customer_id=None, created_at=None, updated_at=None):
+        self.session_id = session_id
+        self.lines = list(lines)
+        self.id = id
+        self.customer_id = customer_id
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @property
+    def subtotal(self):
+        return sum((line.line_total for line in self.lines), Decimal('0.00'))
+
+    @property
+    def item_count(self):
+        return sum(line.quantity for line in self.lines)
+
+    def get_line(self, line_id):
+        for line in self.lines:
+            if str(line.id) == str(line_id):
+                return line
+        return None
+
+
+class CartStore(ABC):
+    """Interface implemented by cart storage backends"""
+
+    @abstractmethod
+    def get(self, session_id):
+        """The active cart for `session_id`, or None"""
+
+    @abstractmethod
+    def get_or_create(self, session_id):
+        """The active cart for `session_id`, created empty if there is none"""
+
+    @abstractmethod
+    def add_line(self, session_id, item_id, quantity=1, special_instructions='', modifiers=(), prices=None):
+        """
+        Append a line to the (possibly new) cart and return it. `prices` is
+        the (unit_price, {option_id: price_adjustment}) snapshot, looked up
+        with snapshot_prices() when not given.
+        """
+
+    @abstractmethod
+    def update_line(self, session_id, line_id, quantity=None, special_instructions=None):
+        """Update a line in place; returns it, or None if there is no such line"""
+
+    @abstractmethod
+    def remove_line(self, session_id, line_id):
+        """Remove a line; returns False if there was no such line"""
+
+    @abstractmethod
+    def apply(self, session_id, operations):
+        """
+        Apply an ordered list of operations to the (possibly new) cart all
+        or nothing, and return the resulting CartState. Operations are
+        dicts: {'op': 'add', 'item_id', 'quantity', 'special_instructions',
+        'modifiers'}, {'op': 'update', 'line_id', 'quantity' and/or
+        'special_instructions'} or {'op': 'remove', 'line_id'}. Added lines
+        are priced from the price table. Raises CartLineNotFound (leaving
+        the cart untouched) when an update or remove names a line the cart
+        doesn't have.
+        """
+
+    @abstractmethod
+    def close(self, session_id):
+        """Retire the cart once it has been turned into an order"""
+
+    def load_checkout(self, session_id):
+        """
+        The cart with everything checkout needs: (cart or None,
+        {item_id: Item}, {option_id: ModifierOption}). Stores holding only
+        ids load the items and options in bulk.
+        """
+        from .models import Item, ModifierOption
+
+        cart = self.get(session_id)
+        if cart is None or not cart.lines:
+            return cart, {}, {}
+        option_ids = {option_id for line in cart.lines for option_id, _ in line.modifiers}
+        items = Item.objects.in_bulk({line.item_id for line in cart.lines})
+        options = ModifierOption.objects.in_bulk(option_ids) if option_ids else {}
+        return cart, items, options
+
+    @staticmethod
+    def plan(lines, operations):
+        """
+        Run `operations` against the cart's current `lines` in memory.
+        Returns the (line, option_prices) pairs to add, the lines to
+        rewrite and the ids of the lines to delete.
+        """
+        lines = {str(line.id): line for line in lines}
+        added, updated, removed = [], {}, set()
+        for operation in operations:
+            if operation['op'] == 'add':
+                added.append(priced_line(
+                    operation['item_id'], operation.get('quantity', 1), operation.get('special_instructions', ''),
+                    operation.get('modifiers', ())
+                ))
+                continue
+
+            line_id = str(operation['line_id'])
+            line = lines.get(line_id)
+            if line is None:
+                raise CartLineNotFound(operation['line_id'])
+            if operation['op'] == 'remove':
+                del lines[line_id]
+                updated.pop(line_id, None)
+                removed.add(line_id)
+            else:
+                if operation.get('quantity') is not None:
+                    line.quantity = operation['quantity']
+                if operation.get('special_instructions') is not None:
+                    line.special_instructions = operation['special_instructions']
+                updated[line_id] = line
+        return added, list(updated.values()), removed
+
+
+class DatabaseCartStore(CartStore):
+    """Carts as Cart/CartItem/CartItemModifier rows (the original storage)"""
+
+    def __init__(self, **options):
+        pass
+
+    def _state(self, cart):
+        return CartState(
+            cart.session_id,
+            [
+                self._line(cart_item)
+                for cart_item in cart.items.all()
+            ],
+            id=cart.id,
+            customer_id=cart.customer_id,
+            created_at=cart.created_at,
+            updated_at=cart.updated_at,
+        )
+
+    def _line(self, cart_item):
+        return CartLine(
+            cart_item.id, cart_item.item_id, cart_item.quantity, cart_item.special_instructions,
+            [(modifier.modifier_option_id, modifier.quantity) for modifier in cart_item.modifiers.all()],
+            unit_price=cart_item.unit_price, modifiers_total=cart_item.modifiers_total,
+        )
+
+    def _cart(self, session_id):
+        from .models import Cart
+
+        cart, created = Cart.objects.get_or_create(session_id=session_id, defaults={'is_active': True})
+        if not cart.is_active:
+            # The session checked out before; start it over with an empty cart
+            cart.items.all().delete()
+            cart.is_active = True
+            cart.subtotal, cart.item_count = Decimal('0.00'), 0
+            cart.save(update_fields=['is_active', 'subtotal', 'item_count', 'updated_at'])
+        return cart
+
+    def get(self, session_id):
+        from .models import Cart
+
+        cart = (
+            Cart.objects.filter(session_id=session_id, is_active=True)
+            .prefetch_related('items__modifiers')
+            .first()
+        )
+        return self._state(cart) if cart is not None else None
+
+    def get_or_create(self, session_id):
+        return self.get(session_id) or self._state(self._cart(session_id))
+
+    def add_line(self, session_id, item_id, quantity=1, special_instructions='', modifiers=(), prices=None):
+        from .models import CartItem, CartItemModifier
+
+        line, option_prices = priced_line(item_id, quantity, special_instructions, modifiers, prices)
+        with transaction.atomic():
+            # Created with its modifiers_total already set, so the post_save
+            # refresh of the cart totals is final and the bulk-created
+            # modifiers need no further updates
+            cart_item = CartItem.objects.create(
+                cart=self._cart(session_id),
+                item_id=item_id,
+                quantity=line.quantity,
+                special_instructions=line.special_instructions,
+                unit_price=line.unit_price,
+                modifiers_total=line.modifiers_total,
+            )
+            CartItemModifier.objects.bulk_create([
+                CartItemModifier(cart_item=cart_item, modifier_option_id=option_id, quantity=qty,
+                                 price_adjustment=option_prices[option_id])
+                for option_id, qty in line.modifiers
+            ])
+        line.id = cart_item.id
+        return line
+
+    def update_line(self, session_id, line_id, quantity=None, special_instructions=None):
+        from .models import CartItem
+
+        if not str(line_id).isdigit():
+            return None
+        cart_item = (
+            CartItem.objects.filter(cart__session_id=session_id, cart__is_active=True, id=line_id)
+            .prefetch_related('modifiers')
+            .first()
+        )
+        if cart_item is None:
+            return None
+        if quantity is not None:
+            cart_item.quantity = quantity
+        if special_instructions is not None:
+            cart_item.special_instructions = special_instructions
+        cart_item.save()
+        return self._line(cart_item)
+
+    def remove_line(self, session_id, line_id):
+        from .models import CartItem
+
+        if not str(line_id).isdigit():
+            return False
+        deleted, _ = CartItem.objects.filter(
+            cart__session_id=session_id, cart__is_active=True, id=line_id
+        ).delete()
+        return deleted > 0
+
+    def apply(self, session_id, operations):
+        from .models import Cart, CartItem, CartItemModifier
+
+        with transaction.atomic():
+            cart = self._cart(session_id)
+            cart_items = {
+                str(cart_item.id): cart_item
+                for cart_item in CartItem.objects.filter(cart=cart).select_for_update().prefetch_related('modifiers')
+            }
+            added, updated, removed = self.plan(
+                [self._line(cart_item) for cart_item in cart_items.values()], operations
+            )
+
+            if removed:
+                CartItem.objects.filter(cart=cart, id__in=removed).delete()
+            if updated:
+                now = timezone.now()
+                for line in updated:
+                    cart_item = cart_items[str(line.id)]
+                    cart_item.quantity = line.quantity
+                    cart_item.special_instructions = line.special_instructions
+                    cart_item.line_total = line.line_total
+                    cart_item.updated_at = now
+                CartItem.objects.bulk_update(
+                    [cart_items[str(line.id)] for line in updated],
+                    ['quantity', 'special_instructions', 'line_total', 'updated_at'],
+                )
+            if added:
+                new_items = CartItem.objects.bulk_create([
+                    CartItem(
+                        cart=cart, item_id=line.item_id, quantity=line.quantity,
+                        special_instructions=line.special_instructions, unit_price=line.unit_price,
+                        modifiers_total=line.modifiers_total, line_total=line.line_total,
+                    )
+                    for line, _ in added
+                ])
+                CartItemModifier.objects.bulk_create([
+                    CartItemModifier(cart_item=cart_item, modifier_option_id=option_id, quantity=qty,
+                                     price_adjustment=option_prices[option_id])
+                    for cart_item, (line, option_prices) in zip(new_items, added)
+                    for option_id, qty in line.modifiers
+                ])
+            # bulk writes skip the line signals; refresh the cart once
+            Cart.refresh_totals(cart.id)
+        return self.get(session_id)
+
+    def close(self, session_id):
+        from .models import Cart
+
+        Cart.objects.filter(session_id=session_id).update(is_active=False, updated_at=timezone.now())
+
+    def load_checkout(self, session_id):
+        """The whole cart graph in two joined reads: lines with cart and item, modifiers with option"""
+        from .models import CartItem, CartItemModifier
+
+        cart_items = list(
+            CartItem.objects.filter(cart__session_id=session_id, cart__is_active=True)
+            .select_related('cart', 'item')
+            .prefetch_related(Prefetch('modifiers', queryset=CartItemModifier.objects.select_related('modifier_option')))
+            .order_by('id')
+        )
+        if not cart_items:
+            # Tell an empty cart from a missing one
+            return self.get(session_id), {}, {}
+
+        cart = cart_items[0].cart
+        state = CartState(
+            cart.session_id,
+            [self._line(cart_item) for cart_item in cart_items],
+            id=cart.id,
+            customer_id=cart.customer_id,
+            created_at=cart.created_at,
+            updated_at=cart.updated_at,
+        )
+        items = {cart_item.item_id: cart_item.item for cart_item in cart_items}
+        options = {
+            modifier.modifier_option_id: modifier.modifier_option
+            for cart_item in cart_items for modifier in cart_item.modifiers.all()
+        }
+        return state, items, options
+
+
+class HashCartStore(CartStore):
+    """
+    Each cart is one hash, `<prefix>:<schema>:<session_id>`, with fields
+    `created_at`, `updated_at`, a `seq` line-id counter and one `l:<id>`
+    field per line holding [item_id, quantity, instructions, modifiers,
+    unit_price, modifiers_total] as JSON. Every write refreshes the key's
+    TTL. Totals are summed from the lines when the hash is read.
+
+    Writes that depend on what the cart holds read it and write it back in
+    one WATCH/MULTI transaction (see _transaction), so concurrent requests
+    can't lose each other's changes or bring back a cart closed meanwhile.
+    """
+
+    LINE_PREFIX = 'l:'
+
+    def __init__(self, client, ttl=DEFAULT_CART_TTL, key_prefix='cart'):
+        self.client = client
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    def key(self, session_id):
+        schema = getattr(connection, 'schema_name', 'public')
+        return f'{self.key_prefix}:{schema}:{session_id}'
+
+    @staticmethod
+    def _text(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _line(self, line_id, raw):
+        item_id, quantity, special_instructions, modifiers, unit_price, modifiers_total = json.loads(raw)
+        return CartLine(int(line_id), item_id, quantity, special_instructions, modifiers,
+                        unit_price=unit_price, modifiers_total=modifiers_total)
+
+    def _encode(self, line):
+        return json.dumps(
+            [line.item_id, line.quantity, line.special_instructions, line.modifiers,
+             str(line.unit_price), str(line.modifiers_total)],
+            separators=(',', ':')
+        )
+
+    def _touch(self, pipe, key, **fields):
+        fields['updated_at'] = timezone.now().isoformat()
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, self.ttl)
+
+    def _transaction(self, session_id, change):
+        """
+        Run change(pipe, key, raw) against the cart hash `raw` as read under
+        WATCH. change() queues its writes on `pipe` (already in MULTI) and
+        returns the result; if another client writes the cart before EXEC,
+        the transaction fails and runs again on a fresh read.
+        """
+        key = self.key(session_id)
+
+        def run(pipe):
+            raw = self._fields(pipe.hgetall(key))
+            pipe.multi()
+            return change(pipe, key, raw)
+
+        return self.client.transaction(run, key, value_from_callable=True)
+
+    def _fields(self, raw):
+        return {self._text(field): self._text(value) for field, value in raw.items()}
+
+    def get(self, session_id):
+        return self._state(session_id, self._fields(self.client.hgetall(self.key(session_id))))
+
+    def _state(self, session_id, raw):
+        if not raw:
+            return None
+        lines = [
+            self._line(field[len(self.LINE_PREFIX):], value)
+            for field, value in raw.items()
+            if field.startswith(self.LINE_PREFIX)
+        ]
+        lines.sort(key=lambda line: line.id)
+        return CartState(
+            session_id, lines, id=session_id,
+            created_at=parse_datetime(raw.get('created_at', '')),
+            updated_at=parse_datetime(raw.get('updated_at', '')),
+        )
+
+    def get_or_create(self, session_id):
+        key = self.key(session_id)
+        now = timezone.now().isoformat()
+        pipe = self.client.pipeline()
+        pipe.hsetnx(key, 'created_at', now)
+        pipe.hsetnx(key, 'updated_at', now)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+        return self.get(session_id)
+
+    def add_line(self, session_id, item_id, quantity=1, special_instructions='', modifiers=(), prices=None):
+        line, _ = priced_line(item_id, quantity, special_instructions, modifiers, prices)
+
+        def change(pipe, key, raw):
+            line.id = int(raw.get('seq', 0)) + 1
+            pipe.hsetnx(key, 'created_at', timezone.now().isoformat())
+            self._touch(pipe, key, seq=line.id, **{f'{self.LINE_PREFIX}{line.id}': self._encode(line)})
+            return line
+
+        return self._transaction(session_id, change)
+
+    def update_line(self, session_id, line_id, quantity=None, special_instructions=None):
+        field = f'{self.LINE_PREFIX}{line_id}'
+
+        def change(pipe, key, raw):
+            if field not in raw:
+                return None
+            line = self._line(line_id, raw[field])
+            if quantity is not None:
+                line.quantity = quantity
+            if special_instructions is not None:
+                line.special_instructions = special_instructions
+            self._touch(pipe, key, **{field: self._encode(line)})
+            return line
+
+        return self._transaction(session_id, change)
+
+    def remove_line(self, session_id, line_id):
+        field = f'{self.LINE_PREFIX}{line_id}'
+
+        def change(pipe, key, raw):
+            if field not in raw:
+                return False
+            pipe.hdel(key, field)
+            self._touch(pipe, key)
+            return True
+
+        return self._transaction(session_id, change)
+
+    def apply(self, session_id, operations):
+        def change(pipe, key, raw):
+            cart = self._state(session_id, raw)
+            added, updated, removed = self.plan(cart.lines if cart else [], operations)
+
+            fields = {}
+            if added:
+                # Number the new lines after the last id handed out
+                seq = int(raw.get('seq', 0))
+                for offset, (line, _) in enumerate(added, 1):
+                    line.id = seq + offset
+                fields['seq'] = seq + len(added)
+            fields.update({
+                f'{self.LINE_PREFIX}{line.id}': self._encode(line)
+                for line in updated + [line for line, _ in added]
+            })
+
+            pipe.hsetnx(key, 'created_at', timezone.now().isoformat())
+            if removed:
+                pipe.hdel(key, *[f'{self.LINE_PREFIX}{line_id}' for line_id in removed])
+            self._touch(pipe, key, **fields)
+
+        self._transaction(session_id, change)
+        return self.get(session_id)
+
+    def close(self, session_id):
+        self.client.delete(self.key(session_id))
+
+
+class RedisCartStore(HashCartStore):
+    """
+    HashCartStore on Redis. OPTIONS: LOCATION (redis URL, defaults to the
+    cache server's when the cache is Redis), TTL (seconds) and KEY_PREFIX.
+    """
+
+    def __init__(self, LOCATION=None, TTL=DEFAULT_CART_TTL, KEY_PREFIX='cart'):
+        import redis
+
+        location = LOCATION or settings.CACHES['default'].get('LOCATION')
+        if not location:
+            raise ImproperlyConfigured('RedisCartStore needs a LOCATION when the default cache is not Redis')
+        super().__init__(redis.Redis.from_url(location), ttl=TTL, key_prefix=KEY_PREFIX)
+
+
+class InMemoryHashes:
+    """The subset of the Redis hash/TTL commands HashCartStore uses, in a dict"""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        # Writes per key, to detect changes to watched keys
+        self._writes = {}
+        self._lock = threading.RLock()
+
+    def _written(self, *keys):
+        for key in keys:
+            self._writes[key] = self._writes.get(key, 0) + 1
+
+    def _hash(self, key, create=False):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        if create:
+            return self._data.setdefault(key, {})
+        return self._data.get(key, {})
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._hash(key))
+
+    def hget(self, key, field):
+        with self._lock:
+            return self._hash(key).get(field)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            data = self._hash(key, create=True)
+            if field is not None:
+                data[field] = value
+            data.update(mapping or {})
+            self._written(key)
+
+    def hsetnx(self, key, field, value):
+        with self._lock:
+            data = self._hash(key, create=True)
+            if field in data:
+                return 0
+            data[field] = value
+            self._written(key)
+            return 1
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            data = self._hash(key)
+            self._written(key)
+            return sum(data.pop(field, None) is not None for field in fields)
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if key in self._data:
+                self._expires[key] = time.monotonic() + seconds
+                self._written(key)
+
+    def ttl(self, key):
+        with self._lock:
+            if not self._hash(key):
+                return -2
+            expires = self._expires.get(key)
+            return -1 if expires is None else int(round(expires - time.monotonic()))
+
+    def delete(self, *keys):
+        with self._lock:
+            self._written(*keys)
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def pipeline(self):
+        return _InMemoryPipeline(self)
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        """
+        Like redis-py's: func(pipe) reads straight away until pipe.multi()
+        and queues after; runs again if a watched key was written meanwhile
+        """
+        while True:
+            with self._lock:
+                seen = [self._writes.get(key, 0) for key in watches]
+            pipe = _InMemoryPipeline(self, immediate=True)
+            value = func(pipe)
+            with self._lock:
+                if [self._writes.get(key, 0) for key in watches] != seen:
+                    continue
+                result = pipe.execute()
+            return value if value_from_callable else result
+
+
+class _InMemoryPipeline:
+    def __init__(self, client, immediate=False):
+        self._client = client
+        self._calls = []
+        self._immediate = immediate
+
+    def multi(self):
+        self._immediate = False
+
+    def __getattr__(self, name):
+        if self._immediate:
+            return getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._calls.append((getattr(self._client, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._client._lock:
+            return [method(*args, **kwargs) for method, args, kwargs in self._calls]
+
+
+class InMemoryCartStore(HashCartStore):
+    """HashCartStore on a process-local dict; OPTIONS: TTL and KEY_PREFIX"""
+
+    def __init__(self, TTL=DEFAULT_CART_TTL, KEY_PREFIX='cart'):
+        super().__init__(InMemoryHashes(), ttl=TTL, key_prefix=KEY_PREFIX)
+
+
+def snapshot_prices(item_id, option_ids):
+    """(item price, {option_id: price_adjustment}) as of now, from the price table"""
+    table = get_price_table([item_id], option_ids)
+    return table.item_price(item_id), table.option_prices(option_ids)
+
+
+def priced_line(item_id, quantity, special_instructions, modifiers, prices=None):
+    """A new CartLine carrying its price snapshot, and the per-option prices"""
+    line = CartLine(None, item_id, quantity, special_instructions, modifiers)
+    unit_price, option_prices = prices or snapshot_prices(item_id, {option_id for option_id, _ in line.modifiers})
+    line.unit_price = Decimal(unit_price)
+    line.modifiers_total = modifiers_total(line.modifiers, option_prices)
+    return line, option_prices
+
+
+_store = None
+
+
+def get_cart_store():
+    """The store configured by settings.CART_STORE (built once per process)"""
+    global _store
+    if _store is None:
+        config = getattr(settings, 'CART_STORE', {})
+        backend = import_string(config.get('BACKEND', 'store.cart_store.DatabaseCartStore'))
+        _store = backend(**config.get('OPTIONS', {}))
+    return _store
+
+
+def _version_key(session_id):
+    schema = getattr(connection, 'schema_name', 'public')
+    return f'cart:version:{schema}:{session_id}'
+
+
+def get_cart_version(session_id):
+    """
+    Opaque token for the session cart's current state, kept in the cache so
+    checking it never touches the cart store. A lost token is simply
+    replaced, which only costs clients one full response.
+    """
+    version = cache.get(_version_key(session_id))
+    if version is None:
+        cache.add(_version_key(session_id), uuid.uuid4().hex, getattr(get_cart_store(), 'ttl', DEFAULT_CART_TTL))
+        version = cache.get(_version_key(session_id))
+    return version
+
+
+def bump_cart_version(session_id):
+    """Give the cart a new version token; call after every mutation"""
+    cache.set(_version_key(session_id), uuid.uuid4().hex, getattr(get_cart_store(), 'ttl', DEFAULT_CART_TTL))
+
+
+@receiver(setting_changed)
+def reset_cart_store(setting, **kwargs):
+    global _store
+    if setting == 'CART_STORE':
+        _store = None
+
+
+def render_cart(cart):
+    """
+    API representation of a CartState (the shape CartSerializer produced),
+    loading the items and modifier options it references in bulk.
+    """
+    from .models import Item, ModifierOption
+    from .serializers import ItemSerializer, ModifierOptionSerializer
+
+    item_ids = {line.item_id for line in cart.lines}
+    option_ids = {option_id for line in cart.lines for option_id, _ in line.modifiers}
+    items = Item.objects.prefetch_related('modifier_groups__options').in_bulk(item_ids) if item_ids else {}
+    options = ModifierOption.objects.in_bulk(option_ids) if option_ids else {}
+    item_data = {pk: ItemSerializer(item).data for pk, item in items.items()}
+    option_data = {pk: ModifierOptionSerializer(option).data for pk, option in options.items()}
+
+    lines = []
+    for line in cart.lines:
+        if line.item_id not in items:
+            # The item was removed from the menu since it was added
+            continue
+        lines.append({
+            'id': line.id,
+            'item': item_data[line.item_id],
+            'quantity': line.quantity,
+            'special_instructions': line.special_instructions,
+            'modifiers': [
+                {'modifier_option': option_data[option_id], 'quantity': qty}
+                for option_id, qty in line.modifiers
+                if option_id in option_data
+            ],
+            'unit_price': line.unit_price,
+            'modifiers_total': line.modifiers_total,
+            'total_price': line.line_total,
+        })
+
+    return {
+        'id': cart.id,
+        'session_id': cart.session_id,
+        'customer': cart.customer_id,
+        'created_at': cart.created_at.isoformat() if cart.created_at else None,
+        'updated_at': cart.updated_at.isoformat() if cart.updated_at else None,
+        'is_active': True,
+        'items': lines,
+        'total_amount': str(cart.subtotal),
+        'total_items': cart.item_count,
+    }
+
+
+def render_line(line):
+    """API representation of a single CartLine"""
+    return render_cart(CartState(None, [line]))['items'][0]
+
+
+def render_slim_cart(cart):
+    """
+    Compact representation of a CartState: lines reference menu item and
+    modifier option ids (resolve them against the cached menu) instead of
+    embedding them, so rendering runs no queries.
+    """
+    return {
+        'id': cart.id,
+        'session_id': cart.session_id,
+        'updated_at': cart.updated_at.isoformat() if cart.updated_at else None,
+        'items': [
+            {
+                'id': line.id,
+                'item_id': line.item_id,
+                'quantity': line.quantity,
+                'special_instructions': line.special_instructions,
+                'modifiers': [
+                    {'modifier_option_id': option_id, 'quantity': qty} for option_id, qty in line.modifiers
+                ],
+                'unit_price': str(line.unit_price),
+                'modifiers_total': str(line.modifiers_total),
+                'total_price': str(line.line_total),
+            }
+            for line in cart.lines
+        ],
+        'total_amount': str(cart.subtotal),
+        'total_items': cart.item_count,
+    }
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.cart_purge import DEFAULT_BATCH_SIZE, purge_all_schemas
+
+
+class Command(BaseCommand):
+    help = 'Deletes checked-out and abandoned carts in small batches (safe to run from cron during service hours)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inactive-days', type=int, default=7,
+                            help='Delete checked-out carts older than N days (default: 7)')
+        parser.add_argument('--abandoned-days', type=int, default=30,
+                            help='Delete any cart untouched for N days (default: 30)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f'Carts deleted per statement (default: {DEFAULT_BATCH_SIZE})')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches (default: 0.1)')
+        parser.add_argument('--max-batches', type=int,
+                            help='Stop after N batches per schema (default: until done)')
+        parser.add_argument('--schema', action='append', dest='schemas',
+                            help='Schema to purge (repeatable; default: every schema with cart tables)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['abandoned_days'] < 1 or options['inactive_days'] < 0:
+            raise CommandError('--abandoned-days must be at least 1 and --inactive-days not negative')
+
+        def progress(schema_name, carts, lines, modifiers):
+            self.stdout.write(f'{schema_name}: {carts} carts, {lines} lines, {modifiers} modifiers deleted')
+
+        results = purge_all_schemas(
+            inactive_days=options['inactive_days'],
+            abandoned_days=options['abandoned_days'],
+            schemas=options['schemas'],
+            batch_size=options['batch_size'],
+            pause=options['sleep'],
+            max_batches=options['max_batches'],
+            progress=progress if options['verbosity'] else None,
+        )
+        carts = sum(totals[0] for totals in results.values())
+        self.stdout.write(self.style.SUCCESS(f'Purged {carts} carts from {len(results)} schema(s)'))
@@ -0,0 +1,89 @@
+"""
+Pre-rendered menu documents.
+
+The public menu is rendered once per tenant into JSON bytes and kept in the
+cache under a version token. Any change to a Category, Item, ModifierGroup
+or ModifierOption replaces the token (see store.signals), so the next read
+rebuilds the document and every older copy simply stops being referenced.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Prefetch
+from django_tenants.utils import get_public_schema_name
+from rest_framework.renderers import JSONRenderer
+
+
+class MenuSnapshot:
+    def __init__(self, body, etag, version):
+        self.body = body
+        self.etag = etag
+        self.version = version
+
+
+def menu_scope():
+    """Schema whose menu tables are in use (store may be a shared app)"""
+    if 'store' in settings.TENANT_APPS:
+        return getattr(connection, 'schema_name', get_public_schema_name())
+    return get_public_schema_name()
+
+
+def _version_key(scope):
+    return f'menu:version:{scope}'
+
+
+def _snapshot_key(scope, version):
+    return f'menu:snapshot:{scope}:{version}'
+
+
+def get_menu_version(scope=None):
+    scope = scope or menu_scope()
+    version = cache.get(_version_key(scope))
+    if version is None:
+        cache.add(_version_key(scope), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(scope))
+    return version
+
+
+def invalidate_menu(scope=None):
+    """Point the scope at a fresh version; the next read rebuilds the document"""
+    scope = scope or menu_scope()
+    cache.set(_version_key(scope), uuid.uuid4().hex, None)
+
+
+def menu_queryset():
+    from .models import Category, Item
+
+    available_items = Item.objects.filter(is_available=True).prefetch_related(
+        'modifier_groups__options'
+    )
+    return Category.objects.filter(is_active=True).prefetch_related(
+        Prefetch('items', queryset=available_items)
+    )
+
+
+def render_menu():
+    from .serializers import CategorySerializer
+
+    data = CategorySerializer(menu_queryset(), many=True).data
+    return JSONRenderer().render(data)
+
+
+def get_menu_snapshot():
+    """Return the current MenuSnapshot, building it on a cache miss"""
+    scope = menu_scope()
+    version = get_menu_version(scope)
+    key = _snapshot_key(scope, version)
+
+    cached = cache.get(key)
+    if cached is not None:
+        body, etag = cached
+        return MenuSnapshot(body, etag, version)
+
+    body = render_menu()
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    cache.set(key, (body, etag), getattr(settings, 'MENU_CACHE_TIMEOUT', 24 * 60 * 60))
+    return MenuSnapshot(body, etag, version)
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:59
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_customer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='modifiers_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='cartitemmodifier',
+            name='price_adjustment',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True),
+        ),
+        migrations.RunSQL(
+            sql=[
+                "UPDATE store_cartitemmodifier m SET price_adjustment = o.price_adjustment "
+                "FROM store_modifieroption o WHERE o.id = m.modifier_option_id AND m.price_adjustment IS NULL",
+                "UPDATE store_cartitem ci SET unit_price = i.price "
+                "FROM store_item i WHERE i.id = ci.item_id AND ci.unit_price IS NULL",
+                "UPDATE store_cartitem ci SET modifiers_total = t.total, "
+                "line_total = ci.quantity * ci.unit_price + t.total "
+                "FROM (SELECT c.id, coalesce(sum(m.quantity * m.price_adjustment), 0) AS total "
+                "FROM store_cartitem c LEFT JOIN store_cartitemmodifier m ON m.cart_item_id = c.id "
+                "GROUP BY c.id) t WHERE t.id = ci.id",
+                "UPDATE store_cart c SET subtotal = t.subtotal, item_count = t.item_count "
+                "FROM (SELECT cart_id, sum(line_total) AS subtotal, sum(quantity) AS item_count "
+                "FROM store_cartitem GROUP BY cart_id) t WHERE t.cart_id = c.id",
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
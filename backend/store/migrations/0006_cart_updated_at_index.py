@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_cart_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated_at'], name='idx_cart_updated_at'),
+        ),
+    ]
@@ -1,5 +1,14 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
+
+from .pricing import adjustment_total, line_total
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -54,26 +63,53 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Denormalised from the lines (see refresh_totals), so reading a cart's
+    # totals never touches cart items
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    item_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Range scans for store.cart_purge
+            models.Index(fields=['updated_at'], name='idx_cart_updated_at'),
+        ]
 
     def __str__(self):
         return f"Cart {self.session_id}"
 
     @property
     def total_amount(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.subtotal
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.item_count
+
+    @classmethod
+    def refresh_totals(cls, cart_id):
+        """Recompute subtotal and item_count from the lines in one UPDATE"""
+        lines = CartItem.objects.filter(cart_id=OuterRef('pk')).order_by().values('cart_id')
+        cls.objects.filter(pk=cart_id).update(
+            subtotal=Coalesce(
+                Subquery(lines.annotate(total=Sum('line_total')).values('total')),
+                Value(Decimal('0.00')), output_field=MONEY,
+            ),
+            item_count=Coalesce(Subquery(lines.annotate(count=Sum('quantity')).values('count')), Value(0)),
+            updated_at=timezone.now(),
+        )
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     special_instructions = models.TextField(blank=True, null=True)
+    # Price snapshots: the item price when the line was added, the sum of
+    # its modifier adjustments, and the line total (store.pricing.line_total;
+    # refresh_totals applies the same rule in SQL)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    modifiers_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -83,14 +119,41 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity}x {self.item.name} in cart {self.cart.session_id}"
 
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.item.price
+        self.line_total = line_total(self.quantity, self.unit_price, self.modifiers_total)
+        # The cart totals are refreshed by a post_save receiver in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     @property
     def total_price(self):
-        return self.quantity * self.item.price
+        return self.line_total
+
+    @classmethod
+    def refresh_totals(cls, cart_item_id):
+        """Recompute modifiers_total and line_total from the modifiers in one UPDATE"""
+        modifiers_total = Coalesce(
+            Subquery(
+                CartItemModifier.objects.filter(cart_item_id=OuterRef('pk')).order_by()
+                .values('cart_item_id')
+                .annotate(total=Sum(F('quantity') * F('price_adjustment')))
+                .values('total')
+            ),
+            Value(Decimal('0.00')), output_field=MONEY,
+        )
+        cls.objects.filter(pk=cart_item_id).update(
+            modifiers_total=modifiers_total,
+            line_total=ExpressionWrapper(F('quantity') * F('unit_price') + modifiers_total, output_field=MONEY),
+        )
 
 class CartItemModifier(models.Model):
     cart_item = models.ForeignKey(CartItem, related_name='modifiers', on_delete=models.CASCADE)
     modifier_option = models.ForeignKey(ModifierOption, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # The option's price adjustment when it was added
+    price_adjustment = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
 
     class Meta:
         unique_together = ['cart_item', 'modifier_option']
@@ -98,9 +161,15 @@ class CartItemModifier(models.Model):
     def __str__(self):
         return f"{self.quantity}x {self.modifier_option.name} for {self.cart_item}"
 
+    def save(self, *args, **kwargs):
+        if self.price_adjustment is None:
+            self.price_adjustment = self.modifier_option.price_adjustment
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     @property
     def total_price(self):
-        return self.quantity * self.modifier_option.price_adjustment
+        return adjustment_total(self.price_adjustment, self.quantity)
 
 
 class Table(models.Model):
@@ -0,0 +1,133 @@
+"""
+Modifier validation for add-to-cart.
+
+The modifier groups and options of each item are read from the cached menu
+document (store.menu_cache) and indexed once per menu version in this
+process, so validating a selection normally costs no queries. Items that
+are not on the public menu fall back to one prefetched lookup. Prices come
+from store.pricing.
+"""
+import json
+
+from .menu_cache import get_menu_snapshot, get_menu_version, menu_scope
+
+
+class ModifierSelectionError(Exception):
+    """The submitted modifiers break the item's modifier rules"""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+class ModifierGroupRules:
+    def __init__(self, id, name, min_selection, max_selection, options, unavailable=()):
+        self.id = id
+        self.name = name
+        self.min_selection = min_selection
+        self.max_selection = max_selection
+        # Ids of the options that can be chosen
+        self.options = set(options)
+        self.unavailable = set(unavailable)
+
+
+class ItemModifiers:
+    """An item's modifier groups, as needed to validate a selection"""
+
+    def __init__(self, item_id, groups):
+        self.item_id = item_id
+        self.groups = groups
+
+    @classmethod
+    def from_menu(cls, item):
+        groups = [
+            ModifierGroupRules(
+                group['id'], group['name'], group['min_selection'], group['max_selection'],
+                [option['id'] for option in group['options'] if option['is_available']],
+                [option['id'] for option in group['options'] if not option['is_available']],
+            )
+            for group in item['modifier_groups']
+        ]
+        return cls(item['id'], groups)
+
+    @classmethod
+    def from_model(cls, item):
+        groups = [
+            ModifierGroupRules(
+                group.id, group.name, group.min_selection, group.max_selection,
+                [option.id for option in group.options.all() if option.is_available],
+                [option.id for option in group.options.all() if not option.is_available],
+            )
+            for group in item.modifier_groups.all()
+        ]
+        return cls(item.id, groups)
+
+    def validate(self, selections):
+        """
+        Check (option_id, quantity) selections against the groups' rules.
+        Raises ModifierSelectionError listing every broken rule.
+        """
+        selected = [option_id for option_id, _ in selections]
+        chosen = set(selected)
+        errors = []
+
+        if len(chosen) != len(selected):
+            errors.append('Each modifier option can only be chosen once.')
+
+        known = set()
+        unavailable = set()
+        for group in self.groups:
+            known |= group.options
+            unavailable |= group.unavailable
+        if chosen & unavailable:
+            errors.append(f'Modifier options not available: {sorted(chosen & unavailable)}')
+        if chosen - known - unavailable:
+            errors.append(f'Modifier options not valid for this item: {sorted(chosen - known - unavailable)}')
+
+        for group in self.groups:
+            in_group = chosen & group.options
+            if len(in_group) < group.min_selection:
+                errors.append(f'Choose at least {group.min_selection} option(s) for "{group.name}".')
+            elif len(in_group) > group.max_selection:
+                errors.append(f'Choose at most {group.max_selection} option(s) for "{group.name}".')
+
+        if errors:
+            raise ModifierSelectionError(errors)
+
+
+# {scope: (menu version, {item_id: ItemModifiers})}, rebuilt when the
+# menu version changes
+_menu_index = {}
+
+
+def _index_menu(scope):
+    version = get_menu_version(scope)
+    cached = _menu_index.get(scope)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    snapshot = get_menu_snapshot()
+    index = {
+        item['id']: ItemModifiers.from_menu(item)
+        for category in json.loads(snapshot.body)
+        for item in category['items']
+    }
+    _menu_index[scope] = (snapshot.version, index)
+    return index
+
+
+def load_item_modifiers(item_ids):
+    """
+    {item_id: ItemModifiers} for the available items among `item_ids`,
+    from the menu index, with one prefetched lookup for any that aren't on
+    the menu (e.g. items in an inactive category).
+    """
+    from .models import Item
+
+    index = _index_menu(menu_scope())
+    found = {item_id: index[item_id] for item_id in item_ids if item_id in index}
+    missing = set(item_ids) - set(found)
+    if missing:
+        items = Item.objects.filter(pk__in=missing, is_available=True).prefetch_related('modifier_groups__options')
+        found.update((item.id, ItemModifiers.from_model(item)) for item in items)
+    return found
@@ -0,0 +1,149 @@
+"""
+Pricing: the one place cart, order and receipt totals are computed.
+
+A PriceTable maps item ids to prices and modifier option ids to price
+adjustments. It is built with one query per table and kept per tenant
+scope until the menu version changes (store.signals replaces the version on
+any Category, Item, ModifierGroup or ModifierOption change), so pricing a
+cart normally runs no queries. Ids it doesn't have yet are loaded on their
+own and merged in; ids that turn out not to exist are remembered until the
+next version change, so asking again raises UnknownPrice without a query.
+
+Every total follows the same rule: a line is quantity * unit price plus
+its modifier adjustments, and the adjustments count once per line, not per
+unit.
+"""
+from decimal import Decimal
+
+from .menu_cache import get_menu_version, menu_scope
+
+ZERO = Decimal('0.00')
+
+
+class UnknownPrice(KeyError):
+    """An item or modifier option id that isn't in the price table"""
+
+
+class PriceTable:
+    def __init__(self, items, options):
+        # {item_id: price}, {option_id: price_adjustment}
+        self.items = items
+        self.options = options
+        # Ids looked up and found not to exist
+        self.missing_items = set()
+        self.missing_options = set()
+
+    @classmethod
+    def from_db(cls):
+        from .models import Item, ModifierOption
+
+        return cls(
+            dict(Item.objects.values_list('id', 'price')),
+            dict(ModifierOption.objects.values_list('id', 'price_adjustment')),
+        )
+
+    def unloaded(self, item_ids=(), option_ids=()):
+        """The (item ids, option ids) neither in the table nor known to be missing"""
+        return (
+            set(item_ids) - self.items.keys() - self.missing_items,
+            set(option_ids) - self.options.keys() - self.missing_options,
+        )
+
+    def load(self, item_ids=(), option_ids=()):
+        """Merge in the rows for these ids, one query per table that has any"""
+        from .models import Item, ModifierOption
+
+        if item_ids:
+            found = dict(Item.objects.filter(id__in=item_ids).values_list('id', 'price'))
+            self.items.update(found)
+            self.missing_items.update(set(item_ids) - found.keys())
+        if option_ids:
+            found = dict(ModifierOption.objects.filter(id__in=option_ids).values_list('id', 'price_adjustment'))
+            self.options.update(found)
+            self.missing_options.update(set(option_ids) - found.keys())
+
+    def item_price(self, item_id):
+        try:
+            return self.items[item_id]
+        except KeyError:
+            raise UnknownPrice(item_id)
+
+    def option_prices(self, option_ids):
+        """{option_id: price_adjustment} for `option_ids`"""
+        try:
+            return {option_id: self.options[option_id] for option_id in option_ids}
+        except KeyError as e:
+            raise UnknownPrice(e.args[0])
+
+
+# {scope: (menu version, PriceTable)}
+_tables = {}
+
+
+def get_price_table(item_ids=(), option_ids=()):
+    """
+    The current scope's PriceTable, rebuilt when the menu version changes.
+    Pass the ids about to be priced to also load those it doesn't have
+    (rows created since the last version change may not be in it yet).
+    """
+    scope = menu_scope()
+    version = get_menu_version(scope)
+    cached = _tables.get(scope)
+    if cached is not None and cached[0] == version:
+        table = cached[1]
+    else:
+        table = PriceTable.from_db()
+        _tables[scope] = (version, table)
+
+    table.load(*table.unloaded(item_ids, option_ids))
+    return table
+
+
+def adjustment_total(price_adjustment, quantity):
+    """One modifier's contribution to its line"""
+    return quantity * price_adjustment
+
+
+def modifiers_total(modifiers, option_prices):
+    """Sum of (option_id, quantity) adjustments priced from {option_id: price_adjustment}"""
+    return sum(
+        (adjustment_total(option_prices[option_id], quantity) for option_id, quantity in modifiers), ZERO
+    )
+
+
+def line_total(quantity, unit_price, modifiers_sum=ZERO):
+    return quantity * unit_price + modifiers_sum
+
+
+class PricedCart:
+    """Per-line (unit_price, modifiers_total, line_total) and the cart totals"""
+
+    def __init__(self, lines, subtotal, item_count):
+        self.lines = lines
+        self.subtotal = subtotal
+        self.item_count = item_count
+
+
+def price_lines(lines, table=None):
+    """
+    Price (item_id, quantity, [(option_id, quantity)]) lines in one pass:
+    item and option prices are looked up column-wise from the table, then
+    the line totals and cart subtotal are summed together. Raises
+    UnknownPrice for ids the table doesn't know.
+    """
+    item_ids, quantities, modifier_lists = zip(*lines) if lines else ((), (), ())
+    option_ids = {option_id for modifiers in modifier_lists for option_id, _ in modifiers}
+    table = table or get_price_table(item_ids, option_ids)
+    unit_prices = [table.item_price(item_id) for item_id in item_ids]
+    option_prices = table.option_prices(option_ids)
+    adjustments = [modifiers_total(modifiers, option_prices) for modifiers in modifier_lists]
+
+    priced = [
+        (unit_price, adjustment, line_total(quantity, unit_price, adjustment))
+        for quantity, unit_price, adjustment in zip(quantities, unit_prices, adjustments)
+    ]
+    return PricedCart(
+        priced,
+        sum((total for _, _, total in priced), ZERO),
+        sum(quantities),
+    )
@@ -34,7 +34,8 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'items']
 
     def get_items(self, obj):
-        items = obj.items.filter(is_available=True)
+        # Filter in Python so a prefetched `items` relation is reused
+        items = [item for item in obj.items.all() if item.is_available]
         return ItemSerializer(items, many=True).data
 
 class CartItemModifierSerializer(serializers.ModelSerializer):
@@ -44,7 +45,8 @@ class CartItemModifierSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CartItemModifier
-        fields = ['id', 'modifier_option', 'modifier_option_id', 'quantity']
+        fields = ['id', 'modifier_option', 'modifier_option_id', 'quantity', 'price_adjustment']
+        read_only_fields = ['price_adjustment']
 
     def create(self, validated_data):
         return CartItemModifier.objects.create(**validated_data)
@@ -52,13 +54,14 @@ class CartItemModifierSerializer(serializers.ModelSerializer):
 class CartItemSerializer(serializers.ModelSerializer):
     item = ItemSerializer(read_only=True)
     item_id = serializers.IntegerField(write_only=True)
-    modifiers = CartItemModifierSerializer(source='cartitemmodifier_set', many=True, read_only=True)
+    modifiers = CartItemModifierSerializer(many=True, read_only=True)
     special_instructions = serializers.CharField(required=False, allow_blank=True)
     
     class Meta:
         model = CartItem
-        fields = ['id', 'item', 'item_id', 'quantity', 'special_instructions', 'modifiers', 'total_price']
-        read_only_fields = ['total_price']
+        fields = ['id', 'item', 'item_id', 'quantity', 'special_instructions', 'modifiers',
+                  'unit_price', 'modifiers_total', 'total_price']
+        read_only_fields = ['unit_price', 'modifiers_total', 'total_price']
 
     def create(self, validated_data):
         return CartItem.objects.create(**validated_data)
@@ -97,6 +100,29 @@ class CartItemUpdateSerializer(serializers.ModelSerializer):
         fields = ['quantity', 'special_instructions']
 
 
+class CartOperationSerializer(serializers.Serializer):
+    """One add, update or remove step of a batch cart mutation"""
+    op = serializers.ChoiceField(choices=['add', 'update', 'remove'])
+    item_id = serializers.IntegerField(required=False)
+    line_id = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    special_instructions = serializers.CharField(required=False, allow_blank=True)
+    modifiers = CartItemModifierSerializer(many=True, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add' and 'item_id' not in attrs:
+            raise serializers.ValidationError({'item_id': 'This field is required to add a line.'})
+        if attrs['op'] != 'add' and 'line_id' not in attrs:
+            raise serializers.ValidationError({'line_id': f"This field is required to {attrs['op']} a line."})
+        if attrs['op'] == 'update' and 'quantity' not in attrs and 'special_instructions' not in attrs:
+            raise serializers.ValidationError('Nothing to update.')
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .menu_cache import invalidate_menu, menu_scope
+from .models import Cart, CartItem, CartItemModifier, Category, Item, ModifierGroup, ModifierOption
+
+MENU_MODELS = (Category, Item, ModifierGroup, ModifierOption)
+
+
+def menu_changed(sender, **kwargs):
+    # Resolve the scope now, while the writer's tenant is still active
+    scope = menu_scope()
+    transaction.on_commit(lambda: invalidate_menu(scope))
+
+
+for model in MENU_MODELS:
+    post_save.connect(menu_changed, sender=model, dispatch_uid=f'menu_changed_save_{model.__name__}')
+    post_delete.connect(menu_changed, sender=model, dispatch_uid=f'menu_changed_delete_{model.__name__}')
+
+
+# Cart totals are denormalised onto the rows; keep them in step with the
+# lines and modifiers (queryset deletes included, bulk_create excluded)
+
+def cart_item_changed(sender, instance, **kwargs):
+    Cart.refresh_totals(instance.cart_id)
+
+
+def cart_item_modifier_changed(sender, instance, **kwargs):
+    CartItem.refresh_totals(instance.cart_item_id)
+    cart_id = CartItem.objects.filter(pk=instance.cart_item_id).values_list('cart_id', flat=True).first()
+    if cart_id is not None:
+        Cart.refresh_totals(cart_id)
+
+
+post_save.connect(cart_item_changed, sender=CartItem, dispatch_uid='cart_item_saved')
+post_delete.connect(cart_item_changed, sender=CartItem, dispatch_uid='cart_item_deleted')
+post_save.connect(cart_item_modifier_changed, sender=CartItemModifier, dispatch_uid='cart_item_modifier_saved')
+post_delete.connect(cart_item_modifier_changed, sender=CartItemModifier, dispatch_uid='cart_item_modifier_deleted')
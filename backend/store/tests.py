@@ -1,11 +1,24 @@
+import json
+from unittest import mock
 from decimal import Decimal
 from datetime import datetime, timedelta
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from rest_framework.test import APIRequestFactory
 from django.contrib.auth import get_user_model
 from customers.models import Client, Domain, Customer, Membership
 from orders.models import Order
 from store.models import Category, Item, ModifierGroup, ModifierOption, Cart, CartItem, CartItemModifier, Table
+from orders.views import PublicOrderCreateView
+from store.cart_purge import purge_carts
+from store.cart_store import CartLineNotFound, DatabaseCartStore, InMemoryCartStore, get_cart_store
+from store.menu_cache import invalidate_menu
+from store.modifiers import load_item_modifiers
+from store.pricing import PriceTable, UnknownPrice, get_price_table, price_lines
+from store.views import CartViewSet, MenuViewSet
 
 User = get_user_model()
 
@@ -885,6 +898,7 @@ class StoreWorkflowTests(TestCase):
         
         # Expected total: (2 * 200) + (1 * 200) = 600
         expected_total = Decimal('600.00')
+        self.cart.refresh_from_db()
         self.assertEqual(self.cart.total_amount, expected_total)
     
     def test_cart_total_items_count(self):
@@ -903,6 +917,7 @@ class StoreWorkflowTests(TestCase):
         
         # Expected total items: 2 + 3 = 5
         expected_total_items = 5
+        self.cart.refresh_from_db()
         self.assertEqual(self.cart.total_items, expected_total_items)
     
     def test_cart_with_modifiers_total(self):
@@ -924,10 +939,11 @@ class StoreWorkflowTests(TestCase):
         # Expected total: 200 (item) + 50 (modifier) = 250
         expected_total = Decimal('250.00')
         
-        # Note: Cart.total_amount doesn't include modifiers by default
-        # This test documents the current behavior
-        self.assertEqual(self.cart.total_amount, Decimal('200.00'))
-        self.assertEqual(cart_item.total_price, Decimal('200.00'))
+        # Totals are stored on the rows and include modifier adjustments
+        self.cart.refresh_from_db()
+        cart_item.refresh_from_db()
+        self.assertEqual(self.cart.total_amount, expected_total)
+        self.assertEqual(cart_item.total_price, expected_total)
     
     def test_item_availability_affects_cart(self):
         """Test that item availability affects cart creation"""
@@ -1044,4 +1060,761 @@ class MultiTenantStoreTests(TestCase):
         self.assertEqual(order.table, table)
         
         # Check that table has the order
-        self.assertIn(order, table.orders.all())
\ No newline at end of file
+        self.assertIn(order, table.orders.all())
+
+
+class MenuSnapshotTests(TestCase):
+    """Test cases for the cached menu document served by MenuViewSet"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.view = MenuViewSet.as_view({'get': 'list'})
+
+        self.category = Category.objects.create(name='Pizzas', slug='pizzas')
+        for name in ['Margherita', 'Pepperoni']:
+            item = Item.objects.create(category=self.category, name=name, price=Decimal('250.00'))
+            group = ModifierGroup.objects.create(item=item, name='Size')
+            ModifierOption.objects.create(group=group, name='Large', price_adjustment=Decimal('50.00'))
+        Item.objects.create(
+            category=self.category, name='Hidden', price=Decimal('10.00'), is_available=False
+        )
+
+    def test_menu_document(self):
+        """Test the rendered menu skips unavailable items and nests modifiers"""
+        response = self.view(self.factory.get('/api/menu/'))
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.content)
+        self.assertEqual(len(data), 1)
+        self.assertEqual([item['name'] for item in data[0]['items']], ['Margherita', 'Pepperoni'])
+        self.assertEqual(data[0]['items'][0]['modifier_groups'][0]['options'][0]['name'], 'Large')
+
+    def test_menu_build_query_count_is_fixed(self):
+        """Test building the document doesn't query per category or item"""
+        with self.assertNumQueries(4):
+            self.view(self.factory.get('/api/menu/'))
+
+    def test_menu_served_from_cache(self):
+        """Test a warm menu read doesn't touch the database"""
+        first = self.view(self.factory.get('/api/menu/'))
+        with self.assertNumQueries(0):
+            second = self.view(self.factory.get('/api/menu/'))
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_menu_not_modified(self):
+        """Test If-None-Match with the current ETag returns 304"""
+        etag = self.view(self.factory.get('/api/menu/'))['ETag']
+        response = self.view(self.factory.get('/api/menu/', HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_menu_rebuilt_after_change(self):
+        """Test saving a menu model publishes a new document"""
+        etag = self.view(self.factory.get('/api/menu/'))['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ModifierOption.objects.filter(name='Large').first().delete()
+
+        response = self.view(self.factory.get('/api/menu/', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)[0]['items'][0]['modifier_groups'][0]['options'], [])
+
+
+class CartStoreContract:
+    """Behaviour every cart store must share; mixed into a TestCase per backend"""
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+        category = Category.objects.create(name='Drinks', slug='drinks')
+        self.item = Item.objects.create(category=category, name='Tea', price=Decimal('40.00'))
+        group = ModifierGroup.objects.create(item=self.item, name='Extras')
+        self.option = ModifierOption.objects.create(group=group, name='Pearls', price_adjustment=Decimal('10.00'))
+
+    def test_missing_cart(self):
+        """Test an unknown session has no cart until one is created"""
+        self.assertIsNone(self.store.get('nobody'))
+        self.assertEqual(self.store.get_or_create('nobody').lines, [])
+
+    def test_add_update_remove(self):
+        """Test lines round-trip through the store"""
+        line = self.store.add_line('s1', self.item.pk, quantity=2, special_instructions='Less ice',
+                                   modifiers=[(self.option.pk, 1)])
+        self.store.add_line('s1', self.item.pk)
+
+        cart = self.store.get('s1')
+        self.assertEqual(len(cart.lines), 2)
+        stored = cart.get_line(line.id)
+        self.assertEqual((stored.item_id, stored.quantity), (self.item.pk, 2))
+        self.assertEqual(stored.special_instructions, 'Less ice')
+        self.assertEqual(stored.modifiers, [(self.option.pk, 1)])
+
+        updated = self.store.update_line('s1', line.id, quantity=5)
+        self.assertEqual(updated.quantity, 5)
+        self.assertEqual(self.store.get('s1').get_line(line.id).quantity, 5)
+
+        self.assertTrue(self.store.remove_line('s1', line.id))
+        self.assertFalse(self.store.remove_line('s1', line.id))
+        self.assertIsNone(self.store.update_line('s1', line.id, quantity=1))
+        self.assertEqual(len(self.store.get('s1').lines), 1)
+
+    def test_totals_include_modifiers(self):
+        """Test line and cart totals add the modifier snapshot once per line"""
+        self.store.add_line('s1', self.item.pk, quantity=2, modifiers=[(self.option.pk, 2)])
+        self.store.add_line('s1', self.item.pk)
+
+        cart = self.store.get('s1')
+        self.assertEqual(cart.lines[0].line_total, Decimal('100.00'))
+        self.assertEqual(cart.subtotal, Decimal('140.00'))
+        self.assertEqual(cart.item_count, 3)
+
+    def test_prices_are_snapshots(self):
+        """Test later menu price changes don't reprice existing lines"""
+        self.store.add_line('s1', self.item.pk, modifiers=[(self.option.pk, 1)])
+        Item.objects.filter(pk=self.item.pk).update(price=Decimal('99.00'))
+        ModifierOption.objects.filter(pk=self.option.pk).update(price_adjustment=Decimal('99.00'))
+
+        self.assertEqual(self.store.get('s1').subtotal, Decimal('50.00'))
+
+    def test_apply_batch(self):
+        """Test a batch of operations is applied in order"""
+        keep = self.store.add_line('s1', self.item.pk)
+        drop = self.store.add_line('s1', self.item.pk)
+
+        cart = self.store.apply('s1', [
+            {'op': 'add', 'item_id': self.item.pk, 'quantity': 2, 'modifiers': [(self.option.pk, 1)]},
+            {'op': 'update', 'line_id': keep.id, 'quantity': 4},
+            {'op': 'update', 'line_id': drop.id, 'quantity': 9},
+            {'op': 'remove', 'line_id': drop.id},
+        ])
+
+        self.assertEqual([line.quantity for line in cart.lines], [4, 2])
+        self.assertEqual(cart.lines[1].modifiers, [(self.option.pk, 1)])
+        self.assertEqual(cart.subtotal, Decimal('250.00'))
+        self.assertEqual(self.store.get('s1').subtotal, Decimal('250.00'))
+
+    def test_apply_is_all_or_nothing(self):
+        """Test a batch naming an unknown line changes nothing"""
+        line = self.store.add_line('s1', self.item.pk)
+
+        with self.assertRaises(CartLineNotFound):
+            self.store.apply('s1', [
+                {'op': 'update', 'line_id': line.id, 'quantity': 5},
+                {'op': 'add', 'item_id': self.item.pk},
+                {'op': 'remove', 'line_id': 999999},
+            ])
+
+        cart = self.store.get('s1')
+        self.assertEqual([(line.id, line.quantity) for line in cart.lines], [(line.id, 1)])
+
+    def test_sessions_are_isolated(self):
+        """Test a line can only be changed through its own session"""
+        line = self.store.add_line('s1', self.item.pk)
+
+        self.assertFalse(self.store.remove_line('s2', line.id))
+        self.assertIsNone(self.store.get('s2'))
+
+    def test_close(self):
+        """Test a closed cart is gone and the session starts over empty"""
+        self.store.add_line('s1', self.item.pk)
+        self.store.close('s1')
+
+        self.assertIsNone(self.store.get('s1'))
+        self.assertEqual(self.store.get_or_create('s1').lines, [])
+
+
+class DatabaseCartStoreTests(CartStoreContract, TestCase):
+    """Test cases for the ORM cart store"""
+
+    def make_store(self):
+        return DatabaseCartStore()
+
+    def test_cart_row_totals_match_lines(self):
+        """Test the denormalised Cart columns track store writes"""
+        line = self.store.add_line('s1', self.item.pk, quantity=2, modifiers=[(self.option.pk, 1)])
+        self.store.update_line('s1', line.id, quantity=3)
+
+        cart = Cart.objects.get(session_id='s1')
+        self.assertEqual((cart.subtotal, cart.item_count), (Decimal('130.00'), 3))
+
+        self.store.remove_line('s1', line.id)
+        cart.refresh_from_db()
+        self.assertEqual((cart.subtotal, cart.item_count), (Decimal('0.00'), 0))
+
+
+class CartTotalsTests(TestCase):
+    """Test cases for the denormalised cart, line and modifier prices"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Pizzas', slug='pizzas')
+        self.item = Item.objects.create(category=category, name='Margherita', price=Decimal('200.00'))
+        group = ModifierGroup.objects.create(item=self.item, name='Extras', max_selection=2)
+        self.cheese = ModifierOption.objects.create(group=group, name='Cheese', price_adjustment=Decimal('30.00'))
+        self.cart = Cart.objects.create(session_id='totals')
+
+    def _reload(self):
+        return Cart.objects.get(pk=self.cart.pk)
+
+    def test_line_changes_update_cart(self):
+        """Test adding, changing and removing lines keeps the cart totals current"""
+        line = CartItem.objects.create(cart=self.cart, item=self.item, quantity=2)
+        self.assertEqual(line.unit_price, Decimal('200.00'))
+        self.assertEqual((self._reload().total_amount, self._reload().total_items), (Decimal('400.00'), 2))
+
+        line.quantity = 3
+        line.save()
+        self.assertEqual(self._reload().total_amount, Decimal('600.00'))
+
+        line.delete()
+        self.assertEqual((self._reload().total_amount, self._reload().total_items), (Decimal('0.00'), 0))
+
+    def test_modifier_changes_update_line_and_cart(self):
+        """Test modifier adjustments are included in line and cart totals"""
+        line = CartItem.objects.create(cart=self.cart, item=self.item, quantity=2)
+        modifier = CartItemModifier.objects.create(cart_item=line, modifier_option=self.cheese, quantity=2)
+
+        line.refresh_from_db()
+        self.assertEqual(line.modifiers_total, Decimal('60.00'))
+        self.assertEqual(line.total_price, Decimal('460.00'))
+        self.assertEqual(self._reload().total_amount, Decimal('460.00'))
+
+        modifier.delete()
+        self.assertEqual(self._reload().total_amount, Decimal('400.00'))
+
+    def test_reading_totals_is_one_query(self):
+        """Test cart totals come from the cart row alone"""
+        for _ in range(5):
+            CartItem.objects.create(cart=self.cart, item=self.item)
+
+        with self.assertNumQueries(1):
+            cart = self._reload()
+            self.assertEqual((cart.total_amount, cart.total_items), (Decimal('1000.00'), 5))
+
+
+class InMemoryCartStoreTests(CartStoreContract, TestCase):
+    """Test cases for the hash-layout cart store"""
+
+    def make_store(self):
+        return InMemoryCartStore(TTL=60)
+
+    def test_writes_refresh_ttl(self):
+        """Test every write (re)sets the cart key's expiry"""
+        self.store.add_line('s1', self.item.pk)
+
+        self.assertEqual(self.store.client.ttl(self.store.key('s1')), 60)
+
+    def test_expired_cart_is_gone(self):
+        """Test an abandoned cart disappears once its TTL passes"""
+        self.store.add_line('s1', self.item.pk)
+        self.store.client.expire(self.store.key('s1'), 0)
+
+        self.assertIsNone(self.store.get('s1'))
+
+    def _interleave(self, write):
+        """Run `write` once between the store's next read and its EXEC"""
+        encode = self.store._encode
+
+        def racing_encode(line):
+            if not calls:
+                calls.append(line)
+                write()
+            return encode(line)
+
+        calls = []
+        return mock.patch.object(self.store, '_encode', side_effect=racing_encode)
+
+    def test_concurrent_updates_are_not_lost(self):
+        """Test a write that lost the race is redone on the other's result"""
+        line = self.store.add_line('s1', self.item.pk)
+
+        with self._interleave(lambda: self.store.update_line('s1', line.id, special_instructions='No ice')):
+            self.store.update_line('s1', line.id, quantity=3)
+
+        stored = self.store.get('s1').get_line(line.id)
+        self.assertEqual((stored.quantity, stored.special_instructions), (3, 'No ice'))
+
+    def test_concurrent_adds_get_distinct_lines(self):
+        """Test two adds racing each other both land, numbered one after the other"""
+        with self._interleave(lambda: self.store.add_line('s1', self.item.pk, special_instructions='No ice')):
+            line = self.store.add_line('s1', self.item.pk, quantity=3)
+
+        cart = self.store.get('s1')
+        self.assertEqual([stored.id for stored in cart.lines], [1, 2])
+        self.assertEqual(cart.get_line(line.id).quantity, 3)
+        self.assertEqual(self.store.client.ttl(self.store.key('s1')), 60)
+
+    def test_write_racing_close_does_not_reopen_cart(self):
+        """Test an update or removal racing checkout doesn't bring the cart back"""
+        line = self.store.add_line('s1', self.item.pk)
+
+        with self._interleave(lambda: self.store.close('s1')):
+            self.assertIsNone(self.store.update_line('s1', line.id, quantity=3))
+        self.assertIsNone(self.store.get('s1'))
+
+
+    def test_update_racing_removal_does_not_resurrect_line(self):
+        """Test a batch updating a line removed meanwhile fails instead of re-adding it"""
+        line = self.store.add_line('s1', self.item.pk)
+        other = self.store.add_line('s1', self.item.pk)
+
+        with self._interleave(lambda: self.store.remove_line('s1', line.id)):
+            with self.assertRaises(CartLineNotFound):
+                self.store.apply('s1', [{'op': 'update', 'line_id': line.id, 'quantity': 2}])
+
+        self.assertEqual([stored.id for stored in self.store.get('s1').lines], [other.id])
+
+
+@override_settings(CART_STORE={'BACKEND': 'store.cart_store.InMemoryCartStore'})
+class CartViewSetTests(TestCase):
+    """Test cases for carts kept outside the database until checkout"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        category = Category.objects.create(name='Drinks', slug='drinks')
+        self.item = Item.objects.create(category=category, name='Tea', price=Decimal('40.00'))
+        group = ModifierGroup.objects.create(item=self.item, name='Extras')
+        self.option = ModifierOption.objects.create(group=group, name='Pearls', price_adjustment=Decimal('10.00'))
+        self.headers = {'HTTP_X_SESSION_ID': 'sess-1'}
+
+    def _add(self, **data):
+        view = CartViewSet.as_view({'post': 'add_item'})
+        request = self.factory.post('/api/cart/items/', {'item_id': self.item.pk, **data}, format='json',
+                                    **self.headers)
+        return view(request)
+
+    def test_cart_lifecycle_without_cart_rows(self):
+        """Test add, update, list and delete never write Cart rows"""
+        response = self._add(quantity=2, modifiers=[{'modifier_option_id': self.option.pk}])
+        self.assertEqual(response.status_code, 201)
+        line_id = response.data['id']
+        self.assertEqual(response.data['modifiers'][0]['modifier_option']['name'], 'Pearls')
+
+        update = CartViewSet.as_view({'put': 'update_item'})
+        response = update(self.factory.put('/', {'quantity': 3}, format='json', **self.headers),
+                          pk='current', item_id=line_id)
+        self.assertEqual(response.data['quantity'], 3)
+
+        response = CartViewSet.as_view({'get': 'list'})(self.factory.get('/api/cart/', **self.headers))
+        self.assertEqual(response.data['total_items'], 3)
+        # 3 x 40.00 plus one 10.00 modifier
+        self.assertEqual(response.data['total_amount'], '130.00')
+
+        delete = CartViewSet.as_view({'delete': 'delete_item'})
+        response = delete(self.factory.delete('/', **self.headers), pk='current', item_id=line_id)
+        self.assertEqual(response.status_code, 204)
+        response = delete(self.factory.delete('/', **self.headers), pk='current', item_id=line_id)
+        self.assertEqual(response.status_code, 404)
+
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_unavailable_item(self):
+        """Test unavailable items can't be added"""
+        Item.objects.filter(pk=self.item.pk).update(is_available=False)
+
+        self.assertEqual(self._add().status_code, 404)
+
+    def test_checkout_materialises_order_and_closes_cart(self):
+        """Test the cart only reaches the database as an order"""
+        self._add(quantity=2)
+        view = PublicOrderCreateView.as_view()
+        response = view(self.factory.post('/api/orders/', {'customer_name': 'Ann'}, format='json', **self.headers))
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, Decimal('80.00'))
+        self.assertEqual(order.items.get().quantity, 2)
+        self.assertIsNone(get_cart_store().get('sess-1'))
+        self.assertFalse(Cart.objects.exists())
+
+
+class CartBatchTests(TestCase):
+    """Test cases for the batch cart mutation endpoint"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = CartViewSet.as_view({'post': 'batch'})
+        category = Category.objects.create(name='Drinks', slug='drinks')
+        self.items = [
+            Item.objects.create(category=category, name=f'Drink {i}', price=Decimal('40.00')) for i in range(5)
+        ]
+        self.options = {}
+        for item in self.items:
+            group = ModifierGroup.objects.create(item=item, name='Extras')
+            self.options[item.pk] = ModifierOption.objects.create(
+                group=group, name='Pearls', price_adjustment=Decimal('10.00')
+            )
+        cache.clear()
+
+    def _batch(self, operations):
+        request = self.factory.post('/api/cart/batch/', {'operations': operations}, format='json',
+                                    HTTP_X_SESSION_ID='batch-1')
+        return self.view(request)
+
+    def _adds(self, items):
+        return [
+            {'op': 'add', 'item_id': item.pk, 'modifiers': [{'modifier_option_id': self.options[item.pk].pk}]}
+            for item in items
+        ]
+
+    def test_batch_returns_cart(self):
+        """Test the response is the resulting cart"""
+        response = self._batch(self._adds(self.items[:2]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_items'], 2)
+        self.assertEqual(response.data['total_amount'], '100.00')
+
+        line_id = response.data['items'][0]['id']
+        response = self._batch([{'op': 'remove', 'line_id': line_id}])
+        self.assertEqual(response.data['total_items'], 1)
+
+    def test_unknown_references_reject_whole_batch(self):
+        """Test unknown items or options fail validation before anything is written"""
+        response = self._batch(self._adds(self.items[:1]) + [{'op': 'add', 'item_id': 999999}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('item_ids', response.data)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_invalid_modifiers_reject_whole_batch(self):
+        """Test an option belonging to another item fails the batch"""
+        operations = self._adds(self.items[:1])
+        operations[0]['modifiers'].append({'modifier_option_id': self.options[self.items[1].pk].pk})
+        response = self._batch(operations)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(0, response.data['modifiers'])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_batch_etag_matches_list(self):
+        """Test the ETag of a batch response revalidates the cart listing"""
+        etag = self._batch(self._adds(self.items[:1]))['ETag']
+        request = self.factory.get('/api/cart/', HTTP_X_SESSION_ID='batch-1', HTTP_IF_NONE_MATCH=etag)
+        response = CartViewSet.as_view({'get': 'list'})(request)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_unknown_line_is_404(self):
+        """Test a batch naming a line that isn't in the cart is rejected"""
+        response = self._batch(self._adds(self.items[:1]) + [{'op': 'remove', 'line_id': 999999}])
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_malformed_operation(self):
+        """Test operations missing their target are rejected"""
+        response = self._batch([{'op': 'update', 'quantity': 2}])
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_independent_of_batch_size(self):
+        """Test adding one line or five costs the same number of queries"""
+        self._batch(self._adds(self.items[:1]))
+        with CaptureQueriesContext(connection) as one:
+            self._batch(self._adds(self.items[:1]))
+        with CaptureQueriesContext(connection) as five:
+            self._batch(self._adds(self.items))
+
+        self.assertEqual(len(one), len(five))
+
+
+@override_settings(CART_STORE={'BACKEND': 'store.cart_store.InMemoryCartStore'})
+class CartModifierValidationTests(TestCase):
+    """Test cases for modifier rules enforced when adding to the cart"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        category = Category.objects.create(name='Drinks', slug='drinks')
+        self.item = Item.objects.create(category=category, name='Tea', price=Decimal('40.00'))
+        sweetness = ModifierGroup.objects.create(item=self.item, name='Sweetness', min_selection=1, max_selection=1)
+        self.sweet = ModifierOption.objects.create(group=sweetness, name='Sweet')
+        self.less_sweet = ModifierOption.objects.create(group=sweetness, name='Less sweet')
+        toppings = ModifierGroup.objects.create(item=self.item, name='Toppings', min_selection=0, max_selection=3)
+        self.toppings = [
+            ModifierOption.objects.create(group=toppings, name=name, price_adjustment=Decimal('10.00'))
+            for name in ['Pearls', 'Jelly', 'Pudding']
+        ]
+        self.sold_out = ModifierOption.objects.create(
+            group=toppings, name='Cheese foam', price_adjustment=Decimal('15.00'), is_available=False
+        )
+        other = Item.objects.create(category=category, name='Coffee', price=Decimal('50.00'))
+        other_group = ModifierGroup.objects.create(item=other, name='Shots')
+        self.other_option = ModifierOption.objects.create(group=other_group, name='Extra shot')
+        cache.clear()
+
+    def _add(self, options):
+        view = CartViewSet.as_view({'post': 'add_item'})
+        data = {'item_id': self.item.pk, 'modifiers': [{'modifier_option_id': option.pk} for option in options]}
+        return view(self.factory.post('/api/cart/items/', data, format='json', HTTP_X_SESSION_ID='mods-1'))
+
+    def test_valid_selection_is_priced(self):
+        """Test a valid selection is added with its modifier prices"""
+        response = self._add([self.sweet] + self.toppings[:2])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['modifiers']), 3)
+        self.assertEqual(response.data['total_price'], Decimal('60.00'))
+
+    def test_option_of_another_item(self):
+        """Test options from another item's groups are rejected"""
+        response = self._add([self.sweet, self.other_option])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not valid for this item', response.data['modifiers'][0])
+
+    def test_min_and_max_selection(self):
+        """Test group selection limits are enforced"""
+        self.assertEqual(self._add(self.toppings[:1]).status_code, 400)
+        response = self._add([self.sweet, self.less_sweet])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['modifiers'], ['Choose at most 1 option(s) for "Sweetness".'])
+
+    def test_unavailable_option(self):
+        """Test unavailable options are rejected"""
+        response = self._add([self.sweet, self.sold_out])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not available', response.data['modifiers'][0])
+
+    def test_duplicate_option(self):
+        """Test the same option can't be chosen twice"""
+        response = self._add([self.sweet, self.toppings[0], self.toppings[0]])
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_independent_of_modifier_count(self):
+        """Test adding one modifier or four costs the same number of queries"""
+        self._add([self.sweet])
+        with CaptureQueriesContext(connection) as one:
+            self._add([self.sweet])
+        with CaptureQueriesContext(connection) as four:
+            self._add([self.sweet] + self.toppings)
+
+        self.assertEqual(len(one), len(four))
+
+    def test_rules_read_from_menu_index(self):
+        """Test a warm menu index validates without touching modifier tables"""
+        self._add([self.sweet])
+        with CaptureQueriesContext(connection) as queries:
+            load_item_modifiers([self.item.pk])
+
+        self.assertEqual(len(queries), 0)
+
+
+class CartPurgeTests(TestCase):
+    """Test cases for purging checked-out and abandoned carts"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Drinks', slug='drinks')
+        self.item = Item.objects.create(category=category, name='Tea', price=Decimal('40.00'))
+        group = ModifierGroup.objects.create(item=self.item, name='Extras')
+        self.option = ModifierOption.objects.create(group=group, name='Pearls', price_adjustment=Decimal('10.00'))
+
+    def _cart(self, session_id, days_old, is_active=True):
+        cart = Cart.objects.create(session_id=session_id, is_active=is_active)
+        line = CartItem.objects.create(cart=cart, item=self.item)
+        CartItemModifier.objects.create(cart_item=line, modifier_option=self.option)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=days_old))
+        return cart
+
+    def test_purges_by_age_and_state(self):
+        """Test old checked-out and abandoned carts go, recent ones stay"""
+        self._cart('checked-out-old', 10, is_active=False)
+        self._cart('abandoned', 40)
+        self._cart('checked-out-recent', 1, is_active=False)
+        self._cart('in-use', 10)
+
+        totals = purge_carts(timedelta(days=7), timedelta(days=30))
+
+        self.assertEqual(totals, (2, 2, 2))
+        self.assertEqual(
+            sorted(Cart.objects.values_list('session_id', flat=True)), ['checked-out-recent', 'in-use']
+        )
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(CartItemModifier.objects.count(), 2)
+
+    def test_batches_and_progress(self):
+        """Test purging runs in bounded batches reporting running totals"""
+        for i in range(5):
+            self._cart(f'old-{i}', 40)
+        reports = []
+
+        purge_carts(timedelta(days=7), timedelta(days=30), batch_size=2,
+                    progress=lambda *totals: reports.append(totals))
+
+        self.assertEqual([report[0] for report in reports], [2, 4, 5])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_max_batches(self):
+        """Test a run can be capped at a number of batches"""
+        for i in range(5):
+            self._cart(f'old-{i}', 40)
+
+        totals = purge_carts(timedelta(days=7), timedelta(days=30), batch_size=2, max_batches=1)
+
+        self.assertEqual(totals[0], 2)
+        self.assertEqual(Cart.objects.count(), 3)
+
+
+class PricingTests(TestCase):
+    """Test cases for the shared price tables"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Drinks', slug='drinks')
+        self.tea = Item.objects.create(category=category, name='Tea', price=Decimal('40.00'))
+        self.coffee = Item.objects.create(category=category, name='Coffee', price=Decimal('55.00'))
+        group = ModifierGroup.objects.create(item=self.tea, name='Extras')
+        self.pearls = ModifierOption.objects.create(group=group, name='Pearls', price_adjustment=Decimal('10.00'))
+        self.jelly = ModifierOption.objects.create(group=group, name='Jelly', price_adjustment=Decimal('5.00'))
+
+    def test_price_lines(self):
+        """Test a cart is priced in one pass with modifiers counted once per line"""
+        priced = price_lines([
+            (self.tea.pk, 3, [(self.pearls.pk, 1), (self.jelly.pk, 2)]),
+            (self.coffee.pk, 1, []),
+        ])
+
+        self.assertEqual(priced.lines[0], (Decimal('40.00'), Decimal('20.00'), Decimal('140.00')))
+        self.assertEqual(priced.lines[1], (Decimal('55.00'), Decimal('0.00'), Decimal('55.00')))
+        self.assertEqual(priced.subtotal, Decimal('195.00'))
+        self.assertEqual(priced.item_count, 4)
+
+    def test_table_cached_per_menu_version(self):
+        """Test a warm table prices without queries and a menu change rebuilds it"""
+        get_price_table()
+        with self.assertNumQueries(0):
+            price_lines([(self.tea.pk, 1, [(self.pearls.pk, 1)])])
+
+        Item.objects.filter(pk=self.tea.pk).update(price=Decimal('45.00'))
+        invalidate_menu()
+        self.assertEqual(price_lines([(self.tea.pk, 1, [])]).subtotal, Decimal('45.00'))
+
+    def test_new_rows_are_loaded_into_table(self):
+        """Test ids created since the table was built are loaded on their own"""
+        get_price_table()
+        latte = Item.objects.create(category=self.tea.category, name='Latte', price=Decimal('65.00'))
+
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(price_lines([(latte.pk, 2, [])]).subtotal, Decimal('130.00'))
+        self.assertEqual(len(captured), 1)
+        self.assertIn('IN', captured[0]['sql'])
+        self.assertEqual(get_price_table().item_price(self.tea.pk), Decimal('40.00'))
+
+    def test_missing_ids_are_remembered(self):
+        """Test an id that doesn't exist is looked up once per menu version"""
+        with self.assertRaises(UnknownPrice):
+            price_lines([(999999, 1, [])])
+        with self.assertNumQueries(0):
+            with self.assertRaises(UnknownPrice):
+                price_lines([(999999, 1, [])])
+
+        invalidate_menu()
+        with CaptureQueriesContext(connection) as captured:
+            with self.assertRaises(UnknownPrice):
+                price_lines([(999999, 1, [])])
+        self.assertTrue(captured)
+
+    def test_unknown_id(self):
+        """Test pricing an id that doesn't exist fails loudly"""
+        with self.assertRaises(UnknownPrice):
+            PriceTable({}, {}).item_price(self.tea.pk)
+
+    def test_cart_and_order_totals_agree(self):
+        """Test the cart subtotal, order total and order line totals match"""
+        store = DatabaseCartStore()
+        store.add_line('agree-1', self.tea.pk, quantity=2, modifiers=[(self.pearls.pk, 1)])
+        store.add_line('agree-1', self.coffee.pk)
+        cart = Cart.objects.get(session_id='agree-1')
+
+        view = PublicOrderCreateView.as_view()
+        response = view(APIRequestFactory().post('/api/orders/', {'customer_name': 'Ann'}, format='json',
+                                                 HTTP_X_SESSION_ID='agree-1'))
+
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(cart.subtotal, Decimal('145.00'))
+        self.assertEqual(order.total_amount, cart.subtotal)
+        self.assertEqual(sum(line.total_price for line in order.items.all()), order.total_amount)
+
+
+class CartVersionTests(TestCase):
+    """Test cases for cart ETags and the slim cart representation"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        category = Category.objects.create(name='Drinks', slug='drinks')
+        self.item = Item.objects.create(category=category, name='Tea', price=Decimal('40.00'))
+        group = ModifierGroup.objects.create(item=self.item, name='Extras')
+        self.option = ModifierOption.objects.create(group=group, name='Pearls', price_adjustment=Decimal('10.00'))
+
+    def _list(self, etag=None, **params):
+        headers = {'HTTP_X_SESSION_ID': 'poll-1'}
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return CartViewSet.as_view({'get': 'list'})(self.factory.get('/api/cart/', params, **headers))
+
+    def _add(self):
+        view = CartViewSet.as_view({'post': 'add_item'})
+        return view(self.factory.post(
+            '/api/cart/items/', {'item_id': self.item.pk, 'modifiers': [{'modifier_option_id': self.option.pk}]},
+            format='json', HTTP_X_SESSION_ID='poll-1'
+        ))
+
+    def test_unchanged_cart_is_not_modified(self):
+        """Test polling with the ETag answers 304 without touching the database"""
+        etag = self._list()['ETag']
+        with self.assertNumQueries(0):
+            response = self._list(etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_mutation_changes_etag(self):
+        """Test adding a line gives the cart a new version"""
+        etag = self._list()['ETag']
+        self._add()
+        response = self._list(etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['total_items'], 1)
+
+    def test_menu_change_changes_full_etag(self):
+        """Test the full cart, which embeds item data, goes stale with the menu"""
+        self._add()
+        etag, slim_etag = self._list()['ETag'], self._list(slim='true')['ETag']
+        invalidate_menu()
+
+        self.assertEqual(self._list(etag).status_code, 200)
+        self.assertEqual(self._list(slim_etag, slim='true').status_code, 304)
+
+    def test_list_does_not_create_cart(self):
+        """Test reading a session without a cart writes nothing"""
+        response = self._list()
+
+        self.assertEqual(response.data['items'], [])
+        self.assertFalse(Cart.objects.exists())
+
+    @override_settings(CART_STORE={'BACKEND': 'store.cart_store.InMemoryCartStore'})
+    def test_slim_representation(self):
+        """Test the slim cart references menu ids and runs no queries"""
+        self._add()
+        with self.assertNumQueries(0):
+            response = self._list(slim='true')
+
+        line = response.data['items'][0]
+        self.assertEqual(line['item_id'], self.item.pk)
+        self.assertEqual(line['modifiers'], [{'modifier_option_id': self.option.pk, 'quantity': 1}])
+        self.assertNotIn('item', line)
+        self.assertEqual(response.data['total_amount'], '50.00')
+        self.assertNotEqual(response['ETag'], self._list()['ETag'])
@@ -2,17 +2,29 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.shortcuts import get_object_or_404
-from .models import Category, Item, Cart, CartItem
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from .cart_store import (
+    CartLineNotFound, CartState, bump_cart_version, get_cart_store, get_cart_version,
+    render_cart, render_line, render_slim_cart
+)
+from .menu_cache import get_menu_snapshot, get_menu_version, menu_queryset
+from .models import Category
+from .modifiers import ModifierSelectionError, load_item_modifiers
 from .serializers import (
     CategorySerializer, 
     TenantBrandingSerializer, 
-    CartSerializer, 
-    CartItemSerializer, 
+    CartBatchSerializer,
     CartItemCreateSerializer,
     CartItemUpdateSerializer
 )
 
+def cart_etag(session_id, slim=False):
+    """
+    The ETag of a session's cart: its version token, plus the menu version
+    for the full representation (it embeds item data)
+    """
+    return '"%s-%s"' % (get_cart_version(session_id), 'slim' if slim else get_menu_version())
+
 class TenantInfoView(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -22,117 +34,129 @@ class TenantInfoView(APIView):
         return Response(serializer.data)
 
 class MenuViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Category.objects.filter(is_active=True).prefetch_related('items__modifier_groups__options')
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
 
-class CartViewSet(viewsets.ModelViewSet):
-    queryset = Cart.objects.filter(is_active=True)
-    serializer_class = CartSerializer
+    def get_queryset(self):
+        return menu_queryset()
+
+    def list(self, request, *args, **kwargs):
+        """Serve the pre-rendered menu document (see store.menu_cache)"""
+        snapshot = get_menu_snapshot()
+        if snapshot.etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(snapshot.body, content_type='application/json')
+        response['ETag'] = snapshot.etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+class CartViewSet(viewsets.ViewSet):
+    """
+    Session carts, kept in the store configured by settings.CART_STORE
+    (see store.cart_store).
+    """
     permission_classes = [permissions.AllowAny]
 
-    def get_queryset(self):
-        session_id = self.request.headers.get('X-Session-ID') or self.request.GET.get('session_id')
-        if session_id:
-            return Cart.objects.filter(session_id=session_id, is_active=True)
-        return Cart.objects.none()
+    def get_session_id(self, request):
+        return (
+            request.headers.get('X-Session-ID')
+            or request.data.get('session_id')
+            or request.GET.get('session_id')
+        )
 
-    def get_cart_or_create(self, session_id):
-        cart, created = Cart.objects.get_or_create(
-            session_id=session_id,
-            defaults={'is_active': True}
+    def session_required(self):
+        return Response(
+            {'error': 'Session ID is required'}, 
+            status=status.HTTP_400_BAD_REQUEST
         )
-        return cart
 
     def list(self, request, *args, **kwargs):
-        session_id = request.headers.get('X-Session-ID') or request.GET.get('session_id')
+        """
+        The session's cart; `?slim=true` references menu ids instead of
+        embedding items. The ETag is the cart's version token, plus the menu
+        version for the full representation (it embeds item data), so
+        polling with If-None-Match answers 304 without reading the cart.
+        """
+        session_id = self.get_session_id(request)
         if not session_id:
-            return Response(
-                {'error': 'Session ID is required'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return self.session_required()
         
-        cart = self.get_cart_or_create(session_id)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        slim = request.GET.get('slim', '').lower() in ('1', 'true')
+        etag = cart_etag(session_id, slim)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            # Reading an empty cart doesn't create one
+            cart = get_cart_store().get(session_id) or CartState(session_id)
+            response = Response(render_slim_cart(cart) if slim else render_cart(cart))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
 
     def create(self, request, *args, **kwargs):
-        session_id = request.data.get('session_id') or request.headers.get('X-Session-ID')
+        session_id = self.get_session_id(request)
         if not session_id:
-            return Response(
-                {'error': 'Session ID is required'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return self.session_required()
         
-        cart = self.get_cart_or_create(session_id)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        cart = get_cart_store().get_or_create(session_id)
+        bump_cart_version(session_id)
+        return Response(render_cart(cart), status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['post'], url_path='items')
     def add_item(self, request):
-        session_id = request.headers.get('X-Session-ID') or request.data.get('session_id')
+        session_id = self.get_session_id(request)
         if not session_id:
-            return Response(
-                {'error': 'Session ID is required'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        cart = self.get_cart_or_create(session_id)
+            return self.session_required()
         
         serializer = CartItemCreateSerializer(data=request.data)
         if serializer.is_valid():
-            # Check if item exists and is available
-            try:
-                item = Item.objects.get(id=serializer.validated_data['item_id'], is_available=True)
-            except Item.DoesNotExist:
+            # Check if item exists and is available (from the menu index,
+            # see store.modifiers)
+            item_id = serializer.validated_data['item_id']
+            item = load_item_modifiers([item_id]).get(item_id)
+            if item is None:
                 return Response(
                     {'error': 'Item not found or not available'}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            cart_item = CartItem.objects.create(
-                cart=cart,
-                item=item,
+            # The modifiers must satisfy the item's group rules; the line is
+            # priced by the cart store from store.pricing
+            modifiers = [
+                (modifier['modifier_option_id'], modifier.get('quantity', 1))
+                for modifier in serializer.validated_data.get('modifiers', [])
+            ]
+            try:
+                item.validate(modifiers)
+            except ModifierSelectionError as e:
+                return Response({'modifiers': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+            
+            line = get_cart_store().add_line(
+                session_id,
+                item_id,
                 quantity=serializer.validated_data.get('quantity', 1),
-                special_instructions=serializer.validated_data.get('special_instructions', '')
+                special_instructions=serializer.validated_data.get('special_instructions', ''),
+                modifiers=modifiers
             )
-            
-            # Add modifiers if any
-            modifiers_data = serializer.validated_data.get('modifiers', [])
-            for modifier_data in modifiers_data:
-                from .models import CartItemModifier, ModifierOption
-                try:
-                    modifier_option = ModifierOption.objects.get(id=modifier_data['modifier_option_id'])
-                    CartItemModifier.objects.create(
-                        cart_item=cart_item,
-                        modifier_option=modifier_option,
-                        quantity=modifier_data.get('quantity', 1)
-                    )
-                except ModifierOption.DoesNotExist:
-                    continue  # Skip invalid modifiers
-            
-            response_serializer = CartItemSerializer(cart_item)
-            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+            bump_cart_version(session_id)
+            return Response(render_line(line), status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['put'], url_path='items/(?P<item_id>[^/.]+)/update')
     def update_item(self, request, pk=None, item_id=None):
-        session_id = request.headers.get('X-Session-ID') or request.data.get('session_id')
+        session_id = self.get_session_id(request)
         if not session_id:
-            return Response(
-                {'error': 'Session ID is required'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return self.session_required()
         
-        cart = get_object_or_404(Cart, session_id=session_id, is_active=True)
-        cart_item = get_object_or_404(CartItem, cart=cart, id=item_id)
-        
-        serializer = CartItemUpdateSerializer(cart_item, data=request.data, partial=True)
+        serializer = CartItemUpdateSerializer(data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
-            response_serializer = CartItemSerializer(cart_item)
-            return Response(response_serializer.data)
+            line = get_cart_store().update_line(session_id, item_id, **serializer.validated_data)
+            if line is None:
+                raise Http404
+            bump_cart_version(session_id)
+            return Response(render_line(line))
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -140,13 +164,65 @@ class CartViewSet(viewsets.ModelViewSet):
     def delete_item(self, request, pk=None, item_id=None):
         session_id = request.headers.get('X-Session-ID') or request.GET.get('session_id')
         if not session_id:
+            return self.session_required()
+        
+        if not get_cart_store().remove_line(session_id, item_id):
+            raise Http404
+        bump_cart_version(session_id)
+        
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Apply an ordered list of add/update/remove operations atomically
+        and return the resulting cart, e.g.
+        {"operations": [{"op": "add", "item_id": 1, "quantity": 2, "modifiers": [...]},
+                        {"op": "update", "line_id": 7, "quantity": 3},
+                        {"op": "remove", "line_id": 8}]}
+        """
+        session_id = self.get_session_id(request)
+        if not session_id:
+            return self.session_required()
+        
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        operations = serializer.validated_data['operations']
+        
+        # Validate every referenced item and its modifier rules up front,
+        # all items at once (see store.modifiers)
+        adds = [operation for operation in operations if operation['op'] == 'add']
+        item_ids = {operation['item_id'] for operation in adds}
+        items = load_item_modifiers(item_ids) if item_ids else {}
+        if item_ids - set(items):
             return Response(
-                {'error': 'Session ID is required'}, 
+                {'item_ids': f'Items not found or not available: {sorted(item_ids - set(items))}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        cart = get_object_or_404(Cart, session_id=session_id, is_active=True)
-        cart_item = get_object_or_404(CartItem, cart=cart, id=item_id)
-        cart_item.delete()
+        errors = {}
+        for index, operation in enumerate(operations):
+            if operation['op'] != 'add':
+                continue
+            item = items[operation['item_id']]
+            operation['modifiers'] = [
+                (modifier['modifier_option_id'], modifier.get('quantity', 1))
+                for modifier in operation.get('modifiers', [])
+            ]
+            try:
+                item.validate(operation['modifiers'])
+            except ModifierSelectionError as e:
+                errors[index] = e.errors
+        if errors:
+            return Response({'modifiers': errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            cart = get_cart_store().apply(session_id, operations)
+        except CartLineNotFound as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
         
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        bump_cart_version(session_id)
+        response = Response(render_cart(cart))
+        response['ETag'] = cart_etag(session_id)
+        return response